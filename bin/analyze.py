@@ -0,0 +1,98 @@
+"""
+Answer questions about a recording (database/recordings/*.txt) on all cpu cores.
+
+    python analyze.py ../database/recordings/recording_20150305_120000_utc.txt
+    python analyze.py recording.txt -r retries -r parents
+    python analyze.py recording.txt -r mymodule.MyReducer --json
+    python analyze.py recording.txt --history ctpf_buf_used
+
+Built-in reducers: retries, parents, buffers. Own reducers are given as module.Class; see system/analytics.py.
+"""
+
+import sys
+import os
+
+if sys.hexversion < 0x2060000:
+    print "python version >=2.6 required. you have", sys.version
+    sys.exit(1)
+
+g_py_path = sys.path[0]
+
+import logging
+log = logging.getLogger("analyze")
+
+import time
+import json
+import argparse
+import importlib
+
+
+def get_reducer_class(name, analytics):
+    if name in analytics.REDUCERS:
+        return analytics.REDUCERS[name]
+    module_name, class_name = name.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def print_history(store, metric):
+    print "%s:" % metric
+    print "    node    samples       min       max      last"
+    for node_id in store.get_node_ids(metric):
+        times, values = store.series[(node_id, metric)].get_all()
+        print "    %04X %10i %9g %9g %9g" % (node_id, len(values), values.min(), values.max(), values[-1])
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run analytics over a sensed recording")
+    parser.add_argument("recording", help="recording file")
+    parser.add_argument("-r", "--reducer", action="append",
+                        help="retries, parents, buffers or module.Class. can be given many times (default: all built-in)")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes (default: number of cores)")
+    parser.add_argument("--json", help="also write the results to this json file")
+    parser.add_argument("--history", metavar="METRIC",
+                        help="instead of the reducers, summarize the stored history of a node attribute: "
+                             "ctpf_buf_used, ctpf_buf_capacity, radiopowerstate or parent_etx")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    import system.conf_reader as conf_reader
+    import system.analytics as analytics
+    import system.recording as recording
+
+    conf = conf_reader.read_conf(os.path.join(g_py_path, "conf/conf_base.py"))
+    conf.py_path = g_py_path
+
+    if args.history:
+        return print_history(recording.load_timeseries(args.recording, conf), args.history)
+
+    names = args.reducer or ["retries", "parents", "buffers"]
+    reducer_classes = [get_reducer_class(name, analytics) for name in names]
+
+    progress_state = {"t": 0.}
+    def progress(done, total):
+        t = time.time()
+        if t - progress_state["t"] > 5. or done == total:
+            progress_state["t"] = t
+            log.info("%i/%i", done, total)
+
+    t = time.time()
+    num_packets, results = analytics.run(args.recording, reducer_classes, conf, args.jobs or None, progress)
+    t = time.time() - t
+    log.info("%i packets in %.1f s, %i packets/s", num_packets, t, num_packets / t if t else 0)
+
+    for cls, result in zip(reducer_classes, results):
+        print
+        print "%s:" % (cls.name or cls.__name__)
+        for line in cls().format(result):
+            print "    " + line
+
+    if args.json:
+        with open(args.json, "wb") as f:
+            json.dump(dict(((cls.name or cls.__name__), result) for cls, result in zip(reducer_classes, results)), f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
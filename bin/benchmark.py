@@ -0,0 +1,81 @@
+"""
+Benchmarks of the streaming and world hot paths. No gui, no network.
+
+    python benchmark.py                      # run everything, compare with the baseline if it exists
+    python benchmark.py --quick -f syncbuffer
+    python benchmark.py --save-baseline      # store the results as the new baseline
+    python benchmark.py --json results.json  # machine-readable results. "-" for stdout.
+
+Exit code is 2 if any benchmark is slower than the baseline by more than --threshold.
+"""
+
+import sys
+import os
+
+if sys.hexversion < 0x2060000:
+    print "python version >=2.6 required. you have", sys.version
+    sys.exit(1)
+
+g_py_path = sys.path[0]
+
+import logging
+import argparse
+
+import system.benchmarks as benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sensed streaming and world benchmarks")
+    parser.add_argument("-f", "--filter", help="run only benchmarks whose name contains this string")
+    parser.add_argument("-q", "--quick", action="store_true", help="smaller data sets. for a quick sanity check")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="best of this many runs is reported (default 3)")
+    parser.add_argument("-b", "--baseline", default=os.path.join(g_py_path, "../database/benchmark_baseline.json"),
+                        help="baseline file (default database/benchmark_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="report a regression if slower than the baseline by this fraction (default 0.2)")
+    parser.add_argument("--json", help="write the results to this file. '-' for stdout")
+    args = parser.parse_args()
+
+    # the packet handlers and the streamer log warnings. don't drown the results in them.
+    logging.basicConfig(level=logging.ERROR)
+
+    # progress goes to stderr if stdout is used for json
+    out = sys.stderr if args.json == "-" else sys.stdout
+
+    def progress(name, seconds, num_ops):
+        out.write("%-45s %10.4f s %12.0f ops/s %10.3f us/op\n" % (name, seconds, num_ops / seconds if seconds else 0., seconds / num_ops * 1e6))
+        out.flush()
+
+    results = benchmarks.run_benchmarks(args.filter, args.quick, args.repeats, progress)
+
+    if args.json == "-":
+        sys.stdout.write(benchmarks.json.dumps(results, indent=4, sort_keys=True) + "\n")
+    elif args.json:
+        benchmarks.save_results(results, args.json)
+
+    exit_code = 0
+
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        baseline = benchmarks.load_results(args.baseline)
+        if baseline.get("quick") != results["quick"]:
+            out.write("\nWARNING: baseline quick=%s, this run quick=%s. results are per-op, but may not be comparable.\n" % (baseline.get("quick"), results["quick"]))
+        out.write("\ncompared to baseline %s (%s)\n\n" % (args.baseline, baseline.get("time")))
+        num_regressions = 0
+        for name, seconds, baseline_seconds, ratio, is_regression in benchmarks.compare(results, baseline, args.threshold):
+            out.write("%-45s %7.2fx %s\n" % (name, ratio, "REGRESSION" if is_regression else ""))
+            if is_regression:
+                num_regressions += 1
+        if num_regressions:
+            out.write("\n%i regressions\n" % num_regressions)
+            exit_code = 2
+
+    if args.save_baseline:
+        benchmarks.save_results(results, args.baseline)
+        out.write("\nsaved baseline %s\n" % args.baseline)
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,7 +19,80 @@ class Conf: pass
 c = Conf()
 
 # how many seconds to wait for data to hold on sync buffer for time-sorting.
+# packets arriving later than this are still inserted at their own time, but the history (keyframes, the visible
+# world) has to be recalculated. smaller values mean less delay and more recalculation.
 c.sync_depth_seconds = 4.
+# the sync window adapts to the measured arrival lateness of every node stream. packets are held until this
+# percentile of the packets of every active stream have arrived. sync_depth_seconds is then the upper limit and the
+# startup value. 0 disables; the window is always sync_depth_seconds.
+c.sync_window_percentile = 99.9
+c.sync_window_min_seconds = 0.05
+
+# node clocks drift and some start minutes off. the clock offset and drift of every node stream is estimated from
+# packet arrival times and timestamps are moved to the local clock before sorting. offsets smaller than this can't be
+# told apart from transport delay and are left alone. 0 disables.
+c.clock_sync_threshold_seconds = 0.5
+
+# drop copies of a packet that arrive through more than one gateway. same content and the same node timestamp,
+# arriving within this many seconds. 0 disables.
+c.dedup_window_seconds = 0.2
+
+# show packets the moment they arrive, without waiting for the sync buffer. if the sorted order later turns out to be
+# different from the arrival order, the visible world is rolled back and the packets applied again. only while
+# playing at the live edge; seeking or pausing returns to the sorted view.
+c.speculative_live_view = False
+
+# arrange nodes automatically by their routing parents and traffic (force-directed). nodes dragged by hand stay where
+# they were put; right click unpins. the "layout" button toggles it. auto_layout_budget_seconds is the cpu time
+# used per simulation step. auto_layout_spring_length is the distance between connected nodes in world units.
+c.auto_layout = False
+c.auto_layout_budget_seconds = 0.003
+c.auto_layout_spring_length = 2.
+
+# per-link and per-node packet rate, retries, acks, congestion and drops are counted over this many seconds of packet
+# time. links are colored by their retry rate; the selected node's numbers are in the hud. after a seek the window
+# fills up from the keyframe before the seek point.
+c.link_stats_window_seconds = 60.
+
+# history of node buffer usage, radio power state, parent etx and send retries is kept in memory for the timeline and
+# analytics, and saved in recordings. samples kept per node and attribute; a sample is stored only when the value
+# changes. the selected node's history is plotted under the timeline.
+c.timeseries_capacity = 1024
+
+# if nothing on screen changes (playback paused, no packets, mouse still), don't redraw every vsync, but sleep in
+# the event loop. wake up at least this often to poll the network for packets.
+c.idle_wait_seconds = 0.05
+
+# simulation (animations, packet playback, timeline movement) is advanced in fixed steps of this many seconds,
+# independent of the render rate. if rendering falls behind, at most simulation_max_steps_per_frame steps are run
+# per rendered frame and the rest is caught up over the following frames.
+c.simulation_step_seconds = 1. / 60
+c.simulation_max_steps_per_frame = 30
+
+# per-phase frame timers (network poll, packet handling, rendering, text, swap..). F3 toggles the hud graph.
+# frame_profiler_log appends per-second percentiles of every phase to log/frame_profile.log. about 20 lines a second
+# with no size limit, so only for a profiling session.
+c.frame_profiler = True
+c.frame_profiler_hud = False
+c.frame_profiler_log = False
+
+# ingest pipeline health metrics (packets received, parse failures, sync buffer depth and lag, keyframes, memory..)
+# in prometheus text format. the file (relative to the log folder) is rewritten every metrics_period_seconds.
+# metrics_http_port serves the same text on http://127.0.0.1:port/metrics. "" and 0 disable.
+c.metrics_filename = "metrics.prom"
+c.metrics_period_seconds = 5.
+c.metrics_http_port = 0
+
+# screenshots are encoded and saved on a background thread. if more than this many are waiting, new ones are dropped.
+c.screenshot_queue_size = 2
+
+# append every sorted packet to database/recordings/recording_<utc time>.txt. bin/export.py renders these to images.
+# the file grows for as long as the program runs.
+c.save_recording = False
+
+# view this recording file instead of listening to the network. relative to the exe dir. bin/import_dump.py creates
+# recordings from raw gateway dumps. "" to disable.
+c.open_recording = ""
 
 # all paths can be absolute ("/home/user/prog/bin/data"), or relative to the exe dir ("../bin/data")
 
@@ -0,0 +1,109 @@
+"""
+Render a recording (database/recordings/*.txt) to numbered pngs or to a video encoder. No window needed.
+
+    python export.py ../database/recordings/recording_20150305_120000_utc.txt -o ../export/incident1
+    python export.py recording.txt --speed 10 --pipe "ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {w}x{h} -r {fps} -i - -pix_fmt yuv420p out.mp4"
+    python export.py recording.txt --pipe - | some_encoder
+
+Rendering uses mesa software opengl (llvmpipe) through EGL without a display, or OSMesa with --gl osmesa.
+"""
+
+import sys
+import os
+
+if sys.hexversion < 0x2060000:
+    print "python version >=2.6 required. you have", sys.version
+    sys.exit(1)
+
+g_py_path = sys.path[0]
+
+import logging
+log = logging.getLogger("export")
+
+import time
+import argparse
+
+
+def init_gl_platform(platform):
+    """ Has to be called before anything imports OpenGL. """
+    os.environ["PYOPENGL_PLATFORM"] = platform
+    if platform == "egl":
+        os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+
+def parse_time(s, start_time):
+    """ "1425601510.2" is a timestamp, "+90" is seconds from the start of the recording. """
+    if s is None:
+        return None
+    if s.startswith("+"):
+        return start_time + float(s[1:])
+    return float(s)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="render a sensed recording to images")
+    parser.add_argument("recording", help="recording file")
+    parser.add_argument("-o", "--output", default=os.path.join(g_py_path, "../export"),
+                        help="folder for the numbered pngs (default ../export)")
+    parser.add_argument("--pipe", help="write raw rgb24 frames to this shell command instead of pngs. '-' for stdout. "
+                                       "{w}, {h} and {fps} are replaced")
+    parser.add_argument("-s", "--size", default="1280x720", help="frame size (default 1280x720)")
+    parser.add_argument("--fps", type=float, default=30., help="frames per video second (default 30)")
+    parser.add_argument("--speed", type=float, default=1., help="recording seconds per video second (default 1)")
+    parser.add_argument("--start", help="start timestamp, or +seconds from the beginning of the recording")
+    parser.add_argument("--end", help="end timestamp, or +seconds from the beginning of the recording")
+    parser.add_argument("--title", default="", help="text on the top-left corner (default: recording file name)")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="png encoder processes (default: number of cores)")
+    parser.add_argument("--samples", type=int, default=4, help="multisampling samples (default 4)")
+    parser.add_argument("--gl", choices=("egl", "osmesa"), default="egl", help="headless opengl platform (default egl)")
+    args = parser.parse_args()
+
+    # stdout can be the video stream
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    w, h = [int(v) for v in args.size.lower().split("x")]
+
+    init_gl_platform(args.gl)
+
+    import system.conf_reader as conf_reader
+    import system.recording as recording
+    import system.exporter as exporter
+
+    conf = conf_reader.read_conf(os.path.join(g_py_path, "conf/conf_base.py"))
+    conf.py_path = g_py_path
+    conf.path_data = os.path.join(g_py_path, conf.path_data)
+    conf.path_database = os.path.join(g_py_path, conf.path_database)
+
+    t = time.time()
+    ws = recording.load_recording(args.recording, conf)
+    log.info("loading took %.1f s", time.time() - t)
+    if ws.start_time == None:
+        log.error("no packets in '%s'", args.recording)
+        return 1
+
+    # output first. png encoder processes are forked and shouldn't inherit the gl context.
+    if args.pipe:
+        output = exporter.PipeOutput(args.pipe, w, h, args.fps)
+    else:
+        output = exporter.PngSequenceOutput(args.output, w, h, args.jobs or None)
+
+    title = args.title or os.path.basename(args.recording)
+    e = exporter.Exporter(conf, ws, w, h, args.fps, args.speed, args.samples, title)
+
+    progress_state = {"t": 0.}
+    def progress(frame_num, num_frames):
+        t = time.time()
+        if t - progress_state["t"] > 5. or frame_num == num_frames - 1:
+            progress_state["t"] = t
+            log.info("frame %i/%i", frame_num + 1, num_frames)
+
+    try:
+        e.run(output, parse_time(args.start, ws.start_time), parse_time(args.end, ws.start_time), progress)
+    finally:
+        output.close()
+        e.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Import raw gateway packet dumps to a recording (database/recordings/*.txt) at full cpu speed.
+
+    python import_dump.py gw1_20150305.txt gw2_20150305.txt
+    python import_dump.py dumps/*.txt -o ../database/recordings/incident1.txt -j 8
+
+The recording has keyframes and opens without replaying the packets. View it with conf.open_recording, or render it
+with export.py.
+"""
+
+import sys
+import os
+
+if sys.hexversion < 0x2060000:
+    print "python version >=2.6 required. you have", sys.version
+    sys.exit(1)
+
+g_py_path = sys.path[0]
+
+import logging
+log = logging.getLogger("import_dump")
+
+import time
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import packet dump files to a sensed recording")
+    parser.add_argument("dumps", nargs="+", help="packet dump files. one packet per line")
+    parser.add_argument("-o", "--output", help="recording file (default ../database/recordings/recording_<utc time>.txt)")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="parser processes (default: number of cores)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="megabytes of input per parser job (default 32)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    import system.conf_reader as conf_reader
+    import system.recording as recording
+    import system.packet_import as packet_import
+
+    conf = conf_reader.read_conf(os.path.join(g_py_path, "conf/conf_base.py"))
+    conf.py_path = g_py_path
+    conf.path_data = os.path.join(g_py_path, conf.path_data)
+    conf.path_database = os.path.join(g_py_path, conf.path_database)
+
+    out_filename = args.output or recording.get_recording_filename(os.path.join(conf.path_database, "recordings"))
+
+    progress_state = {"t": 0.}
+    def progress(stage, done, total):
+        t = time.time()
+        if t - progress_state["t"] > 5. or done == total:
+            progress_state["t"] = t
+            log.info("%s %i/%i", stage, done, total)
+
+    t = time.time()
+    stats = packet_import.import_files(args.dumps, out_filename, conf, args.jobs or None, args.chunk_size * 1024 * 1024, progress)
+    t = time.time() - t
+
+    log.info("%i lines: %i packets, %i duplicates, %i ignored, %i parse failures", stats.num_lines, stats.num_packets,
+             stats.num_duplicates, stats.num_ignored, stats.num_parse_failures)
+    if not stats.num_packets:
+        log.error("no packets found")
+        return 1
+    log.info("wrote '%s'. %.1f hours of traffic in %.1f s, %i packets/s", out_filename,
+             (stats.end_time - stats.start_time) / 3600., t, stats.num_packets / t if t else 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Analytics over recordings, spread over all cpu cores. Driven by bin/analyze.py.
+
+Every keyframe in a recording is a complete world state, so the packets between two keyframes can be replayed
+independently of the rest of the recording. The recording file is cut to byte ranges; a worker process starts at
+the first keyframe inside its range, replays packets through a barebones world up to the first keyframe after its
+range, and feeds every packet to the reducers. The partial results of the ranges are merged in time order.
+
+A reducer is a class with a no-argument constructor, importable by the workers:
+
+    class Reducer:
+        name = "example"
+        def begin(self, timestamp, world):          # world at the start of the segment
+        def packet(self, timestamp, d, node, world): # after handle_packet(). d is msg.split(). world.link_stats
+                                                     # has the traffic and retries of the last minute
+        def result(self):                           # picklable partial result of the segment
+        def merge(self, results):                   # results of consecutive segments, in time order
+        def format(self, result):                   # list of text lines
+
+Recordings without keyframes (see recording.py) are replayed in one process.
+
+The history of buffer usage, radio power state and parent etx of every node needs no replay:
+recording.load_timeseries() gives a TimeSeriesStore, and get_window() returns any window of it.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import os
+import json
+import multiprocessing
+
+import world
+import packet_handler
+import recording
+
+
+class Reducer:
+    name = ""
+
+    def begin(self, timestamp, world):
+        pass
+
+    def packet(self, timestamp, d, node, world):
+        pass
+
+    def result(self):
+        return None
+
+    def merge(self, results):
+        return None
+
+    def format(self, result):
+        return [repr(result)]
+
+
+class RetryCounts(Reducer):
+    """ Per-node send_done statistics: sends, retries, the worst retry count, drops. """
+    name = "retries"
+
+    def __init__(self):
+        self.nodes = {} # node_id: [num_sends, num_retries, max_retry_count, num_dropped]
+
+    def packet(self, timestamp, d, node, world):
+        if d[1] == "send_done":
+            s = self.nodes.get(node.node_id)
+            if not s:
+                s = self.nodes[node.node_id] = [0, 0, 0, 0]
+            retry_count = int(d[14], 16)
+            s[0] += 1
+            s[1] += retry_count
+            s[2] = max(s[2], retry_count)
+            s[3] += int(d[20], 16) != 0
+
+    def result(self):
+        return self.nodes
+
+    def merge(self, results):
+        nodes = {}
+        for r in results:
+            for node_id, s in r.iteritems():
+                m = nodes.get(node_id)
+                if m:
+                    nodes[node_id] = [m[0] + s[0], m[1] + s[1], max(m[2], s[2]), m[3] + s[3]]
+                else:
+                    nodes[node_id] = list(s)
+        return nodes
+
+    def format(self, result):
+        lines = ["node    sends  retries  per send  max  dropped"]
+        for node_id, (num_sends, num_retries, max_retry_count, num_dropped) in sorted(result.iteritems()):
+            lines.append("%04X %8i %8i %9.2f %4i %8i" % (node_id, num_sends, num_retries,
+                         float(num_retries) / num_sends, max_retry_count, num_dropped))
+        return lines
+
+
+class ParentChanges(Reducer):
+    """ Per-node routing parent changes, from beacons. """
+    name = "parents"
+
+    def __init__(self):
+        self.parents = {} # node_id: parent_id
+        self.changes = {} # node_id: num_changes
+        self.start_time = None
+        self.end_time = None
+
+    def begin(self, timestamp, world):
+        self.start_time = self.end_time = timestamp
+        for node in world.nodes:
+            parent = node.attrs.get("parent")
+            if parent != None:
+                self.parents[node.node_id] = parent
+
+    def packet(self, timestamp, d, node, world):
+        if self.start_time == None:
+            self.start_time = timestamp
+        self.end_time = timestamp
+        if d[1] == "beacon":
+            parent = int(d[8], 16)
+            prev = self.parents.get(node.node_id)
+            if prev != None and prev != parent:
+                self.changes[node.node_id] = self.changes.get(node.node_id, 0) + 1
+            self.parents[node.node_id] = parent
+
+    def result(self):
+        return self.start_time, self.end_time, self.changes
+
+    def merge(self, results):
+        results = [r for r in results if r[0] != None]
+        changes = {}
+        for start_time, end_time, c in results:
+            for node_id, n in c.iteritems():
+                changes[node_id] = changes.get(node_id, 0) + n
+        if not results:
+            return None, None, changes
+        return results[0][0], results[-1][1], changes
+
+    def format(self, result):
+        start_time, end_time, changes = result
+        hours = (end_time - start_time) / 3600. if start_time != None else 0.
+        lines = ["node  changes  per hour"]
+        for node_id, n in sorted(changes.iteritems()):
+            lines.append("%04X %8i %9.2f" % (node_id, n, n / hours if hours else 0.))
+        return lines
+
+
+class BufferMaxima(Reducer):
+    """ Per-node maximum forwarding buffer occupancy, from ctpf_buf_size packets. """
+    name = "buffers"
+
+    def __init__(self):
+        self.nodes = {} # node_id: (max_used, capacity)
+
+    def begin(self, timestamp, world):
+        for node in world.nodes:
+            if "ctpf_buf_used" in node.attrs:
+                self._put(node.node_id, node.attrs["ctpf_buf_used"], node.attrs["ctpf_buf_capacity"])
+
+    def packet(self, timestamp, d, node, world):
+        if d[1] == "ctpf_buf_size":
+            self._put(node.node_id, int(d[6]), int(d[8]))
+
+    def _put(self, node_id, used, capacity):
+        m = self.nodes.get(node_id)
+        if not m or used > m[0]:
+            self.nodes[node_id] = (used, capacity)
+
+    def result(self):
+        return self.nodes
+
+    def merge(self, results):
+        nodes = {}
+        for r in results:
+            for node_id, m in r.iteritems():
+                if node_id not in nodes or m[0] > nodes[node_id][0]:
+                    nodes[node_id] = m
+        return nodes
+
+    def format(self, result):
+        lines = ["node  max used  capacity"]
+        for node_id, (used, capacity) in sorted(result.iteritems()):
+            lines.append("%04X %9i %9i" % (node_id, used, capacity))
+        return lines
+
+
+REDUCERS = dict((r.name, r) for r in (RetryCounts, ParentChanges, BufferMaxima))
+
+
+def get_ranges(filename, num_ranges):
+    """ Return [(start, end), ..] byte ranges that cover the file. """
+    size = os.path.getsize(filename)
+    step = max(size // num_ranges, 1)
+    ranges = [(start, min(start + step, size)) for start in xrange(0, size, step)]
+    return ranges or [(0, 0)]
+
+
+def _replay_range(args):
+    """ Runs in a worker process. Replay the segments that start inside the byte range [start, end) of a recording.
+    The range starting at 0 also replays the packets before the first keyframe. Return
+    (num_packets, [reducer results]) """
+    filename, start, end, reducer_classes, conf = args
+    reducers = [cls() for cls in reducer_classes]
+    w = world.World("", conf)
+    num_packets = 0
+    began = False
+
+    with open(filename, "rb") as f:
+        if start == 0:
+            pos = len(f.readline()) # header
+        else:
+            # skip the line that started in the previous range, then everything up to the first keyframe
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+            while pos < end:
+                line = f.readline()
+                if not line or line.startswith("K "):
+                    break
+                pos += len(line)
+            if pos >= end or not line:
+                # no keyframe starts inside this range
+                return 0, [r.result() for r in reducers]
+            k, timestamp, keyframe_json = line.split(" ", 2)
+            w.deserialize_world(json.loads(keyframe_json))
+            for r in reducers:
+                r.begin(float(timestamp), w)
+            pos += len(line)
+            began = True
+
+        while 1:
+            line = f.readline()
+            if not line:
+                break
+            if line.startswith("K "):
+                if pos >= end:
+                    # the worker of the next range starts from this keyframe
+                    break
+                # the world is already in this state
+                pos += len(line)
+                continue
+            pos += len(line)
+            if line.startswith("S "):
+                continue
+
+            if line.startswith("L "):
+                # late packet. replayed when it arrived, not at its own time.
+                line = line[2:]
+            timestamp, msg = line.rstrip("\r\n").split(" ", 1)
+            timestamp = float(timestamp)
+            if not began:
+                began = True
+                for r in reducers:
+                    r.begin(timestamp, w)
+            packet_handler.handle_packet(msg, w, barebones=True, timestamp=timestamp)
+            num_packets += 1
+            d = msg.split()
+            node = w.get_create_named_node(d[4])
+            for r in reducers:
+                r.packet(timestamp, d, node, w)
+
+    return num_packets, [r.result() for r in reducers]
+
+
+def run(filename, reducer_classes, conf, num_workers=None, progress=None):
+    """ Run the reducers over a recording file. Return (num_packets, [merged result of every reducer])
+    num_workers : worker processes. default is the number of cpu cores.
+    progress : function(done, total) called after every finished range. """
+    header, items = recording.read_recording(filename)
+    items.close()
+    num_workers = num_workers or multiprocessing.cpu_count()
+
+    if header.get("keyframes"):
+        # more ranges than workers evens out the load if the packet rate varies
+        ranges = get_ranges(filename, num_workers * 4)
+    else:
+        llog.warning("'%s' has no keyframes. using one process", filename)
+        ranges = [(0, os.path.getsize(filename))]
+    jobs = [(filename, start, end, reducer_classes, conf) for start, end in ranges]
+
+    pool = multiprocessing.Pool(min(num_workers, len(jobs)))
+    try:
+        results = []
+        for i, result in enumerate(pool.imap(_replay_range, jobs)):
+            results.append(result)
+            if progress:
+                progress(i + 1, len(jobs))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    num_packets = sum(r[0] for r in results)
+    merged = [reducer_classes[i]().merge([r[1][i] for r in results]) for i in range(len(reducer_classes))]
+    return num_packets, merged
@@ -3,11 +3,17 @@ llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
 
 from math import sin, cos, radians, atan2
 
-from OpenGL.GL import *
-from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
+import gfx
 
-import vbo
-import draw
+
+# the simulation is advanced in fixed steps (see timestep.py), but frames are rendered at any rate. animations that
+# move or fade remember their age at the previous step and render() interpolates between the two ages.
+#
+# render() adds triangles to a gfx.TriangleBatch in the world projection, render_ortho() in the pixel projection.
+# the renderers draw the batch of every animation at once. pos : position of the animated node, None on links.
+
+def _interpolated_age(anim, alpha):
+    return anim.prev_age + (anim.age - anim.prev_age) * alpha
 
 
 class ColorAnimation:
@@ -35,16 +41,16 @@ class ColorAnimation:
                 c1[2] + d*(c2[2]-c1[2]),
                 c1[3] + d*(c2[3]-c1[3]))
 
-    def render(self):
+    def render(self, batch, pos, alpha=1.):
         pass
 
-    def render_ortho(self):
+    def render_ortho(self, batch):
         pass
 
 
 class BeaconAnimation:
     """ a blue (push) or red (pull) filled circle around node during beacon send """
-    _filled_circles_xz_vbo = None
+    _filled_circle_xz = None
     _pull_beacon_center_color   = (1.0, 0.271, 0.0, 0.3)
     _pull_beacon_edge_color     = (1.0, 0.271, 1.0, 0.0)
     _normal_beacon_center_color = (0.5, 0.5, 0.9, 0.3)
@@ -60,35 +66,27 @@ class BeaconAnimation:
             self.centercolor = self._normal_beacon_center_color
             self.edgecolor = self._normal_beacon_edge_color
 
-        if not self._filled_circles_xz_vbo:
-            self._filled_circles_xz_vbo = self._build_filled_circle_xz_vbo(
-                1.5, self.centercolor, self.edgecolor)
-
         self.age = 0.
+        self.prev_age = 0.
         self.max_age = 2.
         self.dead = False
 
     def tick(self, dt):
         if not self.dead:
+            self.prev_age = self.age
             self.age += dt
             if self.age > self.max_age:
                 self.dead = True
 
-    def render(self):
+    def render(self, batch, pos, alpha=1.):
         r, g, b, a = self.centercolor
-        glColor4f(r, g, b, 1 - self.age / self.max_age * 0.6)
-        self._filled_circles_xz_vbo.draw(GL_TRIANGLE_FAN)
+        if BeaconAnimation._filled_circle_xz is None:
+            BeaconAnimation._filled_circle_xz = gfx.circle_xz(1.5)
+        batch.add(self._filled_circle_xz, pos, (r, g, b, 1 - _interpolated_age(self, alpha) / self.max_age * 0.6))
 
-    def render_ortho(self):
+    def render_ortho(self, batch):
         pass
 
-    def _build_filled_circle_xz_vbo(self, radius, centercolor, edgecolor):
-        """Build a vbo of a filled circle. meant to be rendered with GL_TRIANGLE_FAN."""
-        v = [0., 0., 0.]
-        for angle in range(0, 361, 5):
-            v.extend([radius * sin(radians(angle)), 0., radius * cos(radians(angle))])
-        return vbo.VBO(v)
-
 
 class PacketAnimation:
     """ a little triangle that flows from node to node. one hop. """
@@ -97,21 +95,22 @@ class PacketAnimation:
         self.dst_pos = dst_pos
 
         self.age = 0.
+        self.prev_age = 0.
         self.max_age = .5
         self.dead = False
         self.initial_color = initial_color
 
     def tick(self, dt):
         if not self.dead:
+            self.prev_age = self.age
             self.age += dt
             if self.age > self.max_age:
                 self.dead = True
 
-    def render(self):
+    def render(self, batch, pos, alpha=1.):
         r, g, b, a = self.initial_color
-        d = self.age / self.max_age
-        glColor4f(r, g, b, 1 - d * 0.7)
-        glLineWidth(2.)
+        d = _interpolated_age(self, alpha) / self.max_age
+        color = (r, g, b, 1 - d * 0.7)
 
         p1 = self.src_pos
         p2 = self.dst_pos
@@ -119,22 +118,12 @@ class PacketAnimation:
         r = 0.15
         aa = radians(140.) # angle of attack
 
-        glPushMatrix()
         x, y, z = p1[0] + (p2[0] - p1[0]) * d, p1[1] + (p2[1] - p1[1]) * d, p1[2] + (p2[2] - p1[2]) * d
-        glTranslatef(x, y, z)
-        glBegin(GL_TRIANGLES)
-
-        x, y, z = sin(a) * r, 0., cos(a) * r
-        glVertex3f(x, y, z)
-        x, z = sin(a - aa) * r, cos(a - aa) * r
-        glVertex3f(x, y, z)
-        x, z = sin(a + aa) * r, cos(a + aa) * r
-        glVertex3f(x, y, z)
-
-        glEnd()
-        glPopMatrix()
+        batch.add_triangle((x + sin(a) * r, y, z + cos(a) * r),
+                           (x + sin(a - aa) * r, y, z + cos(a - aa) * r),
+                           (x + sin(a + aa) * r, y, z + cos(a + aa) * r), color)
 
-    def render_ortho(self):
+    def render_ortho(self, batch):
         pass
 
 
@@ -170,10 +159,10 @@ class SendRetryAnimation:
                 c1[2] + d*(c2[2]-c1[2]),
                 c1[3] + d*(c2[3]-c1[3]))
 
-    def render(self):
+    def render(self, batch, pos, alpha=1.):
         pass
 
-    def render_ortho(self):
+    def render_ortho(self, batch):
         w = 2.
         h = float(self.retry_count+1.)
-        draw.filled_rect(round(self.x-w/2.), round(self.y)-h, w, h, self.cur_color)
+        batch.add_rect(round(self.x-w/2.), round(self.y)-h, w, h, 100., self.cur_color)
@@ -0,0 +1,349 @@
+"""
+GUI-free benchmarks of the streaming and world hot paths. Run with bin/benchmark.py.
+
+Every benchmark is a function bench_x(quick) that returns (setup, run, num_ops). setup() is called before every
+timed repeat and its return value is given to run(). Only run() is timed. The best of the repeats is reported.
+
+Results are dicts {"format": "sensed benchmark results", .., "results": {name: {"seconds": .., "ops": ..}}}
+and can be saved as a baseline and compared against later runs.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import gc
+import sys
+import time
+import json
+import random
+import platform
+
+import world
+import world_streamer
+import packet_handler
+
+
+RESULTS_FORMAT = "sensed benchmark results"
+RESULTS_FORMAT_VERSION = "2026-10-19"
+
+# time.time() has only ~15ms resolution on windows
+_clock = time.clock if sys.platform == "win32" else time.time
+
+
+class _Conf:
+    link_stats_window_seconds = 60.
+    timeseries_capacity = 1024
+
+
+#
+# test data
+#
+
+def gen_packets(num_packets, num_nodes, start_time=1400000000., packets_per_second=100., seed=0):
+    """ Return [(timestamp, msg), ..] of typical sensor network traffic. node ids are 1..num_nodes. """
+    rnd = random.Random(seed)
+    result = []
+    etx_index = {}
+    for i in xrange(num_packets):
+        t = start_time + i / packets_per_second
+        node_id = rnd.randint(1, num_nodes)
+        other_id = rnd.randint(1, num_nodes)
+        r = rnd.random()
+        if r < 0.4:
+            index = etx_index.get(node_id, 0)
+            etx_index[node_id] = (index + 1) % 10
+            msg = "data etx %.6f node %04X index %i neighbor %i etx %i retx %i" % (t, node_id, index, other_id, rnd.randint(10, 200), rnd.randint(0, 20))
+        elif r < 0.6:
+            msg = "event beacon %.6f node %04X options 0x%02X parent 0x%04X etx %i" % (t, node_id, rnd.choice((0, 0x80)), other_id, rnd.randint(10, 200))
+        elif r < 0.8:
+            msg = "event send_ctp_packet %.6f node %04X dest 0x%04X origin 0x%04X sequence %i amid 0x71 thl %i" % (t, node_id, other_id, rnd.randint(1, num_nodes), i % 256, rnd.randint(0, 5))
+        elif r < 0.9:
+            msg = "event radiopowerstate %.6f node %04X state %i" % (t, node_id, rnd.randint(0, 1))
+        else:
+            msg = "event send_done %.6f node %04X rm 0x02 dest 0x%04X amid 0x71 error 0x00 retry_count %i acked 0x01 congested 0x00 dropped 0x00" % (t, node_id, other_id, rnd.randint(0, 9))
+        result.append((t, msg))
+    return result
+
+
+# one example packet of every type handle_packet knows. %(node)04X and %(other)04X are replaced.
+PACKET_TYPES = [
+    ("etx",                  "data etx 1400000000.0 node %(node)04X index %(index)i neighbor %(other)i etx 30 retx 2"),
+    ("ctpf_buf_size",        "data ctpf_buf_size 1400000000.0 node %(node)04X used 3 capacity 12"),
+    ("radiopowerstate",      "event radiopowerstate 1400000000.0 node %(node)04X state 1"),
+    ("beacon",               "event beacon 1400000000.0 node %(node)04X options 0x00 parent 0x%(other)04X etx 30"),
+    ("send_ctp_packet",      "event send_ctp_packet 1400000000.0 node %(node)04X dest 0x%(other)04X origin 0x0005 sequence 4 amid 0x98 thl 1"),
+    ("packet_to_model_busy", "event packet_to_model_busy 1400000000.0 node %(node)04X dest 0x%(other)04X"),
+    ("send_done",            "event send_done 1400000000.0 node %(node)04X rm 0x02 dest 0x%(other)04X amid 0x71 error 0x00 retry_count 3 acked 0x01 congested 0x00 dropped 0x00"),
+]
+
+
+def new_world():
+    conf = _Conf()
+    return world.World("", conf)
+
+
+def build_world(num_nodes, seed=0):
+    """ Return a world with num_nodes nodes, every node with a full etx table, parent and buffer attributes. """
+    w = new_world()
+    rnd = random.Random(seed)
+    for node_id in xrange(1, num_nodes + 1):
+        for index in range(10):
+            packet_handler.handle_packet("data etx 1400000000.0 node %04X index %i neighbor %i etx %i retx %i" % (
+                node_id, index, rnd.randint(1, num_nodes), rnd.randint(10, 200), rnd.randint(0, 20)), w, barebones=True)
+        packet_handler.handle_packet("event beacon 1400000000.0 node %04X options 0x00 parent 0x%04X etx 30" % (
+            node_id, rnd.randint(1, num_nodes)), w, barebones=True)
+        packet_handler.handle_packet("data ctpf_buf_size 1400000000.0 node %04X used 3 capacity 12" % node_id, w, barebones=True)
+    return w
+
+
+def build_streamer(num_packets, num_nodes):
+    """ Return a WorldStreamer with a recording of num_packets packets, keyframes generated like NodeEditor does. """
+    ws = world_streamer.WorldStreamer(sync_window_seconds=None)
+    underworld = new_world()
+    packets = gen_packets(num_packets, num_nodes)
+    # a few packets per tick, like they arrive from the network
+    for i in xrange(0, len(packets), 10):
+        for timestamp, msg in packets[i:i+10]:
+            ws.put_packet(timestamp, msg, int(msg.split(None, 5)[4], 16))
+        for timestamp, msg in ws.tick():
+            packet_handler.handle_packet(msg, underworld, barebones=True)
+        if ws.need_keyframe():
+            ws.put_keyframe(underworld.serialize_world())
+    return ws
+
+
+#
+# benchmarks
+#
+
+def bench_syncbuffer_put_packet(quick, num_streams):
+    num_packets = 5000 if quick else 50000
+    packets = [(1400000000. + i * 0.001, "packet", i % num_streams) for i in xrange(num_packets)]
+    def setup():
+        return world_streamer.SyncBuffer(sync_window_seconds=5.)
+    def run(sb):
+        for timestamp, packet, stream_id in packets:
+            sb.put_packet(timestamp, packet, stream_id)
+    return setup, run, num_packets
+
+
+def bench_syncbuffer_tick(quick, num_streams):
+    """ sort everything that was put into the buffer. """
+    num_packets = 2000 if quick else 20000
+    packets = [(1400000000. + i * 0.001, "packet", i % num_streams) for i in xrange(num_packets)]
+    def setup():
+        sb = world_streamer.SyncBuffer(sync_window_seconds=5.)
+        for timestamp, packet, stream_id in packets:
+            sb.put_packet(timestamp, packet, stream_id)
+        return sb
+    def run(sb):
+        sb.tick()
+        assert len(sb.get_sorted_packets()) == num_packets
+    return setup, run, num_packets
+
+
+def bench_syncbuffer_tick_incremental(quick, num_streams):
+    """ realistic usage. a few packets arrive, tick is called. """
+    num_packets = 2000 if quick else 20000
+    packets = [(1400000000. + i * 0.001, "packet", i % num_streams) for i in xrange(num_packets)]
+    def setup():
+        return world_streamer.SyncBuffer(sync_window_seconds=5.)
+    def run(sb):
+        for i in xrange(0, num_packets, 10):
+            for timestamp, packet, stream_id in packets[i:i+10]:
+                sb.put_packet(timestamp, packet, stream_id)
+            sb.tick()
+            sb.get_sorted_packets()
+    return setup, run, num_packets
+
+
+_streamer_cache = {}
+
+def _get_streamer(num_packets):
+    # building the recording is slow. share it between the streamer benchmarks.
+    if num_packets not in _streamer_cache:
+        _streamer_cache[num_packets] = build_streamer(num_packets, 100)
+    return _streamer_cache[num_packets]
+
+
+def bench_worldstreamer_get_packets(quick, num_packets):
+    """ random one-second windows """
+    ws = _get_streamer(num_packets)
+    rnd = random.Random(0)
+    num_queries = 200 if quick else 2000
+    windows = [rnd.uniform(ws.start_time, ws.end_time - 1.) for i in xrange(num_queries)]
+    def run(dummy):
+        for t in windows:
+            ws.get_packets(t, t + 1.)
+    return None, run, num_queries
+
+
+def bench_worldstreamer_playback(quick, num_packets):
+    """ get_delta_packets at 60 steps per second, starting from the middle of the recording """
+    ws = _get_streamer(num_packets)
+    num_steps = 600 if quick else 6000
+    def setup():
+        ws.seek((ws.start_time + ws.end_time) / 2.)
+    def run(dummy):
+        for i in xrange(num_steps):
+            ws.get_delta_packets(1. / 60)
+    return setup, run, num_steps
+
+
+def bench_worldstreamer_seek(quick, num_packets):
+    """ seek to random times and rebuild the world like NodeEditor does """
+    ws = _get_streamer(num_packets)
+    rnd = random.Random(0)
+    num_seeks = 20 if quick else 200
+    seek_times = [rnd.uniform(ws.start_time, ws.end_time) for i in xrange(num_seeks)]
+    w = new_world()
+    def run(dummy):
+        for t in seek_times:
+            keyframe, packets = ws.seek(t)
+            w.deserialize_world(keyframe)
+            for timestamp, packet in packets:
+                packet_handler.handle_packet(packet, w, barebones=True)
+    return None, run, num_seeks
+
+
+def bench_handle_packet(quick, packet_type, barebones):
+    num_packets = 2000 if quick else 20000
+    template = dict(PACKET_TYPES)[packet_type]
+    rnd = random.Random(0)
+    msgs = [template % {"node": rnd.randint(1, 100), "other": rnd.randint(1, 100), "index": i % 10} for i in xrange(num_packets)]
+    def setup():
+        w = new_world()
+        # don't measure node creation
+        for node_id in xrange(1, 101):
+            w.get_create_node(node_id)
+        return w
+    def run(w):
+        for msg in msgs:
+            packet_handler.handle_packet(msg, w, barebones)
+    return setup, run, num_packets
+
+
+def bench_handle_packet_mixed(quick, barebones):
+    num_packets = 2000 if quick else 20000
+    msgs = [msg for t, msg in gen_packets(num_packets, 100)]
+    def setup():
+        return new_world()
+    def run(w):
+        for msg in msgs:
+            packet_handler.handle_packet(msg, w, barebones)
+    return setup, run, num_packets
+
+
+def bench_serialize_world(quick, num_nodes):
+    w = build_world(num_nodes)
+    def run(dummy):
+        w.serialize_world()
+    return None, run, num_nodes
+
+
+def bench_deserialize_world(quick, num_nodes):
+    keyframe = build_world(num_nodes).serialize_world()
+    w = new_world()
+    def run(dummy):
+        w.deserialize_world(keyframe)
+    return None, run, num_nodes
+
+
+def get_benchmarks(quick):
+    """ Return [(name, benchmark_function, args), ..] """
+    b = []
+    for num_streams in (1, 10, 100, 1000):
+        b.append(("syncbuffer_put_packet_%istreams" % num_streams, bench_syncbuffer_put_packet, (num_streams,)))
+    for num_streams in (1, 10, 100, 1000):
+        b.append(("syncbuffer_tick_%istreams" % num_streams, bench_syncbuffer_tick, (num_streams,)))
+    for num_streams in (10, 100):
+        b.append(("syncbuffer_tick_incremental_%istreams" % num_streams, bench_syncbuffer_tick_incremental, (num_streams,)))
+    for num_packets in ((20000,) if quick else (20000, 200000)):
+        b.append(("worldstreamer_get_packets_%ipackets" % num_packets, bench_worldstreamer_get_packets, (num_packets,)))
+        b.append(("worldstreamer_playback_%ipackets" % num_packets, bench_worldstreamer_playback, (num_packets,)))
+        b.append(("worldstreamer_seek_%ipackets" % num_packets, bench_worldstreamer_seek, (num_packets,)))
+    for packet_type, template in PACKET_TYPES:
+        b.append(("handle_packet_%s_barebones" % packet_type, bench_handle_packet, (packet_type, True)))
+        b.append(("handle_packet_%s" % packet_type, bench_handle_packet, (packet_type, False)))
+    b.append(("handle_packet_mixed_barebones", bench_handle_packet_mixed, (True,)))
+    b.append(("handle_packet_mixed", bench_handle_packet_mixed, (False,)))
+    for num_nodes in (100, 1000, 5000, 20000):
+        b.append(("serialize_world_%inodes" % num_nodes, bench_serialize_world, (num_nodes,)))
+        b.append(("deserialize_world_%inodes" % num_nodes, bench_deserialize_world, (num_nodes,)))
+    return b
+
+
+#
+# running and comparing
+#
+
+def run_benchmark(benchmark_function, args, quick, repeats):
+    """ Return (best_seconds, num_ops) """
+    setup, run, num_ops = benchmark_function(quick, *args)
+    best = None
+    for i in range(repeats):
+        data = setup() if setup else None
+        # collect garbage from the previous repeat, and don't let the collector run inside the measurement
+        gc.collect()
+        gc.disable()
+        try:
+            t = _clock()
+            run(data)
+            t = _clock() - t
+        finally:
+            gc.enable()
+        if best is None or t < best:
+            best = t
+    return best, num_ops
+
+
+def run_benchmarks(name_filter=None, quick=False, repeats=3, progress=None):
+    """ name_filter : run only benchmarks that contain this substring.
+    progress : function(name, seconds, num_ops) called after every benchmark. """
+    results = {}
+    for name, benchmark_function, args in get_benchmarks(quick):
+        if name_filter and name_filter not in name:
+            continue
+        seconds, num_ops = run_benchmark(benchmark_function, args, quick, repeats)
+        results[name] = {"seconds": seconds, "ops": num_ops, "ops_per_second": num_ops / seconds if seconds else None}
+        if progress:
+            progress(name, seconds, num_ops)
+    _streamer_cache.clear()
+
+    return {
+        "format": RESULTS_FORMAT,
+        "format_version": RESULTS_FORMAT_VERSION,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "quick": quick,
+        "repeats": repeats,
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=0.2):
+    """ Return [(name, seconds, baseline_seconds, ratio, is_regression), ..] for benchmarks found in both.
+    ratio is seconds per op relative to the baseline; above 1 + threshold is a regression. """
+    rows = []
+    for name in sorted(results["results"]):
+        r = results["results"][name]
+        b = baseline["results"].get(name)
+        if not b or not b["seconds"] or not b["ops"]:
+            continue
+        ratio = (r["seconds"] / r["ops"]) / (b["seconds"] / b["ops"])
+        rows.append((name, r["seconds"], b["seconds"], ratio, ratio > 1. + threshold))
+    return rows
+
+
+def load_results(filename):
+    with open(filename, "rb") as f:
+        d = json.load(f)
+    if d.get("format") != RESULTS_FORMAT:
+        raise ValueError("'%s' is not a benchmark results file" % filename)
+    return d
+
+
+def save_results(results, filename):
+    with open(filename, "wb") as f:
+        f.write(json.dumps(results, indent=4, sort_keys=True))
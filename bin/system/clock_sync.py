@@ -0,0 +1,93 @@
+"""
+Clock offset and drift of packet streams relative to the local clock.
+
+Only one-way timing is known: the timestamp a node put into the packet, and the local time the packet arrived.
+lag = arrival time - timestamp = transport delay + clock offset. Transport delay only adds, so the smallest lag
+in a short period is the closest to the pure offset. ClockEstimator keeps the minimum lag of every BUCKET_SECONDS
+period and fits a line through them - offset and drift.
+
+Offset can't be told apart from the minimum transport delay. Offsets smaller than threshold_seconds are taken to be
+delay and left alone; only the part beyond the threshold is corrected. This leaves nodes with agreeing clocks
+untouched while pulling a node whose clock lags by minutes back to the others.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import collections
+
+
+class ClockEstimator:
+    BUCKET_SECONDS = 10.
+    NUM_BUCKETS = 30 # fit over the last 5 minutes
+    MIN_FIT_SECONDS = 60. # drift is not estimated from a shorter period
+    MAX_DRIFT = 0.001 # 1000 ppm. anything above is a bad fit
+
+    def __init__(self, threshold_seconds=0.5):
+        self.threshold_seconds = threshold_seconds
+        # [[first timestamp, timestamp of the min lag, min lag], ..]
+        self.buckets = collections.deque()
+        # lag(timestamp) = offset + drift * (timestamp - ref_time)
+        self.offset = 0.
+        self.drift = 0.
+        self.ref_time = 0.
+        self.last_timestamp = None
+        self.last_corrected = None
+
+    def add(self, timestamp, arrival_time):
+        lag = arrival_time - timestamp
+        b = self.buckets
+        if b and timestamp < b[-1][0] - self.BUCKET_SECONDS:
+            # the node clock jumped back. start over.
+            b.clear()
+        if not b or timestamp >= b[-1][0] + self.BUCKET_SECONDS:
+            b.append([timestamp, timestamp, lag])
+            # also forgets everything before a forward jump of the node clock
+            while len(b) > self.NUM_BUCKETS or b[0][0] < timestamp - self.NUM_BUCKETS * self.BUCKET_SECONDS:
+                b.popleft()
+            self._fit()
+        elif lag < b[-1][2]:
+            b[-1][1] = timestamp
+            b[-1][2] = lag
+            if len(b) == 1:
+                self._fit()
+
+    def _fit(self):
+        """ Least squares line through the bucket minimums. """
+        points = [(p[1], p[2]) for p in self.buckets]
+        self.ref_time = points[-1][0]
+        if len(points) < 3 or points[-1][0] - points[0][0] < self.MIN_FIT_SECONDS:
+            self.offset = min(p[1] for p in points)
+            self.drift = 0.
+            return
+
+        n = float(len(points))
+        xs = [x - self.ref_time for x, y in points]
+        ys = [y for x, y in points]
+        sx, sy = sum(xs), sum(ys)
+        sxx = sum(x * x for x in xs)
+        sxy = sum(x * y for x, y in zip(xs, ys))
+        drift = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        self.drift = max(-self.MAX_DRIFT, min(self.MAX_DRIFT, drift))
+        self.offset = (sy - self.drift * sx) / n
+        # the line has to stay under every minimum, otherwise it would include transport delay
+        self.offset = min(self.offset, min(y - self.drift * x for x, y in zip(xs, ys)))
+
+    def get_offset(self, timestamp):
+        """ Return estimated lag of a packet without transport delay. """
+        return self.offset + self.drift * (timestamp - self.ref_time)
+
+    def correct(self, timestamp):
+        """ Return timestamp moved to the local clock. """
+        offset = self.get_offset(timestamp)
+        corrected = timestamp
+        if offset > self.threshold_seconds:
+            corrected += offset - self.threshold_seconds
+        elif offset < -self.threshold_seconds:
+            corrected += offset + self.threshold_seconds
+        # refits move the line a little. don't let that reorder packets that were in order.
+        if self.last_timestamp != None and timestamp >= self.last_timestamp and corrected < self.last_corrected:
+            corrected = self.last_corrected
+        self.last_timestamp = timestamp
+        self.last_corrected = corrected
+        return corrected
@@ -0,0 +1,42 @@
+"""
+Removes copies of the same radio packet that arrive through more than one gateway. Gateways with overlapping
+coverage each forward what they hear, so one event can arrive two or three times.
+
+Copies are recognized by a hash of the whole packet. The timestamp field is the node's own clock (see clock_sync.py),
+so every gateway forwards the same stamp; a node sending the same content twice, like a radio going on - off - on
+or two identical send_done events, stamps the repeats differently and they are kept. A packet is a duplicate if a
+packet with the same hash was seen less than window_seconds before it. Memory use is bounded by the number of
+packets in one window.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import collections
+
+
+class PacketDeduplicator:
+    def __init__(self, window_seconds=0.2):
+        self.window_seconds = window_seconds
+        self.seen = {} # hash: time first seen
+        self.expiry = collections.deque() # (time first seen, hash) of every hash in seen, in the order seen
+        self.num_duplicates = 0
+
+    def is_duplicate(self, msg, t):
+        """ Return True if msg is a copy of a packet seen less than window_seconds ago.
+        t : arrival time of live packets, or the packet timestamp when the packets are already sorted. has to grow. """
+        seen = self.seen
+        expiry = self.expiry
+        expire_time = t - self.window_seconds
+        while expiry and expiry[0][0] < expire_time:
+            del seen[expiry.popleft()[1]]
+
+        # split and not the raw string, so a different amount of whitespace from another gateway doesn't matter
+        key = hash(tuple(msg.split()))
+        if key in seen:
+            # not refreshing the time. otherwise a node repeating itself would be silenced for good.
+            self.num_duplicates += 1
+            return True
+        seen[key] = t
+        expiry.append( (t, key) )
+        return False
@@ -0,0 +1,276 @@
+"""
+Renders a recording to an image sequence as fast as possible. No window; see offscreen_gl.py. Driven by bin/export.py.
+
+The simulation runs on a virtual clock: every frame advances the playback by speed / fps seconds, in the same fixed
+steps the gui uses, regardless of how long rendering takes.
+
+Outputs:
+    PngSequenceOutput : numbered png files. encoding is spread over a pool of worker processes.
+    PipeOutput        : raw rgb24 frames, top row first, to stdout or to the stdin of an encoder command.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import os
+import sys
+import time
+import datetime
+import subprocess
+import collections
+import multiprocessing
+
+import numpy
+from PIL import Image
+
+from OpenGL.GL import *
+from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
+
+import camera
+import coordinate_system
+import floor
+import renderers
+import world
+import timestep
+import packet_handler
+import offscreen_gl
+from modules import gltext
+
+
+def timestamp_to_timestr(t):
+    """ '2010-01-18T18:40:42.23Z' utc time
+    OR '01 12:30:22s"""
+    try:
+        # this method does not work with times < 1900
+        return (datetime.datetime.utcfromtimestamp(0) + datetime.timedelta(seconds=t)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:22] + "Z"
+    except:
+        # fallback. return time in dhms (days, hours, minutes, seconds) format.
+        return "%i %02i:%02i:%02is" % (t // (60*60*24), t // (60*60) % 24, t // 60 % 60, t % 60)
+
+
+def _encode_png(args):
+    """ Runs in a worker process. """
+    filename, w, h, pixels = args
+    Image.frombuffer("RGB", (w, h), pixels, "raw", "RGB", 0, -1).save(filename)
+    return filename
+
+
+class PngSequenceOutput:
+    def __init__(self, path, w, h, num_workers=None):
+        """ Writes path/frame_000000.png, path/frame_000001.png, ..
+        num_workers : number of encoder processes. default is the number of cpu cores.
+        Create this before the gl context. worker processes are forked and shouldn't inherit it. """
+        self.path = path
+        self.w, self.h = w, h
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self._pool = multiprocessing.Pool(self.num_workers)
+        # limits memory use if encoding is slower than rendering
+        self._pending = collections.deque()
+        self._max_pending = self.num_workers * 2
+
+    def write(self, frame_num, pixels):
+        """ pixels : str of RGB pixels, bottom row first. """
+        if len(self._pending) >= self._max_pending:
+            self._pending.popleft().get()
+        filename = os.path.join(self.path, "frame_%06i.png" % frame_num)
+        self._pending.append(self._pool.apply_async(_encode_png, ((filename, self.w, self.h, pixels),)))
+
+    def close(self):
+        while self._pending:
+            self._pending.popleft().get()
+        self._pool.close()
+        self._pool.join()
+
+
+class PipeOutput:
+    def __init__(self, command, w, h, fps):
+        """ command : "-" for stdout, or a shell command that reads raw frames from stdin. {w}, {h} and {fps} are
+        replaced. for example
+            ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {w}x{h} -r {fps} -i - -pix_fmt yuv420p out.mp4 """
+        self.w, self.h = w, h
+        self._proc = None
+        if command == "-":
+            self._f = sys.stdout
+        else:
+            command = command.format(w=w, h=h, fps=fps)
+            llog.info("piping frames to '%s'", command)
+            self._proc = subprocess.Popen(command, shell=True, stdin=subprocess.PIPE)
+            self._f = self._proc.stdin
+
+    def write(self, frame_num, pixels):
+        """ pixels : str of RGB pixels, bottom row first. """
+        rows = numpy.frombuffer(pixels, dtype=numpy.uint8).reshape(self.h, self.w * 3)
+        self._f.write(rows[::-1].tostring())
+
+    def close(self):
+        if self._proc:
+            self._f.close()
+            if self._proc.wait():
+                llog.error("encoder exited with code %i", self._proc.returncode)
+        else:
+            self._f.flush()
+
+
+class Exporter:
+    def __init__(self, conf, worldstreamer, w, h, fps=30., speed=1., samples=4, title=""):
+        """ worldstreamer : recording to export. see recording.load_recording()
+        speed : recording seconds per video second. """
+        self.conf = conf
+        self.worldstreamer = worldstreamer
+        self.w_pixels, self.h_pixels = w, h
+        self.fps = fps
+        self.speed = speed
+        self.title = title
+
+        self.context = offscreen_gl.create_context()
+        self.framebuffer = offscreen_gl.Framebuffer(w, h, samples)
+        self.framebuffer.bind()
+        self._init_gl()
+
+        self.world = world.World("", conf)
+        self.world.load_session_node_positions(os.path.join(conf.path_database, "session_conf.txt"))
+
+        # same view as the gui: look down to the x/z plane from 10 units above.
+        self.camera = camera.Camera()
+        self.camera_ocs = coordinate_system.CoordinateSystem()
+        self.camera_ocs.pos.set([0, 10., 0])
+        self.camera_ocs.a_frame.x_axis.set([ 1.0,  0.0,  0.0])
+        self.camera_ocs.a_frame.y_axis.set([ 0.0,  0.0,  1.0])
+        self.camera_ocs.a_frame.z_axis.set([ 0.0, -1.0,  0.0])
+        self.camera.set_orthox(20)
+        self.camera.update_fovy(float(w) / h)
+
+        self.floor = floor.Floor()
+        self.gltext = gltext.GLText(os.path.join(conf.path_data, "font_proggy_opti_small.txt"))
+        self.gltext.init()
+        self.node_renderer = renderers.NodeRenderer(self.gltext)
+        self.link_renderer = renderers.LinkRenderer()
+
+        # no catching up limits. the clock is virtual, every step is always run.
+        self.timestep = timestep.FixedTimestep(conf.simulation_step_seconds, max_steps_per_frame=sys.maxint,
+                                               max_backlog_seconds=float("inf"))
+        self.current_time = None
+
+    def _init_gl(self):
+        glDisable(GL_TEXTURE_2D)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_FOG)
+        glDisable(GL_DITHER)
+        glDisable(GL_LIGHTING)
+        glShadeModel(GL_SMOOTH)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_LINE_SMOOTH)
+        glDisable(GL_LINE_STIPPLE)
+
+    def seek(self, timestamp):
+        keyframe, packets = self.worldstreamer.seek(timestamp)
+        self.world.deserialize_world(keyframe)
+        # animate only the last 2 seconds worth of packets. same as the gui.
+        animations_start = timestamp - 2.
+        for t, packet in packets:
+            packet_handler.handle_packet(packet, self.world, barebones=t < animations_start, timestamp=t)
+        self.current_time = self.worldstreamer.current_time
+
+    def fit_view(self, margin=1.2):
+        """ Move the camera so that every node of the current world is visible. """
+        if not self.world.nodes:
+            return
+        xs = [n.pos[0] for n in self.world.nodes]
+        zs = [n.pos[2] for n in self.world.nodes]
+        p = self.camera_ocs.pos
+        p[0] = (min(xs) + max(xs)) / 2.
+        p[2] = (min(zs) + max(zs)) / 2.
+        aspect = float(self.w_pixels) / self.h_pixels
+        # leave room for node icons and labels, which have a fixed pixel size
+        orthox = max(max(xs) - min(xs), (max(zs) - min(zs)) * aspect) * margin + 4.
+        self.camera.set_orthox(orthox)
+        self.camera.update_fovy(aspect)
+
+    def step_frame(self):
+        """ Advance the playback by one video frame. """
+        dt = self.timestep.step_seconds
+        for i in range(self.timestep.advance(self.speed / self.fps)):
+            self.world.tick(dt)
+            for t, packet in self.worldstreamer.get_delta_packets(dt):
+                packet_handler.handle_packet(packet, self.world, timestamp=t)
+            self.current_time += dt
+
+    def render(self):
+        alpha = self.timestep.alpha
+        glClearColor(0.8,0.8,0.8,1.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        self.camera.set_opengl_projection(self.camera.ORTHOGONAL, self.w_pixels, self.h_pixels, .1, 1000.)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        glScalef(1.,1.,-1.)
+        p = self.camera_ocs.pos
+        glMultMatrixf(self.camera_ocs.a_frame.get_opengl_matrix())
+        glTranslatef(-p[0], -p[1], -p[2])
+
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_TEXTURE_2D)
+        self.floor.render()
+        self.link_renderer.render_links(self.world.links, alpha, self.world.link_stats)
+        self.link_renderer.render_links_to_parents(self.world)
+        self.node_renderer.render_nodes(self.world.nodes, alpha)
+
+        # text and 2D overlay
+
+        self.camera.set_opengl_projection(self.camera.PIXEL, self.w_pixels, self.h_pixels, .1, 1000.)
+        glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
+        glScalef(1.,1.,-1.)
+        glLineWidth(1.)
+
+        for node in self.world.nodes:
+            v = self.camera_ocs.projv_in(node.pos)
+            node.screen_pos.set(self.camera.screenspace(self.camera.ORTHOGONAL, v, self.w_pixels, self.h_pixels))
+        self.node_renderer.render_overlays(self.world.nodes)
+
+        glEnable(GL_TEXTURE_2D)
+        t = self.gltext
+        y = 5.
+        if self.title:
+            t.drawtl(" %s " % self.title, 5, y, bgcolor=(0.8,0.8,0.8,.9), fgcolor=(0.,0.,0.,1.), z=100.); y += t.height
+        t.drawtl(" %s " % timestamp_to_timestr(self.current_time), 5, y, bgcolor=(0.8,0.8,0.8,.9), fgcolor=(0.,0.,0.,1.), z=100.)
+        if self.speed != 1.:
+            t.drawtr(" %gx " % self.speed, self.w_pixels - 5, 5)
+        t.flush()
+        glDisable(GL_TEXTURE_2D)
+
+    def run(self, output, start_time=None, end_time=None, progress=None):
+        """ Render frames from start_time to end_time (default: the whole recording) to output.
+        progress : function(frame_num, num_frames) called after every frame. Return number of frames. """
+        ws = self.worldstreamer
+        if ws.start_time == None:
+            llog.warning("recording is empty")
+            return 0
+        start_time = ws.start_time if start_time == None else max(start_time, ws.start_time)
+        end_time = ws.end_time if end_time == None else min(end_time, ws.end_time)
+        num_frames = int((end_time - start_time) * self.fps / self.speed) + 1
+
+        # fit every node that appears during the export
+        self.seek(end_time)
+        self.fit_view()
+        self.seek(start_time)
+
+        t = time.time()
+        for frame_num in xrange(num_frames):
+            if frame_num:
+                self.step_frame()
+            self.render()
+            output.write(frame_num, self.framebuffer.read_pixels())
+            if progress:
+                progress(frame_num, num_frames)
+
+        t = time.time() - t
+        llog.info("rendered %i frames in %.1f s, %.1f fps", num_frames, t, num_frames / t if t else 0.)
+        return num_frames
+
+    def close(self):
+        self.framebuffer.close()
+        self.context.close()
@@ -1,8 +1,10 @@
 from OpenGL.GL import *
 from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
 
+import numpy
+
 import vector
-import vbo
+import gfx
 
 
 class Floor:
@@ -14,33 +16,37 @@ class Floor:
         self.grid_color = (0.7, 0.7, 0.7, 1.0)
         self.fill_color = (0.6, 0.6, 0.6, 0.6)
 
-        #self._floor_vertex_list = pyglet.graphics.vertex_list((ntiles+1) * 4, ('v3f/static', v))
-        self._floor_vertex_list = self._build_grid_vbo(num_tiles, tile_size)
+        # uploaded on the first render and never changed
+        self._grid_mesh = gfx.Mesh("color", GL_STATIC_DRAW)
+        self._fill_mesh = gfx.Mesh("color", GL_STATIC_DRAW)
 
-    def _build_grid_vbo(self, num_tiles, tile_size):
+    def _build_grid(self, num_tiles, tile_size):
+        """ Return vertex rows of the grid lines for GL_LINES. """
         w2 = num_tiles * tile_size / 2.
         v = []; ts = tile_size
         for i in range(num_tiles + 1):
             v.extend([i*ts-w2,0.,w2,  i*ts-w2,0.,-w2,  -w2,0.,i*ts-w2,  w2,0.,i*ts-w2])
-        return vbo.VBO(v)
-
-    def render(self):
-        glLineWidth(1.)
+        return self._add_color(v, self.grid_color)
 
-        glColor4f(*self.grid_color)
+    def _build_fill(self, num_tiles, tile_size):
+        """ Return vertex rows of the filled quad for GL_TRIANGLES. """
+        w2 = num_tiles * tile_size / 2.
+        v = [-w2,0.,w2,  w2,0.,w2,  w2,0.,-w2,  -w2,0.,w2,  w2,0.,-w2,  -w2,0.,-w2]
+        return self._add_color(v, self.fill_color)
 
-        self._floor_vertex_list.draw(GL_LINES)
-        #self._floor_vertex_list.draw(GL_TRIANGLES)
+    def _add_color(self, v, color):
+        data = numpy.empty((len(v) // 3, 7), numpy.float32)
+        data[:, :3] = numpy.array(v).reshape(-1, 3)
+        data[:, 3:] = color
+        return data
 
-        if 1:
-            w2 = self.num_tiles * self.tile_size / 2.
-            glBegin(GL_QUADS)
-            glColor4f(*self.fill_color)
-            glVertex3f(-w2, 0.,  w2)
-            glVertex3f( w2, 0.,  w2)
-            glVertex3f( w2, 0., -w2)
-            glVertex3f(-w2, 0., -w2)
-            glEnd()
+    def render(self):
+        if not self._grid_mesh.num_vertices:
+            self._grid_mesh.update(self._build_grid(self.num_tiles, self.tile_size))
+            self._fill_mesh.update(self._build_fill(self.num_tiles, self.tile_size))
+        glLineWidth(1.)
+        self._grid_mesh.draw(GL_LINES)
+        self._fill_mesh.draw(GL_TRIANGLES)
 
     def intersection(self, start, direction):
         """ return: 3d-intersection-coordinate, None if no intersection found """
@@ -24,3 +24,40 @@ class FpsCounter:
             self._age     = 0.
             self._counter = 0.
             #print "fps:", self.fps
+
+
+class IdleCounter:
+
+    def __init__(self, update_interval_seconds = 1.):
+        """
+        measures how much of the wall-clock time the main loop spends sleeping instead of rendering.
+        read self.idle_percent for output. self.total_idle_percent is the average since startup.
+        """
+
+        self.idle_percent = 0.
+        self.total_idle_percent = 0.
+        self.interval = update_interval_seconds
+
+        self._idle = 0.
+        self._age  = 0.
+        self._total_idle = 0.
+        self._total_age  = 0.
+
+
+    def add_idle(self, idle_seconds):
+        self._idle       += idle_seconds
+        self._total_idle += idle_seconds
+
+
+    def tick(self, dt):
+
+        self._age       += dt
+        self._total_age += dt
+
+        if self._age > self.interval:
+            self.idle_percent = min(100., 100. * self._idle / self._age)
+            self._age  = 0.
+            self._idle = 0.
+
+        if self._total_age > 0.:
+            self.total_idle_percent = min(100., 100. * self._total_idle / self._total_age)
@@ -0,0 +1,253 @@
+"""
+Lightweight per-phase frame timers.
+
+    profiler = FrameProfiler("../log/frame_profile.log")
+
+    profiler.start("net_poll")
+    ...
+    profiler.stop("net_poll")
+    ...
+    profiler.finish_frame() # once per main loop iteration
+
+Phases can be nested. Every phase records only its exclusive time (time spent in child phases is subtracted),
+so all phases of a frame can be stacked on top of each other in the hud graph. Time not covered by any phase
+is recorded as "other".
+
+Once per second, percentiles of every phase over the frames of that second are appended to the log file.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import sys
+import time
+import collections
+
+import numpy
+
+from OpenGL.GL import *
+from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
+
+
+# time.time() has only ~15ms resolution on windows
+_clock = time.clock if sys.platform == "win32" else time.time
+
+
+def _percentile(sorted_values, percent):
+    """ nearest-rank percentile of an already sorted list """
+    i = int(round(percent / 100. * (len(sorted_values) - 1)))
+    return sorted_values[i]
+
+
+class FrameProfiler:
+
+    # hud graph colors of phases, in order of first appearance. "other" is always gray.
+    PHASE_COLORS = [
+        (0.000, 0.749, 1.000, 0.9),
+        (1.000, 0.627, 0.478, 0.9),
+        (0.498, 1.000, 0.000, 0.9),
+        (1.000, 0.000, 1.000, 0.9),
+        (1.000, 1.000, 0.000, 0.9),
+        (0.824, 0.412, 0.118, 0.9),
+        (0.000, 1.000, 1.000, 0.9),
+        (0.871, 0.722, 0.529, 0.9),
+        (0.500, 0.549, 1.000, 0.9),
+        (1.000, 0.300, 0.300, 0.9),
+        (0.300, 0.700, 0.300, 0.9),
+        (0.700, 0.300, 0.700, 0.9),
+        (0.300, 0.300, 0.900, 0.9),
+        (0.900, 0.900, 0.900, 0.9),
+    ]
+    OTHER_COLOR = (0.4, 0.4, 0.4, 0.9)
+
+    def __init__(self, log_filename=None, history_len=240, enabled=True):
+        """ log_filename : per-second percentiles are appended to this file. None to disable.
+        history_len : number of frames kept for the hud graph. """
+        self.enabled = enabled
+        self.log_filename = log_filename
+
+        self.phases = [] # phase names in order of first appearance. "other" is not included.
+        self.history_len = history_len
+        # exclusive seconds spent in every phase, for the last history_len frames. [{phase: seconds}, ..]
+        self.history = collections.deque(maxlen=history_len)
+        # average milliseconds per frame of every phase during the last full second. {phase: ms}
+        self.last_second_avg_ms = {}
+
+        self._frame = {} # phase: exclusive seconds in the current frame
+        self._stack = [] # [(phase, start_time), ..] nested phases that are currently running
+        self._frame_start = _clock()
+        self._second_start = self._frame_start
+        self._second_frames = [] # history entries of the current second
+
+        self._log_file = None
+
+    def start(self, phase):
+        if not self.enabled:
+            return
+        if phase not in self._frame:
+            self._frame[phase] = 0.
+            if phase not in self.phases:
+                self.phases.append(phase)
+        self._stack.append((phase, _clock()))
+
+    def stop(self, phase):
+        """ phase : name of the phase given to start(). used only for sanity checking. """
+        if not self.enabled:
+            return
+        t = _clock()
+        started_phase, t0 = self._stack.pop()
+        assert started_phase == phase, "profiler phase '%s' stopped while '%s' is running" % (phase, started_phase)
+        dt = t - t0
+
+        frame = self._frame
+        frame[phase] += dt
+        # remove the time from the parent phase. this way every phase contains only its own exclusive time.
+        if self._stack:
+            frame[self._stack[-1][0]] -= dt
+
+    def finish_frame(self):
+        """ Call once at the end of every main loop iteration. """
+        if not self.enabled:
+            return
+        t = _clock()
+        frame = self._frame
+        frame["other"] = max(0., (t - self._frame_start) - sum(frame.itervalues()))
+        frame["frame"] = t - self._frame_start
+        self.history.append(frame)
+        self._second_frames.append(frame)
+        self._frame = {}
+        self._frame_start = t
+
+        if t - self._second_start >= 1.:
+            self._finish_second(t - self._second_start)
+            self._second_start = t
+            self._second_frames = []
+
+    def _finish_second(self, seconds):
+        frames = self._second_frames
+        n = len(frames)
+        self.last_second_avg_ms = {}
+        lines = []
+        timestr = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()) + "Z"
+
+        for phase in ["frame"] + self.phases + ["other"]:
+            # frames where the phase didn't run count as zero
+            values = sorted(f.get(phase, 0.) * 1000. for f in frames)
+            self.last_second_avg_ms[phase] = sum(values) / n
+            lines.append("%s %-16s n %4i avg %8.3f p50 %8.3f p90 %8.3f p99 %8.3f max %8.3f ms\n" % (
+                timestr, phase, n, self.last_second_avg_ms[phase], _percentile(values, 50.),
+                _percentile(values, 90.), _percentile(values, 99.), values[-1]))
+
+        self._write_log(lines)
+
+    def _write_log(self, lines):
+        if not self.log_filename:
+            return
+        try:
+            if not self._log_file:
+                self._log_file = open(self.log_filename, "a")
+                self._log_file.write("# per-second frame phase percentiles. exclusive time of every phase.\n")
+            self._log_file.writelines(lines)
+            self._log_file.flush()
+        except IOError:
+            llog.exception("writing '%s' failed. disabling the frame profile log", self.log_filename)
+            self.log_filename = None
+
+    def get_phase_color(self, phase):
+        if phase == "other":
+            return self.OTHER_COLOR
+        return self.PHASE_COLORS[self.phases.index(phase) % len(self.PHASE_COLORS)]
+
+    def render_graph(self, font, x, y, h, ms_per_h=50., bar_w=2.):
+        """ Render a rolling stacked bar graph of the frame history. One column per frame, newest on the right.
+        Uses pixel projection. x, y : bottom-left corner of the graph. h : graph height in pixels. ms_per_h : how many
+        milliseconds the full graph height represents. Returns the width of the rendered graph. """
+        phases = self.phases + ["other"]
+        n = len(self.history)
+        w = self.history_len * bar_w
+        if not n:
+            return w
+
+        # [frame, phase] milliseconds -> stacked column tops in pixels
+        ms = numpy.array([[f.get(phase, 0.) for phase in phases] for f in self.history], dtype=numpy.float32) * 1000.
+        tops = numpy.minimum(numpy.cumsum(ms, axis=1) * (h / ms_per_h), h)
+        bottoms = numpy.hstack((numpy.zeros((n, 1), dtype=numpy.float32), tops[:, :-1]))
+
+        # one quad per (frame, phase). vertices: x, y, z
+        x1 = x + w - (n - numpy.arange(n, dtype=numpy.float32)) * bar_w
+        x1 = numpy.repeat(x1, len(phases))
+        x2 = x1 + bar_w
+        y1 = y - bottoms.ravel()
+        y2 = y - tops.ravel()
+        z = numpy.empty_like(x1)
+        z.fill(100.)
+        vertices = numpy.column_stack((x1, y1, z, x2, y1, z, x2, y2, z, x1, y2, z)).astype(numpy.float32)
+
+        colors = numpy.array([self.get_phase_color(phase) for phase in phases], dtype=numpy.float32)
+        colors = numpy.tile(numpy.repeat(colors, 4, axis=0), (n, 1))
+
+        glDisable(GL_TEXTURE_2D)
+        glColor4f(0., 0., 0., 0.5)
+        glBegin(GL_QUADS)
+        glVertex3f(x,     y - h, 100.)
+        glVertex3f(x + w, y - h, 100.)
+        glVertex3f(x + w, y,     100.)
+        glVertex3f(x,     y,     100.)
+        glEnd()
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, vertices)
+        glColorPointer(4, GL_FLOAT, 0, colors)
+        glDrawArrays(GL_QUADS, 0, len(vertices) * 4)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+        # 60 fps reference line
+        yy = y - min(h, 1000. / 60 * h / ms_per_h) + 0.5
+        glColor4f(1., 1., 1., 0.6)
+        glBegin(GL_LINES)
+        glVertex3f(x,     yy, 100.)
+        glVertex3f(x + w, yy, 100.)
+        glEnd()
+
+        # legend. average ms per frame during the last second.
+        glEnable(GL_TEXTURE_2D)
+        yy = y - h - 2.
+        for phase in reversed(phases):
+            font.drawbr(" %s %6.2f ms " % (phase, self.last_second_avg_ms.get(phase, 0.)), x - 2., yy,
+                        fgcolor=self.get_phase_color(phase), bgcolor=(0., 0., 0., 0.6), z=100.)
+            yy -= font.height
+        font.drawbr(" frame %6.2f ms " % self.last_second_avg_ms.get("frame", 0.), x - 2., yy,
+                    fgcolor=(1., 1., 1., 1.), bgcolor=(0., 0., 0., 0.6), z=100.)
+
+        return w
+
+    def close(self):
+        if self._log_file:
+            self._log_file.close()
+            self._log_file = None
+
+
+class ProfiledFont:
+    """ Wraps a gltext instance. Time spent in every draw* and flush call is recorded as the given profiler phase. """
+
+    def __init__(self, font, profiler, phase="gltext"):
+        self._font = font
+        self._profiler = profiler
+        self._phase = phase
+
+    def __getattr__(self, name):
+        attr = getattr(self._font, name)
+        if (name.startswith("draw") or name == "flush") and callable(attr):
+            profiler, phase = self._profiler, self._phase
+            def profiled(*args, **kwargs):
+                profiler.start(phase)
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    profiler.stop(phase)
+            # cache the wrapper. __getattr__ is called only for missing attributes.
+            self.__dict__[name] = profiled
+            return profiled
+        return attr
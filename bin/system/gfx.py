@@ -0,0 +1,288 @@
+"""
+Retained-mode drawing: GLSL programs and persistent vertex buffers.
+
+Renderers collect the shapes of a frame into a batch and the whole batch is uploaded and drawn with one call:
+
+    batch = gfx.TriangleBatch()
+    batch.add(gfx.circle_xy(10.), (x, y, z), (1., 1., 1., 1.))
+    batch.add_rect(x, y, w, h, z, (0., 0., 0., 1.))
+    batch.flush()
+
+    lines = gfx.WideLineBatch()
+    lines.add(node1.pos, node2.pos, 3., (0.4, 0.4, 0.4, 1.))
+    lines.flush()
+
+The shaders are GLSL 1.20 and read the fixed-function matrices (gl_ModelViewProjectionMatrix), so batches are drawn
+in whatever projection the camera has set and mix with the immediate mode code that is left. Wide lines are
+extruded to quads in the vertex shader and antialiased in the fragment shader; glLineWidth doesn't batch and core
+profiles don't have wide lines at all.
+
+Programs and buffers are created on the first flush, not in the constructors, so a batch can be created without a
+gl context.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+from math import sin, cos, radians
+from ctypes import c_void_p
+
+import numpy
+
+from OpenGL.GL import *
+from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
+
+
+COLOR_VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec4 color;
+varying vec4 v_color;
+void main() {
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(position, 1.);
+    v_color = color;
+}
+"""
+
+COLOR_FRAGMENT_SHADER = """
+#version 120
+varying vec4 v_color;
+void main() {
+    gl_FragColor = v_color;
+}
+"""
+
+# every line is a quad of four corners. all corners get both endpoints, so the quad is extruded the same way at
+# both ends. corner.x : 0 at p1, 1 at p2. corner.y : -1 or 1, the side of the line.
+WIDE_LINE_VERTEX_SHADER = """
+#version 120
+attribute vec3 p1;
+attribute vec3 p2;
+attribute vec2 corner;
+attribute float width;
+attribute vec4 color;
+uniform vec2 viewport;
+varying vec4 v_color;
+varying float v_edge;
+varying float v_half_width;
+void main() {
+    vec4 a = gl_ModelViewProjectionMatrix * vec4(p1, 1.);
+    vec4 b = gl_ModelViewProjectionMatrix * vec4(p2, 1.);
+    vec2 d = (b.xy / b.w - a.xy / a.w) * viewport;
+    vec2 n = dot(d, d) > 0. ? normalize(vec2(-d.y, d.x)) : vec2(0., 1.);
+    // one pixel more than the width for the antialiased edge
+    float extrude = width * .5 + 1.;
+    vec4 p = mix(a, b, corner.x);
+    p.xy += n * corner.y * extrude / viewport * 2. * p.w;
+    gl_Position = p;
+    v_color = color;
+    v_edge = corner.y * extrude;
+    v_half_width = width * .5;
+}
+"""
+
+WIDE_LINE_FRAGMENT_SHADER = """
+#version 120
+varying vec4 v_color;
+varying float v_edge;
+varying float v_half_width;
+void main() {
+    float coverage = clamp(v_half_width + .5 - abs(v_edge), 0., 1.);
+    gl_FragColor = vec4(v_color.rgb, v_color.a * coverage);
+}
+"""
+
+
+class Program:
+    """ A linked GLSL program. attributes : [(name, num_floats), ..], in the order of the interleaved vertex rows. """
+    def __init__(self, vertex_source, fragment_source, attributes):
+        self.attributes = attributes
+        self.stride = sum(size for name, size in attributes) * 4
+        self.program = glCreateProgram()
+        shaders = [self._compile(GL_VERTEX_SHADER, vertex_source), self._compile(GL_FRAGMENT_SHADER, fragment_source)]
+        for shader in shaders:
+            glAttachShader(self.program, shader)
+        for i, (name, size) in enumerate(attributes):
+            glBindAttribLocation(self.program, i, name)
+        glLinkProgram(self.program)
+        for shader in shaders:
+            glDetachShader(self.program, shader)
+            glDeleteShader(shader)
+        if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
+            raise RuntimeError("shader link failed: %s" % glGetProgramInfoLog(self.program))
+        self._uniforms = {} # name: location
+
+    def _compile(self, shader_type, source):
+        shader = glCreateShader(shader_type)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if glGetShaderiv(shader, GL_COMPILE_STATUS) != GL_TRUE:
+            raise RuntimeError("shader compile failed: %s" % glGetShaderInfoLog(shader))
+        return shader
+
+    def set_uniform2f(self, name, x, y):
+        loc = self._uniforms.get(name)
+        if loc == None:
+            loc = self._uniforms[name] = glGetUniformLocation(self.program, name)
+        glUniform2f(loc, x, y)
+
+
+_programs = {} # name: Program. one gl context per process
+
+def get_program(name):
+    """ name : "color" or "wide_line" """
+    program = _programs.get(name)
+    if program == None:
+        if name == "color":
+            program = Program(COLOR_VERTEX_SHADER, COLOR_FRAGMENT_SHADER, [("position", 3), ("color", 4)])
+        else:
+            program = Program(WIDE_LINE_VERTEX_SHADER, WIDE_LINE_FRAGMENT_SHADER,
+                              [("p1", 3), ("p2", 3), ("corner", 2), ("width", 1), ("color", 4)])
+        _programs[name] = program
+    return program
+
+
+class Mesh:
+    """
+    A vertex buffer of interleaved float32 rows in the attribute layout of a program. The buffer is kept and only
+    reallocated when the data outgrows it.
+        mesh = Mesh("color")
+        mesh.update(numpy.array([[0.,0.,0., 1.,0.,0.,1.], [1.,0.,0., 1.,0.,0.,1.]], dtype=numpy.float32))
+        mesh.draw(GL_LINES)
+    """
+    def __init__(self, program_name, usage=GL_STREAM_DRAW):
+        self.program_name = program_name
+        self.usage = usage
+        self.vbo = None
+        self.capacity = 0 # bytes
+        self.num_vertices = 0
+
+    def update(self, data):
+        """ data : float32 numpy array, a row per vertex """
+        if self.vbo == None:
+            self.vbo = glGenBuffers(1)
+        data = numpy.ascontiguousarray(data, numpy.float32)
+        self.num_vertices = len(data)
+        if not self.num_vertices:
+            return
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        if data.nbytes > self.capacity or self.usage == GL_STATIC_DRAW:
+            self.capacity = data.nbytes
+            glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, self.usage)
+        else:
+            glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, elemtype, viewport=None):
+        """ elemtype : GL_LINES, GL_TRIANGLES, ..
+        viewport : (w, h) in pixels. needed by the wide_line program. """
+        if not self.num_vertices:
+            return
+        program = get_program(self.program_name)
+        glUseProgram(program.program)
+        if viewport:
+            program.set_uniform2f("viewport", viewport[0], viewport[1])
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        offset = 0
+        for i, (name, size) in enumerate(program.attributes):
+            glEnableVertexAttribArray(i)
+            glVertexAttribPointer(i, size, GL_FLOAT, GL_FALSE, program.stride, c_void_p(offset))
+            offset += size * 4
+        glDrawArrays(elemtype, 0, self.num_vertices)
+        for i in range(len(program.attributes)):
+            glDisableVertexAttribArray(i)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    def close(self):
+        if self.vbo != None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+            self.capacity = 0
+
+
+class TriangleBatch:
+    """ Triangles of one frame, in one color per shape. add() only remembers the shape; flush() builds the vertex
+    rows of the whole frame with numpy and draws them with one call. """
+    def __init__(self):
+        self.mesh = Mesh("color")
+        self._shapes = []  # float32 arrays of (x, y, z) rows, three per triangle
+        self._offsets = [] # (x, y, z) per shape
+        self._colors = []  # (r, g, b, a) per shape
+
+    def add(self, shape, offset, color):
+        """ shape : output of circle_xy() etc. or any float32 array of triangle vertices """
+        self._shapes.append(shape)
+        self._offsets.append((offset[0], offset[1], offset[2]))
+        self._colors.append(color)
+
+    def add_triangle(self, v1, v2, v3, color):
+        self.add(numpy.array((v1, v2, v3), numpy.float32), (0., 0., 0.), color)
+
+    def add_rect(self, x, y, w, h, z, color):
+        """ Axis-aligned rectangle on the xy-plane. For the pixel projection. """
+        self.add(numpy.array(((x, y, z), (x + w, y, z), (x + w, y + h, z),
+                              (x, y, z), (x + w, y + h, z), (x, y + h, z)), numpy.float32), (0., 0., 0.), color)
+
+    def flush(self):
+        if not self._shapes:
+            return
+        counts = [len(shape) for shape in self._shapes]
+        data = numpy.empty((sum(counts), 7), numpy.float32)
+        data[:, :3] = numpy.concatenate(self._shapes)
+        data[:, :3] += numpy.repeat(numpy.array(self._offsets, numpy.float32), counts, axis=0)
+        data[:, 3:] = numpy.repeat(numpy.array(self._colors, numpy.float32), counts, axis=0)
+        self._shapes, self._offsets, self._colors = [], [], []
+        self.mesh.update(data)
+        self.mesh.draw(GL_TRIANGLES)
+
+
+class WideLineBatch:
+    """ Lines of one frame with a width in pixels each. Drawn with one call, unlike glLineWidth. """
+    # quad corners of a line as two triangles. (along, side)
+    _CORNERS = numpy.array(((0., -1.), (0., 1.), (1., 1.), (0., -1.), (1., 1.), (1., -1.)), numpy.float32)
+
+    def __init__(self):
+        self.mesh = Mesh("wide_line")
+        self._lines = [] # (x1, y1, z1, x2, y2, z2, width, r, g, b, a)
+
+    def add(self, p1, p2, width, color):
+        """ width : in pixels. thinner than one pixel is drawn one pixel wide like glLineWidth does. """
+        self._lines.append((p1[0], p1[1], p1[2], p2[0], p2[1], p2[2], max(width, 1.)) + tuple(color))
+
+    def flush(self):
+        if not self._lines:
+            return
+        lines = numpy.repeat(numpy.array(self._lines, numpy.float32), 6, axis=0)
+        self._lines = []
+        data = numpy.empty((len(lines), 13), numpy.float32)
+        data[:, :6] = lines[:, :6]
+        data[:, 6:8] = numpy.tile(self._CORNERS, (len(lines) // 6, 1))
+        data[:, 8:] = lines[:, 6:]
+        self.mesh.update(data)
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        self.mesh.draw(GL_TRIANGLES, (float(viewport[2]), float(viewport[3])))
+
+
+def _fan_to_triangles(center, rim):
+    """ Return the triangles of a triangle fan as a float32 array of (x, y, z) rows. """
+    tris = []
+    for i in range(len(rim) - 1):
+        tris.extend((center, rim[i], rim[i+1]))
+    return numpy.array(tris, numpy.float32)
+
+def circle_xy(radius, start_angle=0., end_angle=360., num_steps=73):
+    """ Filled circle or a sector of it on the xy-plane, for the pixel projection. Angles in degrees, 0 is down. """
+    rim = []
+    for i in range(num_steps):
+        a = radians(start_angle + (end_angle - start_angle) / (num_steps - 1) * i)
+        rim.append((radius * sin(a), -radius * cos(a), 0.))
+    return _fan_to_triangles((0., 0., 0.), rim)
+
+def circle_xz(radius, num_steps=73):
+    """ Filled circle on the x/z plane. """
+    rim = []
+    for i in range(num_steps):
+        a = radians(360. / (num_steps - 1) * i)
+        rim.append((radius * sin(a), 0., radius * cos(a)))
+    return _fan_to_triangles((0., 0., 0.), rim)
@@ -5,7 +5,11 @@ import datetime
 import time
 import math
 
+import numpy
+
 import draw
+import vbo
+import label_cache
 import OpenGL.GL as gl
 from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
 
@@ -37,6 +41,127 @@ def timestamp_to_timestr_short(t):
         return "%i %02i:%02i:%02is" % (t // (60*60*24), t // (60*60) % 24, t // 60 % 60, t % 60)
 
 
+class GraphChannel:
+    """
+    One node attribute from a timeseries.TimeSeriesStore, drawn as a vertical min..max line per pixel column.
+
+    The samples are copied from the ring buffer with summary levels: level k holds the min and max of every block of
+    2**k samples. The range of samples under a pixel column is covered by at most two blocks per level, so a column
+    costs O(log n) and the whole plot a few numpy operations per level, however many samples are in view. The vertex
+    buffer is only rewritten when the view or the samples change.
+    """
+    REBUILD_INTERVAL = 0.5 # seconds. a growing series is copied at most this often.
+
+    def __init__(self, store, node_id, metric, color, label):
+        self.store = store
+        self.node_id = node_id
+        self.metric = metric
+        self.color = color
+        self.label = label
+
+        self.times = None
+        self.mins = [] # numpy float32 arrays. level k has the min of samples i*2**k .. (i+1)*2**k-1
+        self.maxs = []
+        self.vmin = self.vmax = 0. # range of all the samples. the plot is scaled to it.
+        self._version = None
+        self._build_time = 0.
+
+        self.vbo = vbo.DynamicVBO()
+        self._vbo_state = None
+
+    def _get_series(self):
+        return self.store.series.get((self.node_id, self.metric))
+
+    def update(self, now):
+        """ Copy the samples and rebuild the levels if the series has changed. Return True if it did. """
+        series = self._get_series()
+        if series == None or series.version == self._version:
+            return False
+        if self._version != None and now - self._build_time < self.REBUILD_INTERVAL:
+            return False
+        self._version = series.version
+        self._build_time = now
+        self.times, values = series.get_all()
+        self.mins = [values]
+        self.maxs = [values]
+        while len(self.mins[-1]) > 1:
+            a, b = self.mins[-1], self.maxs[-1]
+            n = len(a) // 2 * 2
+            self.mins.append(numpy.minimum(a[0:n:2], a[1:n:2]))
+            self.maxs.append(numpy.maximum(b[0:n:2], b[1:n:2]))
+        if len(values):
+            self.vmin, self.vmax = float(self.mins[-1][0]), float(self.maxs[-1][0])
+            if len(values) % 2 ** (len(self.mins) - 1):
+                # samples not covered by the top level block
+                self.vmin, self.vmax = float(values.min()), float(values.max())
+        return True
+
+    def get_minmax(self, t1, t2, num_pixels, end_time=None):
+        """ Return (mins, maxs, valid) numpy arrays, one per pixel column of the time range t1..t2. A column has the
+        value holding at its left edge and every sample inside it. Columns before the first sample and after end_time
+        are not valid. """
+        mins = numpy.empty(num_pixels, numpy.float32)
+        maxs = numpy.empty(num_pixels, numpy.float32)
+        if self.times is None or not len(self.times):
+            return mins, maxs, numpy.zeros(num_pixels, bool)
+        edges = numpy.linspace(t1, t2, num_pixels + 1)
+        idx = numpy.searchsorted(self.times, edges, "right")
+        lo = numpy.maximum(idx[:-1] - 1, 0)
+        hi = idx[1:].copy()
+        valid = hi > 0
+        if end_time != None:
+            valid &= edges[:-1] <= end_time
+        lo[~valid] = hi[~valid] = 0
+        mins.fill(numpy.inf)
+        maxs.fill(-numpy.inf)
+        # bottom-up range query. lo, hi are in blocks of the current level; the odd ends are taken from this
+        # level and the rest is left to the next one.
+        for lmin, lmax in zip(self.mins, self.maxs):
+            m = (lo < hi) & (lo & 1 == 1)
+            if m.any():
+                i = lo[m]
+                mins[m] = numpy.minimum(mins[m], lmin[i])
+                maxs[m] = numpy.maximum(maxs[m], lmax[i])
+                lo[m] += 1
+            m = (lo < hi) & (hi & 1 == 1)
+            if m.any():
+                i = hi[m] - 1
+                mins[m] = numpy.minimum(mins[m], lmin[i])
+                maxs[m] = numpy.maximum(maxs[m], lmax[i])
+                hi[m] -= 1
+            lo >>= 1
+            hi >>= 1
+            if not (lo < hi).any():
+                break
+        return mins, maxs, valid
+
+    def render(self, x, y, w, h, x2, w2, end_time=None):
+        n = int(w)
+        if n < 1 or w2 <= 0.:
+            return
+        state = (x, y, w, h, x2, w2, end_time, self._version)
+        if state != self._vbo_state:
+            self._vbo_state = state
+            mins, maxs, valid = self.get_minmax(x2, x2 + w2, n, end_time)
+            px = numpy.nonzero(valid)[0]
+            # flat signals in the middle
+            y2 = self.vmin if self.vmax > self.vmin else self.vmin - 1.
+            h2 = self.vmax - y2 if self.vmax > self.vmin else 2.
+            vertices = numpy.empty((len(px), 4), numpy.float32)
+            vertices[:, 0] = x + px + 0.5
+            vertices[:, 2] = vertices[:, 0]
+            vertices[:, 1] = y + h - 0.5 - (h - 1.) / h2 * (mins[px] - y2)
+            vertices[:, 3] = y + h - 0.5 - (h - 1.) / h2 * (maxs[px] - y2)
+            # at least a pixel tall
+            vertices[:, 3] = numpy.minimum(vertices[:, 3], vertices[:, 1] - 1.)
+            self.vbo.update(vertices.reshape(-1, 2))
+        gl.glColor4f(*self.color)
+        self.vbo.draw(gl.GL_LINES)
+
+    def close(self):
+        self.vbo.close()
+
+
 class GraphWindow:
     MIN_VISIBLE_SAMPLESPACE_WIDTH = 0.5
     VISIBLE_SAMPLESPACE_BOUND_X1 = -1.
@@ -49,6 +174,8 @@ class GraphWindow:
         :type graph_renderer: GraphRenderer
         """
         self.font = font
+        # grid times and channel labels
+        self.labels = label_cache.LabelCache(font)
 
         # positions on screen
         self.x, self.y = x, y
@@ -71,6 +198,9 @@ class GraphWindow:
         # wanted visible sample-space rectangle. the visible sample-space rectangle is animated towards this rect.
         self.wanted_visiblesample_x1 = self.visiblesample_x1
         self.wanted_visiblesample_x2 = self.visiblesample_x2
+        # visible sample-space at the previous tick. render() interpolates between these and the current values.
+        self._prev_visiblesample_x1 = self.visiblesample_x1
+        self._prev_visiblesample_x2 = self.visiblesample_x2
 
         self.ax = 0.
 
@@ -86,6 +216,14 @@ class GraphWindow:
 
         self._t = time.time()
 
+        # change tracking. see needs_redraw()
+        self._rendered_state = None
+
+        # rate_pyramid.RatePyramid. the packet rate is drawn under the time grid.
+        self.rate_pyramid = None
+        # [GraphChannel, ..]. drawn over the packet rate, each scaled to its own range.
+        self.channels = []
+
     def place_on_screen(self, x, y, w, h):
         self.x = x
         self.y = y
@@ -107,38 +245,81 @@ class GraphWindow:
         self.totalsample_x2 = d
         self.VISIBLE_SAMPLESPACE_BOUND_X2 = d + 10.
 
+    def set_rate_pyramid(self, pyramid):
+        self.rate_pyramid = pyramid
+
+    def set_channels(self, channels):
+        for ch in self.channels:
+            ch.close()
+        self.channels = channels
+
     def set_sample_visibility(self, visiblesample_x1, visiblesample_x2):
         self.wanted_visiblesample_x1 = self.visiblesample_x1 = visiblesample_x1
         self.wanted_visiblesample_x2 = self.visiblesample_x2 = visiblesample_x2
 
     def tick(self, dt=1./60):
-        # smoothly move the visible sample-space towards the wanted values
-        # NOTE: only tuned for 60fps. could be TERRIBLE on lower fps
+        self._prev_visiblesample_x1 = self.visiblesample_x1
+        self._prev_visiblesample_x2 = self.visiblesample_x2
+
+        # smoothly move the visible sample-space towards the wanted values.
+        # the constants were tuned for 60 ticks per second. k scales them to other tick rates.
+        k = dt * 60.
         if abs(self.wanted_visiblesample_x2 - self.wanted_visiblesample_x1) > 0.0001:
-            self.ax += (abs(self.wanted_visiblesample_x1 - self.visiblesample_x1) + abs(self.wanted_visiblesample_x2 - self.visiblesample_x2)) / abs(self.wanted_visiblesample_x2 - self.wanted_visiblesample_x1) * .02
-        self.ax *= 0.99
+            self.ax += (abs(self.wanted_visiblesample_x1 - self.visiblesample_x1) + abs(self.wanted_visiblesample_x2 - self.visiblesample_x2)) / abs(self.wanted_visiblesample_x2 - self.wanted_visiblesample_x1) * .02 * k
+        self.ax *= 0.99 ** k
         ax = min(self.ax, 1.) if self._smooth_movement else 1
 
-        d = 0.4
+        d = 1. - (1. - 0.4) ** k
         self.visiblesample_x1 += (self.wanted_visiblesample_x1 - self.visiblesample_x1) * d * ax
         self.visiblesample_x2 += (self.wanted_visiblesample_x2 - self.visiblesample_x2) * d * ax
 
+        # snap to the wanted values if closer than a fraction of a pixel. otherwise the animation never
+        # ends and the window would have to be redrawn forever.
+        snap = abs(self.wanted_visiblesample_x2 - self.wanted_visiblesample_x1) * 0.0001
+        if abs(self.wanted_visiblesample_x1 - self.visiblesample_x1) < snap and \
+           abs(self.wanted_visiblesample_x2 - self.visiblesample_x2) < snap:
+            self.visiblesample_x1 = self.wanted_visiblesample_x1
+            self.visiblesample_x2 = self.wanted_visiblesample_x2
+
         self._hold_bounds()
 
-    def render(self):
+    def needs_redraw(self):
+        """ return True if the window would look different if rendered again. """
+        t = self._time()
+        changed = False
+        for ch in self.channels:
+            changed = ch.update(t) or changed
+        return changed or self._rendered_state != self._get_render_state() or \
+               self._prev_visiblesample_x1 != self.visiblesample_x1 or self._prev_visiblesample_x2 != self.visiblesample_x2
+
+    def _get_render_state(self):
+        return self.x, self.y, self.w, self.h, self.visiblesample_x1, self.visiblesample_x2, \
+               self.totalsample_x1, self.totalsample_x2
+
+    def render(self, alpha=1.):
         """ render everything. window edge, scrollbar, legend, and the graph itself. the graph object
-         renders the grid, background, grid text and the graph line """
+         renders the grid, background, grid text and the graph line
+         alpha : 0..1, interpolate the visible sample-space between the previous and the last tick. """
+        self._rendered_state = self._get_render_state()
+        vx1 = self._prev_visiblesample_x1 + (self.visiblesample_x1 - self._prev_visiblesample_x1) * alpha
+        vx2 = self._prev_visiblesample_x2 + (self.visiblesample_x2 - self._prev_visiblesample_x2) * alpha
+
         draw.filled_rect(self.x, self.y, self.w, self.h, (0.0,0.0,0.0,1.))
-        self._render_scrollbar(self.x, self.y+1., self.w, 8)
+        self._render_scrollbar(self.x, self.y+1., self.w, 8, vx1, vx2)
 
         # render oscilloscope window edge
         gl.glPushMatrix()
         gl.glTranslatef(self.x, self.y, 100.)
 #        draw.rect(0.5, 0.5, self.w, self.h, (0.6,0.6,0.6,1.))
-        x2 = self.visiblesample_x1
-        w2 = self.visiblesample_x2 - self.visiblesample_x1
+        x2 = vx1
+        w2 = vx2 - vx1
         # 1. find time values of left/right pixel coordinate
         # 2. calc time values that need a line and draw them using pixel-coordinates
+        if self.rate_pyramid:
+            self._render_rate(0., 10., self.w, self.h-11., x2, w2)
+        for ch in self.channels:
+            ch.update(self._time())
+            ch.render(0., 10., self.w, self.h-11., x2, w2, self.totalsample_x2)
         gl.glColor4f(0.25, 0.25, 0.25, 1.)
         self._render_grid_verlines(0., 10., self.w, self.h-11., x2, w2)
 
@@ -147,6 +328,7 @@ class GraphWindow:
         #gl.glEnable(gl.GL_SCISSOR_TEST)
         self._render_grid_vertext(0., 10., self.w, self.h-11., x2, w2)
         #gl.glDisable(gl.GL_SCISSOR_TEST)
+        self._render_channel_labels(2., self.h-2.)
         gl.glDisable(GL_TEXTURE_2D)
 
         gl.glPopMatrix()
@@ -273,15 +455,15 @@ class GraphWindow:
             self.visiblesample_x1 = self.VISIBLE_SAMPLESPACE_BOUND_X1
             self.visiblesample_x2 = self.VISIBLE_SAMPLESPACE_BOUND_X2
 
-    def _render_scrollbar(self, x, y, w, h):
+    def _render_scrollbar(self, x, y, w, h, visiblesample_x1, visiblesample_x2):
         v = .6
         draw.line(x+0.5, y+h+0.5, x+w+0.5, y+h+0.5, (v,v,v,1.))
 
         if self.totalsample_x2 == self.totalsample_x1:
             return
 
-        x1 = (self.visiblesample_x1 - self.totalsample_x1) / (self.totalsample_x2 - self.totalsample_x1) * w
-        x2 = (self.visiblesample_x2 - self.totalsample_x1) / (self.totalsample_x2 - self.totalsample_x1) * w
+        x1 = (visiblesample_x1 - self.totalsample_x1) / (self.totalsample_x2 - self.totalsample_x1) * w
+        x2 = (visiblesample_x2 - self.totalsample_x1) / (self.totalsample_x2 - self.totalsample_x1) * w
 
         if x2 - x1 < 1.:
             x2 = x1 + 1.
@@ -313,6 +495,41 @@ class GraphWindow:
     def _grid_timestr(self, seconds, step):
         return timestamp_to_timestr_short(seconds)
 
+    def _render_rate(self, x, y, w, h, x2, w2):
+        """ Packets per second as a vertical line per pixel column. Scaled to the highest rate in view. """
+        n = int(w)
+        if n < 1 or w2 <= 0.:
+            return
+        rates = self.rate_pyramid.get_rates(x2, x2 + w2, n)
+        top = rates.max()
+        if top <= 0.:
+            return
+        px = x + numpy.arange(n, dtype=numpy.float32) + 0.5
+        vertices = numpy.empty((n, 4), dtype=numpy.float32)
+        vertices[:, 0] = px
+        vertices[:, 1] = y + h
+        vertices[:, 2] = px
+        vertices[:, 3] = y + h - rates * ((h - 1.) / top)
+
+        gl.glColor4f(0.15, 0.3, 0.45, 1.)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glVertexPointer(2, gl.GL_FLOAT, 0, vertices)
+        gl.glDrawArrays(gl.GL_LINES, 0, n * 2)
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+
+    def _render_channel_labels(self, x, y):
+        """ Channel names and ranges in channel colors, bottom-left. """
+        for ch in reversed(self.channels):
+            if ch.times is None or not len(ch.times):
+                txt = "%s -" % ch.label
+            elif ch.vmin == ch.vmax:
+                txt = "%s %g" % (ch.label, ch.vmin)
+            else:
+                txt = "%s %g..%g" % (ch.label, ch.vmin, ch.vmax)
+            r, g, b, a = ch.color
+            self.labels.draw("bl", txt, x, y, bgcolor=(0., 0., 0., .6), fgcolor=(r, g, b, 1.))
+            y -= self.font.height
+
     def _render_grid_verlines(self, x, y, w, h, x2, w2, min_div_hpix=100.):
         """
         min_div_hpix : minimum division height (grid line distance) in pixels
@@ -388,8 +605,8 @@ class GraphWindow:
         while st < st_end:
             # px = self._samplenum_to_pixel(st * ch.freq, x2, w2, w)
             px = self._samplenum_to_pixel(st, x2, w2, w)
-            txt = self._grid_timestr(st, st_step)
-            self.font.drawtl(txt, x+px - self.font.width(txt)/2. - 0.5, y+1, bgcolor = (c, c, c, .8), fgcolor = (.9, .9, .9, .8))
+            txt = self.labels.format(self._grid_timestr, st, st_step)
+            self.labels.draw("tm", txt, x+px - 0.5, y+1, bgcolor = (c, c, c, .8), fgcolor = (.9, .9, .9, .8))
             st += st_step
 
     def event(self, event):
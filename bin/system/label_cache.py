@@ -0,0 +1,43 @@
+"""
+Labels that are drawn every frame but rarely change - node names, timeline times.
+
+    labels = LabelCache(gltext)
+    txt = labels.format(timestamp_to_timestr_short, t)
+    labels.draw("mm", txt, x, y, bgcolor=(1.,1.,1.,0.), fgcolor=(0.,0.,0.,1.), z=z)
+
+The formatted strings are remembered, so a label that doesn't change isn't formatted again. The glyph quads of
+every string are cached by the font itself (see modules/gltext.py) and the whole frame of text is drawn at once, so
+drawing a cached label is only an offset of its quads.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+
+class LabelCache:
+    MAX_LABELS = 2000 # everything is dropped when more are cached. labels are cheap to rebuild.
+
+    def __init__(self, font):
+        """ font : gltext.GLText """
+        self.font = font
+        self._strings = {} # (func, args): str
+
+    def format(self, func, *args):
+        """ Return func(*args), remembered. func has to return the same string for the same args. """
+        key = (func, args)
+        s = self._strings.get(key)
+        if s == None:
+            if len(self._strings) >= self.MAX_LABELS:
+                self._strings.clear()
+            s = self._strings[key] = func(*args)
+        return s
+
+    def draw(self, align, txt, x, y, bgcolor, fgcolor, z=0.):
+        """ align : suffix of the font draw method. "tl", "mm", "bl", .. """
+        getattr(self.font, "draw" + align)(txt, x, y, bgcolor=bgcolor, fgcolor=fgcolor, z=z)
+
+    def clear(self):
+        self._strings = {}
+
+    def __len__(self):
+        return len(self._strings)
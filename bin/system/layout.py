@@ -0,0 +1,266 @@
+"""
+Force-directed automatic layout of the node graph. Runs incrementally - a few iterations per simulation step inside
+a time budget - so the positions settle over a couple of seconds while everything else keeps running.
+
+Springs pull connected nodes together: a node and its routing parent (the "parent" attr) always, and nodes with
+packet traffic between them (world links) in proportion to the traffic. Every pair of nodes repels. This is the
+Fruchterman-Reingold model; two connected nodes rest at spring_length from each other.
+
+Repulsion is approximated Barnes-Hut style with a quadtree of cells, a far enough cell acting as one body in its
+center of mass. Instead of walking the tree for every node, the tree is evaluated level by level on numpy arrays:
+on every level, a cell is pushed by the cells that are children of its parent cell's neighbours, but not its own
+neighbours - those are split further on the next level. The push is computed once per cell and spread to the nodes
+in it with a first-order correction for their distance from the cell's center of mass. Nodes in neighbouring cells
+of the finest level push each other directly. With a few nodes per finest cell, that costs O(n log n) per
+iteration.
+
+The step length adapts (Yifan Hu, "Efficient and high quality force-directed graph drawing", 2005): it grows while
+the total force keeps getting smaller and shrinks when it doesn't, so a spread out graph is gathered quickly and a
+nearly finished one doesn't oscillate. The layout is settled when the nodes have practically stopped moving.
+
+Positions are on the floor plane, x and z. Pinned nodes (placed by hand) are not moved, but still push and pull.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import math
+import time
+
+import numpy
+
+
+def get_repulsion(pos, k2):
+    """ Return (n, 2) repulsive forces k2 / d between all nodes in pos (n, 2), approximated. """
+    n = len(pos)
+    forces = numpy.zeros((n, 2))
+    if n < 2:
+        return forces
+
+    # about 4 nodes per occupied cell on the finest level. more levels if the nodes cover only a part of the square.
+    num_levels = max(1, min(10, int(math.ceil(math.log(n / 4., 4)))))
+    lo = pos.min(axis=0)
+    size = max((pos.max(axis=0) - lo).max(), 1e-6) * 1.0001
+    while 1:
+        grid = 1 << num_levels
+        cells = numpy.minimum((pos - lo) * (grid / size), grid - 1).astype(numpy.int64)
+        if num_levels >= 10 or n < 8 * len(numpy.unique(cells[:, 1] * grid + cells[:, 0])):
+            break
+        num_levels += 1
+    min_d2 = (size / grid * 0.01) ** 2
+
+    # far field. the push from every cell of the interaction list is computed once per cell, at the center of mass
+    # of the cell, with its gradient for the nodes that are not exactly there.
+    ofs6 = numpy.arange(6)
+    for level in xrange(2, num_levels + 1):
+        g = 1 << level
+        c = cells >> (num_levels - level)
+        flat = c[:, 1] * g + c[:, 0]
+        mass = numpy.bincount(flat, minlength=g * g).astype(numpy.float64)
+        com = numpy.column_stack((numpy.bincount(flat, pos[:, 0], g * g),
+                                  numpy.bincount(flat, pos[:, 1], g * g))) / numpy.maximum(mass, 1.)[:, None]
+
+        # children of the 3x3 cells around the parent, minus the 3x3 cells around the cell itself
+        targets = numpy.nonzero(mass)[0]
+        tx, ty = targets % g, targets // g
+        bx = numpy.repeat((tx >> 1)[:, None] * 2 - 2 + ofs6, 6, axis=1)
+        by = numpy.tile((ty >> 1)[:, None] * 2 - 2 + ofs6, (1, 6))
+        use = (bx >= 0) & (by >= 0) & (bx < g) & (by < g) & \
+              ((numpy.abs(bx - tx[:, None]) > 1) | (numpy.abs(by - ty[:, None]) > 1))
+        sources = numpy.where(use, by * g + bx, 0)
+        m = numpy.where(use, mass[sources], 0.)
+
+        r = com[targets][:, None, :] - com[sources]
+        d2 = numpy.maximum((r ** 2).sum(axis=2), min_d2)
+        f = m * k2 / d2
+        # force m*k2*r/d2 and its derivatives m*k2*(I/d2 - 2*r*r/d2^2)
+        cell_force = (r * f[:, :, None]).sum(axis=1)
+        q = 2. * f / d2
+        jxx = (f - q * r[:, :, 0] ** 2).sum(axis=1)
+        jyy = (f - q * r[:, :, 1] ** 2).sum(axis=1)
+        jxy = (-q * r[:, :, 0] * r[:, :, 1]).sum(axis=1)
+
+        # to the nodes
+        t = numpy.searchsorted(targets, flat)
+        p = pos - com[flat]
+        forces[:, 0] += cell_force[t, 0] + jxx[t] * p[:, 0] + jxy[t] * p[:, 1]
+        forces[:, 1] += cell_force[t, 1] + jxy[t] * p[:, 0] + jyy[t] * p[:, 1]
+
+    # near field. every pair of nodes in neighbouring cells of the finest level, exactly.
+    flat = cells[:, 1] * grid + cells[:, 0]
+    order = numpy.argsort(flat, kind="mergesort")
+    count = numpy.bincount(flat, minlength=grid * grid)
+    start = numpy.cumsum(count) - count
+    nx = cells[:, 0:1] + numpy.array([-1, 0, 1, -1, 0, 1, -1, 0, 1])
+    ny = cells[:, 1:2] + numpy.array([-1, -1, -1, 0, 0, 0, 1, 1, 1])
+    valid = (nx >= 0) & (ny >= 0) & (nx < grid) & (ny < grid)
+    nflat = numpy.where(valid, ny * grid + nx, 0)
+    lengths = numpy.where(valid, count[nflat], 0).ravel()
+    total = lengths.sum()
+    first = numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+    i = numpy.repeat(numpy.arange(n * 9) // 9, lengths)
+    j = order[numpy.repeat(start[nflat].ravel(), lengths) + numpy.arange(total) - first]
+    other = i != j
+    i, j = i[other], j[other]
+
+    r = pos[i] - pos[j]
+    d2 = (r ** 2).sum(axis=1)
+    # nodes on top of each other don't push. give them a nudge in some direction.
+    stuck = d2 < min_d2
+    if stuck.any():
+        angle = (i[stuck] - j[stuck]) * 2.39996
+        r[stuck, 0] = numpy.cos(angle) * math.sqrt(min_d2)
+        r[stuck, 1] = numpy.sin(angle) * math.sqrt(min_d2)
+        d2[stuck] = min_d2
+    f = r * (k2 / d2)[:, None]
+    forces[:, 0] += numpy.bincount(i, f[:, 0], n)
+    forces[:, 1] += numpy.bincount(i, f[:, 1], n)
+    return forces
+
+
+def get_attraction(pos, edges, weights, spring_length):
+    """ Return (n, 2) spring forces w * d^2 / spring_length pulling the ends of every edge together.
+    edges : (e, 2) node indices. weights : (e,) """
+    n = len(pos)
+    if not len(edges):
+        return numpy.zeros((n, 2))
+    i, j = edges[:, 0], edges[:, 1]
+    delta = pos[j] - pos[i]
+    d = numpy.sqrt((delta ** 2).sum(axis=1))
+    # delta / d * w * d^2 / spring_length
+    f = delta * (weights * d / spring_length)[:, None]
+    fx = numpy.bincount(i, f[:, 0], n) - numpy.bincount(j, f[:, 0], n)
+    fy = numpy.bincount(i, f[:, 1], n) - numpy.bincount(j, f[:, 1], n)
+    return numpy.column_stack((fx, fy))
+
+
+class ForceLayout:
+    PARENT_WEIGHT = 1.
+    LINK_WEIGHT = 0.5 # at full traffic
+    LINK_USAGE_SECONDS = 30. # link traffic is averaged over about this long
+    GRAVITY = 0.05 # keeps unconnected nodes from drifting away
+    STEP_FACTOR = 0.9
+    MIN_MOVE = 0.002 # times spring_length. mean move of a node per iteration when the layout is settled
+
+    def __init__(self, spring_length=2., budget_seconds=0.003):
+        self.spring_length = spring_length
+        self.budget_seconds = budget_seconds
+        # longest move of a node in one iteration, in world units
+        self.step = spring_length
+        self._energy = None
+        self._progress = 0
+        self._mean_move = None # of the last iteration
+        self.link_usage = {} # (node_id, node_id): averaged Link._usage, 0..1
+        self._graph_key = None
+        # one iteration of a big graph can take longer than the budget. the overrun is paid back by skipping ticks.
+        self._debt_seconds = 0.
+        self._unused_dt = 0. # time since the springs were last updated
+        self.num_iterations = 0
+
+    def heat(self):
+        """ Start moving again, after the graph changed or the user moved something. """
+        self.step = max(self.step, self.spring_length)
+        self._energy = None
+        self._mean_move = None
+
+    def reset(self):
+        """ Forget the link traffic and start moving again. After seeking; the world can have other nodes and
+        links than the traffic was averaged over. """
+        self.link_usage = {}
+        self._graph_key = None
+        self.heat()
+
+    def is_settled(self):
+        return self._mean_move != None and self._mean_move < self.MIN_MOVE * self.spring_length
+
+    def _update_link_usage(self, world, dt):
+        """ Return {(node_id, node_id): weight} of the springs. """
+        a = min(1., dt / self.LINK_USAGE_SECONDS)
+        usage = self.link_usage
+        for link in world.links:
+            key = (link.node1.node_id, link.node2.node_id)
+            u = usage.get(key, 0.)
+            usage[key] = u + (link._usage / 10. - u) * a
+        springs = {}
+        nodes_dict = world.nodes_dict
+        for key, u in usage.items():
+            # nodes can leave the world on seek
+            if u < 0.01 or key[0] not in nodes_dict or key[1] not in nodes_dict:
+                del usage[key]
+            else:
+                springs[key] = self.LINK_WEIGHT * u
+        for node_id, parent_id in world.routing_tree.parents.iteritems():
+            if parent_id != node_id and node_id in world.nodes_dict and parent_id in world.nodes_dict:
+                key = (node_id, parent_id)
+                springs[key] = springs.get(key, 0.) + self.PARENT_WEIGHT
+        return springs
+
+    def tick(self, world, dt, pinned_node_ids=()):
+        """ Run layout iterations for at most budget_seconds. Moves world.nodes and writes the positions to
+        world.session_node_positions, so they survive seeking and the next start.
+        dt : seconds since the previous tick. pinned_node_ids : nodes that are not moved.
+        Return True if any node moved. """
+        self._unused_dt += dt
+        if self._debt_seconds > 0.:
+            self._debt_seconds -= self.budget_seconds
+            return False
+        # a settled layout only checks once per second if the graph has changed
+        if self.is_settled() and self._unused_dt < 1.:
+            return False
+
+        nodes = world.nodes
+        springs = self._update_link_usage(world, self._unused_dt)
+        self._unused_dt = 0.
+        if not nodes:
+            return False
+        graph_key = (len(nodes), frozenset(k for k, w in springs.iteritems() if w >= self.PARENT_WEIGHT))
+        if graph_key != self._graph_key:
+            self._graph_key = graph_key
+            self.heat()
+        if self.is_settled():
+            return False
+
+        index = dict((node.node_id, i) for i, node in enumerate(nodes))
+        pos = numpy.array([(node.pos[0], node.pos[2]) for node in nodes], dtype=numpy.float64)
+        movable = numpy.array([node.node_id not in pinned_node_ids for node in nodes])
+        edges = numpy.array([(index[a], index[b]) for a, b in springs], dtype=numpy.int64).reshape(-1, 2)
+        weights = numpy.array(springs.values(), dtype=numpy.float64)
+
+        k = self.spring_length
+        t_start = t = time.time()
+        while 1:
+            t_iteration = t
+            center = pos.mean(axis=0)
+            forces = get_repulsion(pos, k * k) + get_attraction(pos, edges, weights, k)
+            d = pos - center
+            forces -= d * (self.GRAVITY * numpy.sqrt((d ** 2).sum(axis=1)) / k)[:, None]
+            # move along the force, but no longer than the step
+            f = numpy.sqrt((forces ** 2).sum(axis=1))
+            move = numpy.minimum(f, self.step) * movable
+            pos += forces * (move / numpy.maximum(f, 1e-12))[:, None]
+            self._mean_move = move.mean()
+            self.num_iterations += 1
+
+            energy = (f * f * movable).sum()
+            if self._energy != None and energy < self._energy:
+                self._progress += 1
+                if self._progress >= 5:
+                    self._progress = 0
+                    self.step /= self.STEP_FACTOR
+            else:
+                self._progress = 0
+                self.step *= self.STEP_FACTOR
+            self._energy = energy
+
+            # stop if the next iteration wouldn't fit in the budget
+            t = time.time()
+            if self.is_settled() or t + (t - t_iteration) - t_start > self.budget_seconds:
+                break
+        self._debt_seconds = t - t_start - self.budget_seconds
+
+        for node, (x, z) in zip(nodes, pos):
+            if node.node_id not in pinned_node_ids:
+                p = (x, node.pos[1], z)
+                node.pos.set(p)
+                world.session_node_positions[node.node_id] = p
+        return True
@@ -0,0 +1,175 @@
+"""
+Traffic and retry statistics of every link and node over a sliding time window.
+
+Counts are kept in BUCKET_SECONDS buckets per link and node, only for buckets that got packets. A packet adds to the
+bucket of its timestamp and to the running totals; buckets that fall out of the window are subtracted from the
+totals when the window moves past them. So a packet and a query cost O(1) amortized, not O(window).
+
+Links are directed here: (sender, receiver). get_link_pair() adds up both directions, like world.links does.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import collections
+
+
+# counter fields
+SENDS = 0      # send_done events. one per packet sent, retries included in the one event
+RETRIES = 1    # sum of retry_count
+ACKED = 2
+CONGESTED = 3
+DROPPED = 4
+PACKETS = 5    # send_ctp_packet events
+ORIGINATED = 6 # send_ctp_packet events of packets the sender created itself. nodes only
+NUM_FIELDS = 7
+
+
+class _Window:
+    def __init__(self, num_buckets):
+        self.num_buckets = num_buckets
+        self.buckets = collections.deque() # [bucket_id, [count, ..]] of buckets that have counts, oldest first
+        self.totals = [0] * NUM_FIELDS
+
+    def expire(self, bucket_id):
+        """ Remove buckets older than the window that ends at bucket_id from the totals. """
+        first = bucket_id - self.num_buckets + 1
+        buckets = self.buckets
+        totals = self.totals
+        while buckets and buckets[0][0] < first:
+            counts = buckets.popleft()[1]
+            for f in xrange(NUM_FIELDS):
+                totals[f] -= counts[f]
+
+    def add(self, bucket_id, values):
+        """ values : [(field, n), ..] """
+        buckets = self.buckets
+        if buckets and buckets[0][0] <= bucket_id - self.num_buckets:
+            self.expire(bucket_id)
+        if buckets and buckets[-1][0] == bucket_id:
+            counts = buckets[-1][1]
+        elif not buckets or buckets[-1][0] < bucket_id:
+            counts = [0] * NUM_FIELDS
+            buckets.append([bucket_id, counts])
+        else:
+            # an older bucket. rare; packets are mostly sorted.
+            if bucket_id <= buckets[-1][0] - self.num_buckets:
+                # older than the window
+                return
+            i = len(buckets) - 1
+            while i >= 0 and buckets[i][0] > bucket_id:
+                i -= 1
+            if i >= 0 and buckets[i][0] == bucket_id:
+                counts = buckets[i][1]
+            else:
+                counts = [0] * NUM_FIELDS
+                # deque.insert() is python 3.5+
+                num_after = len(buckets) - i - 1
+                buckets.rotate(num_after)
+                buckets.append([bucket_id, counts])
+                buckets.rotate(-num_after)
+        totals = self.totals
+        for f, n in values:
+            counts[f] += n
+            totals[f] += n
+
+
+class LinkStats:
+    BUCKET_SECONDS = 1.
+
+    def __init__(self, window_seconds=60.):
+        self.window_seconds = window_seconds
+        self.num_buckets = max(1, int(round(window_seconds / self.BUCKET_SECONDS)))
+        self.links = {} # (src_node_id, dst_node_id): _Window
+        self.nodes = {} # node_id: _Window
+        self.time = None # timestamp of the newest packet. the window ends here.
+
+    def clear(self):
+        self.links = {}
+        self.nodes = {}
+        self.time = None
+
+    def _add(self, timestamp, node_id, dst_node_id, values):
+        if self.time == None or timestamp > self.time:
+            self.time = timestamp
+        bucket_id = int(timestamp // self.BUCKET_SECONDS)
+        w = self.nodes.get(node_id)
+        if w == None:
+            w = self.nodes[node_id] = _Window(self.num_buckets)
+        w.add(bucket_id, values)
+        if dst_node_id != None:
+            if values[-1][0] == ORIGINATED:
+                values = values[:-1]
+            w = self.links.get((node_id, dst_node_id))
+            if w == None:
+                w = self.links[(node_id, dst_node_id)] = _Window(self.num_buckets)
+            w.add(bucket_id, values)
+
+    def add_send_done(self, timestamp, node_id, dst_node_id, retry_count, acked, congested, dropped):
+        values = [(SENDS, 1)]
+        if retry_count:
+            values.append((RETRIES, retry_count))
+        if acked:
+            values.append((ACKED, 1))
+        if congested:
+            values.append((CONGESTED, 1))
+        if dropped:
+            values.append((DROPPED, 1))
+        self._add(timestamp, node_id, dst_node_id if dst_node_id != 0xFFFF else None, values)
+
+    def add_ctp_packet(self, timestamp, node_id, dst_node_id, origin_node_id):
+        # ORIGINATED has to be last. see _add()
+        if origin_node_id == node_id:
+            values = [(PACKETS, 1), (ORIGINATED, 1)]
+        else:
+            values = [(PACKETS, 1)]
+        self._add(timestamp, node_id, dst_node_id, values)
+
+    def _get_totals(self, w):
+        if w == None:
+            return None
+        w.expire(int(self.time // self.BUCKET_SECONDS))
+        return w.totals
+
+    def _summary(self, totals):
+        """ Return {"packets_per_second", "sends_per_second", "retry_rate", "ack_ratio", "congested", "dropped",
+        "originated"} from counter totals. retry_rate is retries per send; rates without sends are None. """
+        if not totals or not any(totals):
+            return None
+        sends = totals[SENDS]
+        return {
+            "packets_per_second": totals[PACKETS] / self.window_seconds,
+            "sends_per_second": sends / self.window_seconds,
+            "retry_rate": float(totals[RETRIES]) / sends if sends else None,
+            "ack_ratio": float(totals[ACKED]) / sends if sends else None,
+            "congested": totals[CONGESTED],
+            "dropped": totals[DROPPED],
+            "originated": totals[ORIGINATED],
+        }
+
+    def get_node(self, node_id):
+        """ Return the summary of everything node_id sent during the window, None if nothing. """
+        return self._summary(self._get_totals(self.nodes.get(node_id)))
+
+    def get_link(self, src_node_id, dst_node_id):
+        """ Return the summary of one direction of a link, None if nothing was sent during the window. """
+        return self._summary(self._get_totals(self.links.get((src_node_id, dst_node_id))))
+
+    def get_link_pair(self, node1_id, node2_id):
+        """ Return the summary of both directions of a link together. """
+        t1 = self._get_totals(self.links.get((node1_id, node2_id)))
+        t2 = self._get_totals(self.links.get((node2_id, node1_id)))
+        if t1 and t2:
+            return self._summary([a + b for a, b in zip(t1, t2)])
+        return self._summary(t1 or t2)
+
+    def get_retry_rate(self, node1_id, node2_id):
+        """ Return retries per send over both directions of a link, None if nothing was sent. Cheaper than
+        get_link_pair(); for coloring every link every frame. """
+        sends = retries = 0
+        for key in ((node1_id, node2_id), (node2_id, node1_id)):
+            totals = self._get_totals(self.links.get(key))
+            if totals:
+                sends += totals[SENDS]
+                retries += totals[RETRIES]
+        return float(retries) / sends if sends else None
@@ -2,11 +2,16 @@ import os
 import sys
 import time
 import math
+import Queue
+import atexit
 import logging
 import logging.handlers
+import threading
+import traceback
 
 
 _console_logger = None
+_listener = None
 
 
 def start_logging_system(log_folder, log_filename="log.txt"):
@@ -23,14 +28,18 @@ def start_logging_system(log_folder, log_filename="log.txt"):
     log_globalfile = logging.handlers.TimedRotatingFileHandler(os.path.join(log_folder, log_filename), "midnight", utc=True) # backupCount=7
     log_globalfile.setFormatter(logformat)
 
-    # conf the root logger to output everything both to console
-    rootlogger = logging.getLogger()
-    rootlogger.addHandler(log_globalfile)
-
     global _console_logger
     _console_logger = logging.StreamHandler()
     _console_logger.setFormatter(logformat)
-    rootlogger.addHandler(_console_logger)
+
+    # conf the root logger to output everything both to file and console. the writing happens in a background
+    # thread, so a burst of log lines doesn't stall the render loop.
+    global _listener
+    _listener = QueueListener([log_globalfile, _console_logger])
+    _listener.start()
+    atexit.register(_listener.stop)
+    rootlogger = logging.getLogger()
+    rootlogger.addHandler(QueueHandler(_listener.queue))
 
     rootlogger.setLevel(logging.NOTSET)
     # This line has to exist, because sometimes we could get the following error after redirecting all of stdout
@@ -45,9 +54,150 @@ def start_logging_system(log_folder, log_filename="log.txt"):
 
 
 def remove_console_logger():
-    rootlogger = logging.getLogger()
     # _console_logger.disabled = True also works?
-    rootlogger.removeHandler(_console_logger)
+    _listener.remove_handler(_console_logger)
+
+
+def flush_rate_limited_loggers():
+    """ Log the summaries of all RateLimitedLogger periods that have ended. """
+    for logger in list(_rate_limited_loggers):
+        logger.flush()
+
+#
+# ---------------------------------------------------------------------------
+#
+
+
+class QueueHandler(logging.Handler):
+    """ Puts records to a queue for QueueListener. Formatting the record happens in the listener thread. """
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        # args can be objects that change after this call. format the message here, but leave the rest for the
+        # listener. tracebacks have to be formatted here too, before the frames go away.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        self.queue.put_nowait(record)
+
+
+class QueueListener:
+    """ Background thread that passes records from a QueueHandler to the real handlers. Also logs the
+    RateLimitedLogger summaries once per second, even if nothing else is logged. """
+    def __init__(self, handlers):
+        self.queue = Queue.Queue()
+        self.handlers = list(handlers)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """ Write out everything in the queue and stop the thread. """
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def remove_handler(self, handler):
+        with self.lock:
+            if handler in self.handlers:
+                self.handlers.remove(handler)
+
+    def _run(self):
+        next_flush_time = time.time() + 1.
+        while 1:
+            try:
+                record = self.queue.get(timeout=max(0., next_flush_time - time.time()))
+            except Queue.Empty:
+                record = False
+            if record is None:
+                break
+            if time.time() >= next_flush_time:
+                next_flush_time = time.time() + 1.
+                # only puts new records to the queue
+                flush_rate_limited_loggers()
+            if record:
+                with self.lock:
+                    handlers = list(self.handlers)
+                for handler in handlers:
+                    try:
+                        if record.levelno >= handler.level:
+                            handler.handle(record)
+                    except Exception:
+                        # handleError reraises. a dead log thread would lose everything after this, so only report.
+                        traceback.print_exc(file=sys.__stderr__)
+
+
+_rate_limited_loggers = set()
+
+
+class RateLimitedLogger:
+    """
+    For messages that can come in floods, like a warning for every packet. Wraps a logger; the first message with a
+    given level and format string is logged as usual, then for period_seconds the same ones are only counted. When
+    the period ends, a "N similar in last 10 s" line with the last of them is logged instead.
+
+        llog_limited = logging_setup.RateLimitedLogger(llog)
+        llog_limited.warning("overwriting timestamp (%.2f s) for packet: %s", dt, packet)
+    """
+    def __init__(self, logger, period_seconds=10.):
+        self.logger = logger
+        self.period_seconds = period_seconds
+        # (level, msg): [period end time, num suppressed, args of the last suppressed]
+        self.periods = {}
+        self.lock = threading.Lock()
+        _rate_limited_loggers.add(self)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(logging.WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(logging.ERROR, msg, *args)
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        t = time.time()
+        key = (level, msg)
+        with self.lock:
+            period = self.periods.get(key)
+            if period and t < period[0]:
+                period[1] += 1
+                period[2] = args
+                return
+            self.periods[key] = [t + self.period_seconds, 0, None]
+        if period and period[1]:
+            self._log_summary(key, period)
+        self.logger.log(level, msg, *args)
+
+    def flush(self):
+        """ Log the summaries of periods that have ended. Called once per second by the log writer thread. """
+        t = time.time()
+        with self.lock:
+            ended = [(key, period) for key, period in self.periods.iteritems() if t >= period[0]]
+            for key, period in ended:
+                del self.periods[key]
+        for key, period in ended:
+            if period[1]:
+                self._log_summary(key, period)
+
+    def _log_summary(self, key, period):
+        level, msg = key
+        self.logger.log(level, "%i similar in last %g s. last: " + msg, period[1], self.period_seconds, *period[2])
 
 #
 # ---------------------------------------------------------------------------
@@ -91,6 +241,9 @@ class MiscFormatter(logging.Formatter):
         return logging.Formatter.format(self, record)
 
 
+_exc_formatter = logging.Formatter()
+
+
 # last line of unsolicited stdout defence.
 # catch stdout and redirect to log.
 class StdLogger:
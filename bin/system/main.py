@@ -76,7 +76,6 @@ def main(py_path, log_path):
 
 
 import ctypes
-from PIL import Image
 
 from OpenGL.GL import *
 from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
@@ -84,6 +83,8 @@ from copenglconstants import * # import to silence opengl enum errors for pychar
 from sdl2 import *
 
 import main_window
+import fps_counter
+import screenshot
 
 
 class Main:
@@ -93,12 +94,18 @@ class Main:
         self.context = None
         self.keys = None
         self.main_window = None
+        self.screenshotter = None
+        self.idle_counter = fps_counter.IdleCounter()
 
         # make so that the first screenshot is saved after 2 minutes, but all later with AUTOSCREENSHOT_PERIOD.
         self.AUTOSCREENSHOT_PERIOD = 5.*60
         self.t_last_autoscreenshot = time.time() - self.AUTOSCREENSHOT_PERIOD + 2.*60
 
     def close(self):
+        llog.info("main loop was idle %.1f%% of the time", self.idle_counter.total_idle_percent)
+        if self.screenshotter:
+            # gl context is already gone. just let the worker finish writing.
+            self.screenshotter.writer.close()
         if self.main_window:
             self.main_window.close()
 
@@ -109,11 +116,25 @@ class Main:
         prev_frame_time = time.time()
 
         event = SDL_Event()
+        profiler = self.main_window.profiler
         while not do_quit:
 
+            # nothing on screen is going to change? then sleep until an sdl event arrives instead of redrawing
+            # every vsync. network packets don't generate sdl events, so wake up periodically to poll for them.
+            if not self.main_window.needs_redraw():
+                t = time.time()
+                profiler.start("idle")
+                SDL_WaitEventTimeout(None, int(self.conf.idle_wait_seconds * 1000))
+                profiler.stop("idle")
+                self.idle_counter.add_idle(time.time() - t)
+
             t = time.time()
             time_elapsed = t - prev_frame_time
 
+            # pixels of a screenshot taken in the previous frame are ready by now
+            self.screenshotter.tick()
+
+            profiler.start("events")
             while SDL_PollEvent(ctypes.byref(event)) != 0:
 
                 if event.type == SDL_KEYDOWN:
@@ -125,18 +146,31 @@ class Main:
 
                 if self.main_window.event(event):
                     do_quit = True
+            profiler.stop("events")
 
-            self.main_window.tick(time_elapsed, self.keys)
-
+            # the screenshot is read from the backbuffer, so force a redraw on autoscreenshot frames.
+            autoscreenshot = t > self.t_last_autoscreenshot + self.AUTOSCREENSHOT_PERIOD
 
-            if t > self.t_last_autoscreenshot + self.AUTOSCREENSHOT_PERIOD:
-                self.t_last_autoscreenshot = t
-                self.save_screenshot("autoscreenshot_")
+            self.main_window.idle_percent = self.idle_counter.idle_percent
+            if self.main_window.tick(time_elapsed, self.keys, force_redraw=autoscreenshot):
 
+                if autoscreenshot:
+                    self.t_last_autoscreenshot = t
+                    profiler.start("screenshot")
+                    self.save_screenshot("autoscreenshot_")
+                    profiler.stop("screenshot")
 
-            SDL_GL_SwapWindow(self.screen)
+                # includes waiting for vsync
+                profiler.start("swap")
+                SDL_GL_SwapWindow(self.screen)
+                profiler.stop("swap")
 
+            self.idle_counter.tick(time_elapsed)
             prev_frame_time = t
+            profiler.finish_frame()
+
+        self.screenshotter.close()
+        self.screenshotter = None
 
         SDL_GL_DeleteContext(self.context)
         SDL_DestroyWindow(self.screen)
@@ -181,21 +215,12 @@ class Main:
         self.keys = SDL_GetKeyboardState(None)
 
         self.main_window = main_window.MainWindow(w, h, self.conf)
+        self.screenshotter = screenshot.Screenshotter("../screenshots", self.conf.screenshot_queue_size)
 
     def save_screenshot(self, filename_prefix="screenshot_"):
-        """saves screenshots/filename_prefix20090404_120211_utc.png"""
-        utc = time.gmtime(time.time())
-        filename = filename_prefix + "%04i%02i%02i_%02i%02i%02i_utc.png" % \
-                   (utc.tm_year, utc.tm_mon, utc.tm_mday,                  \
-                    utc.tm_hour, utc.tm_min, utc.tm_sec)
-        llog.info("saving screenshot '%s'", filename)
-
+        """saves screenshots/filename_prefix20090404_120211_utc.png. reads the back buffer, so call before swap.
+        the file is written in the background a bit later."""
         w, h = ctypes.c_int(), ctypes.c_int()
         SDL_GetWindowSize(self.screen, ctypes.byref(w), ctypes.byref(h))
-        w, h = w.value, h.value
-        pixels = (ctypes.c_ubyte * (3 * w * h))()
-
-        glReadPixels(0, 0, w, h, GL_RGB, GL_UNSIGNED_BYTE, pixels);
-        i = Image.frombuffer('RGB', (w, h), pixels, 'raw', 'RGB', 0, -1)
-        i.save("../screenshots/" + filename)
+        self.screenshotter.capture(w.value, h.value, filename_prefix)
 
@@ -19,6 +19,8 @@ import floor
 import coordinate_system
 import vector
 import fps_counter
+import timestep
+import frame_profiler
 import node_editor
 import nugui
 
@@ -78,6 +80,21 @@ class MainWindow:
         self.mouse_dragging = False
 
         self.fps_counter = fps_counter.FpsCounter()
+        # per-phase frame timers. the hud graph is toggled with F3.
+        self.profiler = frame_profiler.FrameProfiler(
+            os.path.join(conf.path_log, "frame_profile.log") if conf.frame_profiler_log else None,
+            enabled=conf.frame_profiler)
+        self.profiler_hud_visible = conf.frame_profiler and conf.frame_profiler_hud
+        self.timestep = timestep.FixedTimestep(conf.simulation_step_seconds, conf.simulation_max_steps_per_frame)
+        # set from outside by the main loop. shown on the hud.
+        self.idle_percent = 0.
+
+        # change tracking. a frame is rendered only if something visible has changed since the last rendered frame.
+        self._redraw_needed = True # set by events
+        self._controls_active = False # camera is moved by held-down keys
+        self._rendered_view_state = None
+        self._rendered_hud_state = None
+        self._dt_since_render = 0.
 
         self._init_gl()
 
@@ -85,10 +102,12 @@ class MainWindow:
         #self._set_pixel_projection(w, h)
         self.gltext = gltext.GLText(os.path.join(self.conf.path_data, "font_proggy_opti_small.txt"))
         self.gltext.init()
+        if self.profiler.enabled:
+            self.gltext = frame_profiler.ProfiledFont(self.gltext, self.profiler, "gltext")
 
         self.nugui = nugui.NuGui(self.gltext)
 
-        self.node_editor = node_editor.NodeEditor(self.nugui, self, self.gltext, conf)
+        self.node_editor = node_editor.NodeEditor(self.nugui, self, self.gltext, conf, self.profiler)
 
     #@staticmethod
     def _init_gl(self):
@@ -105,15 +124,49 @@ class MainWindow:
         glEnable(GL_LINE_SMOOTH)
         glDisable(GL_LINE_STIPPLE)
 
-    def tick(self, dt, keys):
+    def tick(self, dt, keys, force_redraw=False):
         """
-        @param t: timestamp of the call
+        @param dt: seconds since the previous call
         @param keys:
+        @param force_redraw: render a new frame even if nothing has changed
+        Return True if a new frame was rendered and the window needs a buffer swap.
         """
+        self._dt_since_render += dt
+        # camera movement is user interface, not simulation. use the real frame time for that.
+        self.profiler.start("controls")
         self.handle_controls(dt, keys)
-        self.node_editor.tick(dt, keys)
-        self.render(dt)
+        self.profiler.stop("controls")
+        for i in range(self.timestep.advance(dt)):
+            self.node_editor.tick(self.timestep.step_seconds, keys)
+
+        if not force_redraw and not self.needs_redraw():
+            return False
+
+        self.profiler.start("render")
+        self.render(self._dt_since_render)
         self.nugui.tick()
+        self.profiler.stop("render")
+        self._dt_since_render = 0.
+        self._redraw_needed = False
+        self._rendered_view_state = self._get_view_state()
+        self._rendered_hud_state = self._get_hud_state()
+        return True
+
+    def needs_redraw(self):
+        """ Return True if something on screen would change if a new frame was rendered. """
+        # the profiler graph changes every frame
+        return self._redraw_needed or self._controls_active or self.profiler_hud_visible or \
+               self._rendered_view_state != self._get_view_state() or \
+               self._rendered_hud_state != self._get_hud_state() or \
+               self.nugui.needs_redraw() or self.node_editor.needs_redraw()
+
+    def _get_view_state(self):
+        """ Everything about the camera that affects the rendered image. """
+        p = self.camera_ocs.pos
+        return p[0], p[1], p[2], self.camera.orthox, self.camera.orthoy, self.w_pixels, self.h_pixels
+
+    def _get_hud_state(self):
+        return int(round(self.fps_counter.fps)), int(round(self.idle_percent))
 
     def render(self, dt):
         self.fps_counter.tick(dt)
@@ -157,9 +210,12 @@ class MainWindow:
         glDisable(GL_DEPTH_TEST)
         glDisable(GL_TEXTURE_2D)
 
+        self.profiler.start("floor")
         self.floor.render()
+        self.profiler.stop("floor")
 
-        self.node_editor.render()
+        # interpolate between the last two simulation steps
+        self.node_editor.render(self.timestep.alpha)
 
         # render text and 2D overlay
 
@@ -172,7 +228,7 @@ class MainWindow:
         glDisable(GL_DEPTH_TEST)
         glLineWidth(1.)
 
-        self.node_editor.render_overlay(self.camera, self.camera_ocs, self.camera.ORTHOGONAL, self.w_pixels, self.h_pixels)
+        self.node_editor.render_overlay(self.camera, self.camera_ocs, self.camera.ORTHOGONAL, self.w_pixels, self.h_pixels, self.timestep.alpha)
 
 
         #glScale(40., 40., 1.)
@@ -185,9 +241,12 @@ class MainWindow:
         #if keys[K_UP]:    p.acc += speed * t
         #if keys[K_DOWN]:  p.acc -= speed * t
 
+        self.profiler.start("hud")
         self.render_hud_text()
         self.render_handle_gui()
+        self.profiler.stop("hud")
         self.nugui.finish_frame()
+        self.gltext.flush()
 
     def render_handle_gui(self):
         glEnable(GL_TEXTURE_2D)
@@ -226,10 +285,19 @@ class MainWindow:
         #     mouse_x, mouse_y = 0., 0.
         # t.drawtl(" mouse coord: %6.2f %6.2f " % (mouse_x, mouse_y), 5, 5, bgcolor=(1.0,1.0,1.0,.9), fgcolor=(0.,0.,0.,1.), z=100.)
 
-        t.drawbr("fps: %.0f" % (self.fps_counter.fps), self.w_pixels, self.h_pixels,
+        t.drawbr("fps: %.0f idle: %.0f%%" % (self.fps_counter.fps, self.idle_percent), self.w_pixels, self.h_pixels,
                  fgcolor = (0., 0., 0., 1.), bgcolor = (0.7, 0.7, 0.7, .9), z = 100.)
 
+        if self.profiler_hud_visible:
+            # 120 px high graph, 50 ms per full height, right above the fps text
+            graph_w = self.profiler.history_len * 2.
+            self.profiler.render_graph(t, self.w_pixels - graph_w - 5., self.h_pixels - t.height - 5., 120.)
+            glEnable(GL_TEXTURE_2D)
+
     def event(self, event):
+        # mouse hover, widget states, window size.. almost every event can change the picture.
+        self._redraw_needed = True
+
         if event.type == SDL_WINDOWEVENT:
             if event.window.event == SDL_WINDOWEVENT_RESIZED:
                 llog.info("event window resized to %ix%i", event.window.data1, event.window.data2)
@@ -295,6 +363,8 @@ class MainWindow:
                 self._zoom_view(self.mouse_x, self.mouse_y, self.mouse_zoom_speed * event.wheel.y)
 
         elif event.type == SDL_KEYDOWN:
+            if event.key.keysym.scancode == SDL_SCANCODE_F3 and self.profiler.enabled:
+                self.profiler_hud_visible = not self.profiler_hud_visible
             self.nugui.event(event)
         else:
             #llog.info("event! type %s", event.type)
@@ -326,6 +396,8 @@ class MainWindow:
         """Continuous (as opposed to event-based) UI control. Move the camera (or other objects?) according to
         what keys are being held down."""
 
+        self._controls_active = False
+
         if not self.node_editor.is_world_move_allowed():
             return
 
@@ -371,6 +443,7 @@ class MainWindow:
 
         if c:
             self.mouse_floor_coord = self.get_pixel_floor_coord(self.mouse_x, self.mouse_y)
+        self._controls_active = c
 
     def get_pixel_floor_coord(self, x, y):
         #start, direction = self.camera.window_ray(self.camera.PERSPECTIVE, self.w_pixels, self.h_pixels, x, y)
@@ -390,3 +463,4 @@ class MainWindow:
 
     def close(self):
         self.node_editor.close()
+        self.profiler.close()
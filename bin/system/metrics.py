@@ -0,0 +1,151 @@
+"""
+Health metrics of the ingest pipeline, readable without the gui.
+
+Sources are functions that are called periodically from the main thread. Every source adds the current values of
+its counters/gauges to a MetricsSnapshot. The snapshot is written as prometheus text format to a file (rewritten
+atomically, so a reader never sees a half-written file) and optionally served over http from a background thread:
+
+    exporter = MetricsExporter("../log/metrics.prom", period_seconds=5., http_port=9101)
+    exporter.add_source(lambda m: m.add("packets_received_total", n, "counter", "received packets"))
+    while 1:
+        exporter.tick()
+
+    curl http://127.0.0.1:9101/metrics
+
+The http thread only serves the last formatted text and never touches the program state. If the main loop hangs,
+the values stop changing - alert on sensed_metrics_timestamp_seconds.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import os
+import sys
+import time
+import threading
+import BaseHTTPServer
+
+
+class MetricsSnapshot:
+    PREFIX = "sensed_"
+
+    def __init__(self):
+        self.metrics = [] # [(name, type, help), ..] in order of first appearance
+        self.samples = {} # name: [(labels, value), ..]
+
+    def add(self, name, value, mtype="gauge", help="", labels=None):
+        """ mtype : "gauge" or "counter". counters should only ever grow and end with _total.
+        labels : {label_name: label_value} """
+        name = self.PREFIX + name
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = []
+            self.metrics.append((name, mtype, help))
+        samples.append((labels, value))
+
+    def format(self):
+        """ Return everything in prometheus text exposition format. """
+        lines = []
+        for name, mtype, help in self.metrics:
+            if help:
+                lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, mtype))
+            for labels, value in self.samples[name]:
+                if labels:
+                    l = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in sorted(labels.items()))
+                    lines.append("%s{%s} %s" % (name, l, _format_value(value)))
+                else:
+                    lines.append("%s %s" % (name, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class _MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        text = self.server.exporter.text
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format, *args):
+        # default implementation writes every request to stderr
+        pass
+
+
+class MetricsExporter:
+    def __init__(self, filename=None, period_seconds=5., http_port=0):
+        """ filename : rewrite this file every period_seconds. None to disable.
+        http_port : serve the metrics on 127.0.0.1:http_port. 0 to disable. """
+        self.filename = filename
+        self.period_seconds = period_seconds
+        self.sources = [] # functions source(snapshot)
+        self.text = "" # last formatted snapshot. read by the http thread.
+        self._last_export_time = None
+        self._server = None
+        self._server_thread = None
+
+        if http_port:
+            try:
+                self._server = BaseHTTPServer.HTTPServer(("127.0.0.1", http_port), _MetricsRequestHandler)
+            except Exception:
+                llog.exception("could not start the metrics http server on port %i", http_port)
+            else:
+                self._server.exporter = self
+                self._server_thread = threading.Thread(target=self._server.serve_forever, name="metrics http")
+                self._server_thread.daemon = True
+                self._server_thread.start()
+                llog.info("serving metrics on http://127.0.0.1:%i/metrics", http_port)
+
+    def add_source(self, source):
+        self.sources.append(source)
+
+    def tick(self):
+        """ Call often. Exports the metrics if period_seconds has passed. """
+        t = time.time()
+        if self._last_export_time is None or t - self._last_export_time >= self.period_seconds:
+            self._last_export_time = t
+            self.export()
+
+    def export(self):
+        m = MetricsSnapshot()
+        m.add("metrics_timestamp_seconds", time.time(), "gauge", "unix time of the last metrics update")
+        for source in self.sources:
+            try:
+                source(m)
+            except Exception:
+                llog.exception("metrics source failed")
+        # replacing the reference is atomic. the http thread sees either the old or the new text.
+        self.text = m.format()
+        if self.filename:
+            self._write_file(self.text)
+
+    def _write_file(self, text):
+        tmp_filename = self.filename + ".tmp"
+        try:
+            with open(tmp_filename, "wb") as f:
+                f.write(text)
+            if sys.platform == "win32" and os.path.exists(self.filename):
+                # rename doesn't overwrite on windows
+                os.remove(self.filename)
+            os.rename(tmp_filename, self.filename)
+        except (IOError, OSError):
+            llog.exception("writing metrics file '%s' failed. disabling the metrics file", self.filename)
+            self.filename = None
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -1,43 +1,251 @@
-import sys
+"""
+Bitmap font renderer. Draws text from a font atlas made with the Fluid Studios Font Generation Tool (a png and a txt
+of glyph rectangles, see data/font_proggy_opti_small.*).
 
+    t = GLText("data/font_proggy_opti_small.txt")
+    t.init() # after the opengl context exists
+    ...
+    t.drawtl("hello", 5, 5, bgcolor=(1.,1.,1.,.9), fgcolor=(0.,0.,0.,1.), z=100.)
+    t.drawbr("world", w - 5, h - 5) # colors and z default to the previous ones
+    ...
+    t.flush() # once per frame, before the picture is shown or read
 
-# TODO: this is not a foolproof way to detect 64-bit python. at least not under windows.
-_64bit = sys.maxsize == 0x7fffffffffffffff
+Draw calls only collect the text; flush() draws everything collected with one vertex array and one draw call. The
+modelview matrix of every draw call is remembered, but the projection has to be the same for all the text of a
+flush, and text is drawn over whatever was drawn after it but before the flush. Call flush() where text has to go
+under later drawing.
 
-# python 2.6.x
-if 0x2060000 <= sys.hexversion < 0x2070000:
-    if   sys.platform == "linux2" and _64bit:
-        from linux_py26_64.gltext import *
+Positions are rounded to whole pixels. Glyph layouts of strings are cached, so a string drawn every frame costs
+an offset and a few list appends.
+"""
 
-    elif sys.platform == "linux2":
-        from linux_py26_32.gltext import *
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
 
-    elif sys.platform == "darwin":
-        from macosx_py26.gltext import *
+import os
+import math
+import ctypes
 
-    elif sys.platform == "win32" and _64bit:
-        from windows_py26_64.gltext import *
+import numpy
+from PIL import Image
 
-    else:
-        raise RuntimeError, "unsupported platform '%s'" % sys.platform
+from OpenGL.GL import *
+# the wrapped glGetFloatv allocates a new array every call. the modelview is read on every draw call.
+from OpenGL.raw.GL.VERSION.GL_1_0 import glGetFloatv as _raw_glGetFloatv
 
-# python 2.7.x
-elif 0x2070000 <= sys.hexversion < 0x2080000:
-    if   sys.platform == "linux2" and _64bit:
-        from linux_py27_64.gltext import *
 
-    elif sys.platform == "linux2":
-        from linux_py27_32.gltext import *
+class GLText:
+    MAX_CACHED_LAYOUTS = 4096
 
-    elif sys.platform == "darwin":
-        from macosx_py27.gltext import *
+    def __init__(self, filename):
+        """ filename : font txt file. the png is looked up from the same directory. """
+        self.filename = filename
+        self.texture = None
+        # (s0, t0, s1, t1, x_offset, y_offset, byte_width, byte_height, screen_width) per character code
+        self._glyphs = [None] * 256
 
-    elif sys.platform == "win32" and _64bit:
-        from windows_py27_64.gltext import *
+        # sticky draw parameters. a draw call without them uses the previous ones.
+        self.fgcolor = (1., 1., 1., 1.)
+        self.bgcolor = (0., 0., 0., 0.)
+        self.z = 0.
 
-    else:
-        raise RuntimeError, "unsupported platform '%s'" % sys.platform
+        self._load_txt(filename)
 
-else:
-    print "error importing gltext: python version 2.6.x or 2.7.x required. you have", sys.version
-    raise ImportError
+        self._layouts = {} # txt: (numpy float32 array of (x0, y0, x1, y1, s0, t0, s1, t1) per glyph, width)
+        self._bg_layouts = {} # width: numpy array of one row. the background quad samples the white texel.
+
+        # text collected for flush(), one entry per draw call and color
+        self._batch_rows = []
+        self._batch_origins = []
+        self._batch_colors = []
+        self._batch_matrices = []
+        self._matrices = {} # modelview bytes: 4x4 numpy matrix
+
+        self._modelview = numpy.zeros(16, numpy.float32)
+        self._modelview_ptr = self._modelview.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+        self._identity = numpy.identity(4, numpy.float32).tobytes()
+
+    def _load_txt(self, filename):
+        """ Read the glyph rectangles.
+        info: http://www.fluidstudios.com/pub/FluidStudios/Tools/Fluid_Studios_Font_Generation_Tool.zip
+            : ascii, char_x, char_y, byteWidth, byteHeight, xOffset, yOffset, screenWidth, screenHeight
+
+        font_proggy_opti_small.png 512 256
+        0 0 0 0 0 0 0 0 0
+        ..
+        255 490 10 5 9 0 -7 6 10
+        8 2 10
+        the last line is ascender, descender, height. """
+        rows = []
+        with open(filename) as f:
+            for line in f:
+                d = line.split()
+                if not d or d[0] in ("info:", ":"):
+                    continue
+                if len(d) == 3 and not d[0].isdigit():
+                    self.png_filename = os.path.join(os.path.dirname(filename), d[0])
+                    self.tex_w, self.tex_h = int(d[1]), int(d[2])
+                    continue
+                rows.append([int(v) for v in d])
+        self.ascender, self.descender, self.height = [float(v) for v in rows.pop()]
+
+        w, h = float(self.tex_w), float(self.tex_h)
+        # the first pixel row of a glyph is at ascender + y_offset from the top of the text line
+        for code, x, y, bw, bh, xofs, yofs, screen_w, screen_h in rows:
+            if 0 <= code < 256:
+                self._glyphs[code] = (x / w, y / h, (x + bw) / w, (y + bh) / h,
+                                      xofs, self.ascender + yofs, bw, bh, screen_w)
+        self._white_texcoord = ((self.tex_w - .5) / w, (self.tex_h - .5) / h)
+
+    def init(self):
+        """ Upload the font texture. Needs an opengl context. """
+        im = Image.open(self.png_filename).convert("RGBA")
+        pixels = numpy.array(im, numpy.uint8)
+        # backgrounds are drawn with the glyphs, from one opaque white texel. the last one; no glyph uses it.
+        pixels[-1, -1] = 255
+        h, w = pixels.shape[:2]
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, w, h, 0, GL_RGBA, GL_UNSIGNED_BYTE, pixels.tobytes())
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+
+    def _get_layout(self, txt):
+        layout = self._layouts.get(txt)
+        if layout == None:
+            if len(self._layouts) >= self.MAX_CACHED_LAYOUTS:
+                self._layouts.clear()
+            s = txt.encode("latin-1", "replace") if isinstance(txt, unicode) else txt
+            rows = []
+            x = 0
+            glyphs = self._glyphs
+            for c in s:
+                g = glyphs[ord(c)]
+                if g == None:
+                    continue
+                s0, t0, s1, t1, xofs, y, bw, bh, screen_w = g
+                if bw and bh:
+                    rows.append((x + xofs, y, x + xofs + bw, y + bh, s0, t0, s1, t1))
+                x += screen_w
+            layout = self._layouts[txt] = (numpy.array(rows, numpy.float32).reshape(-1, 8), float(x))
+        return layout
+
+    def width(self, txt):
+        """ return string width in pixels """
+        return self._get_layout(txt)[1]
+
+    def _draw(self, txt, x, y, halign, valign, bgcolor, fgcolor, z):
+        """ halign : 0 left, .5 middle, 1 right. valign : y offset in font heights, or None for the baseline. """
+        if bgcolor != None: self.bgcolor = bgcolor
+        if fgcolor != None: self.fgcolor = fgcolor
+        if z != None: self.z = z
+        rows, w = self._get_layout(txt)
+        if not w:
+            return
+
+        x = math.floor(x - w * halign + .5)
+        y = math.floor(y - (self.ascender if valign == None else self.height * valign) + .5)
+        origin = (x, y, self.z)
+
+        _raw_glGetFloatv(GL_MODELVIEW_MATRIX, self._modelview_ptr)
+        matrix = self._modelview.tobytes()
+        if matrix not in self._matrices:
+            self._matrices[matrix] = self._modelview.reshape(4, 4).copy()
+
+        if self.bgcolor[3] > 0.:
+            bg = self._bg_layouts.get(w)
+            if bg is None:
+                s, t = self._white_texcoord
+                bg = self._bg_layouts[w] = numpy.array([[0., 0., w + 1., self.height, s, t, s, t]], numpy.float32)
+            self._batch_rows.append(bg)
+            self._batch_origins.append(origin)
+            self._batch_colors.append(self.bgcolor)
+            self._batch_matrices.append(matrix)
+        if len(rows):
+            self._batch_rows.append(rows)
+            self._batch_origins.append(origin)
+            self._batch_colors.append(self.fgcolor)
+            self._batch_matrices.append(matrix)
+
+    # t : top, m : middle, b : bottom, bl : baseline. l : left, m : middle, r : right
+
+    def drawtl(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 0., 0., bgcolor, fgcolor, z)
+    def drawtm(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, .5, 0., bgcolor, fgcolor, z)
+    def drawtr(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 1., 0., bgcolor, fgcolor, z)
+    def drawml(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 0., .5, bgcolor, fgcolor, z)
+    def drawmm(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, .5, .5, bgcolor, fgcolor, z)
+    def drawmr(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 1., .5, bgcolor, fgcolor, z)
+    def drawbl(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 0., 1., bgcolor, fgcolor, z)
+    def drawbm(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, .5, 1., bgcolor, fgcolor, z)
+    def drawbr(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 1., 1., bgcolor, fgcolor, z)
+    def drawbll(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 0., None, bgcolor, fgcolor, z)
+    def drawblm(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, .5, None, bgcolor, fgcolor, z)
+    def drawblr(self, txt, x, y, bgcolor=None, fgcolor=None, z=None): self._draw(txt, x, y, 1., None, bgcolor, fgcolor, z)
+
+    def flush(self):
+        """ Draw the text collected since the last flush. """
+        if not self._batch_rows:
+            return
+        counts = numpy.fromiter((len(r) for r in self._batch_rows), numpy.intp, len(self._batch_rows))
+        rows = numpy.concatenate(self._batch_rows)
+        origins = numpy.repeat(numpy.array(self._batch_origins, numpy.float32), counts, axis=0)
+        colors = numpy.array(self._batch_colors, numpy.float32)
+        n = len(rows)
+
+        # quad corners: top-left, top-right, bottom-right, bottom-left
+        vertices = numpy.empty((n, 4, 3), numpy.float32)
+        vertices[:, :, :] = origins[:, None, :]
+        vertices[:, (0, 3), 0] += rows[:, 0, None]
+        vertices[:, (1, 2), 0] += rows[:, 2, None]
+        vertices[:, (0, 1), 1] += rows[:, 1, None]
+        vertices[:, (2, 3), 1] += rows[:, 3, None]
+        texcoords = numpy.empty((n, 4, 2), numpy.float32)
+        texcoords[:, (0, 3), 0] = rows[:, 4, None]
+        texcoords[:, (1, 2), 0] = rows[:, 6, None]
+        texcoords[:, (0, 1), 1] = rows[:, 5, None]
+        texcoords[:, (2, 3), 1] = rows[:, 7, None]
+        colors = numpy.repeat(colors, counts * 4, axis=0)
+
+        # move the text drawn under other modelview matrices to where it would have been
+        for matrix in set(self._batch_matrices):
+            if matrix != self._identity:
+                m = self._matrices[matrix]
+                mask = numpy.repeat(numpy.array([k == matrix for k in self._batch_matrices]), counts)
+                v = vertices[mask]
+                vertices[mask] = numpy.dot(v, m[:3, :3]) + m[3, :3]
+
+        self._batch_rows = []
+        self._batch_origins = []
+        self._batch_colors = []
+        self._batch_matrices = []
+        if len(self._matrices) > 64:
+            self._matrices.clear()
+
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        # current bit for the color. the color arrays leave it undefined.
+        glPushAttrib(GL_ENABLE_BIT | GL_DEPTH_BUFFER_BIT | GL_CURRENT_BIT)
+        glDisable(GL_LIGHTING)
+        glDisable(GL_FOG)
+        glDepthFunc(GL_LEQUAL)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, vertices)
+        glTexCoordPointer(2, GL_FLOAT, 0, texcoords)
+        glColorPointer(4, GL_FLOAT, 0, colors)
+        glDrawArrays(GL_QUADS, 0, n * 4)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+        glPopAttrib()
+        glPopMatrix()
@@ -24,6 +24,13 @@ import animations
 import world_streamer
 import draw
 import graph_window
+import metrics
+import packet_handler
+import recording
+import speculative
+import dedup
+import layout
+import timeseries
 
 from nanomsg import Socket, SUB, SUB_SUBSCRIBE, DONTWAIT, NanoMsgAPIError
 
@@ -58,12 +65,18 @@ class NodeEditor:
     STATE_PLAYBACK = 0x02 # playback from random place
     STATE_PAUSED = 0x03
 
+    # history of the selected node plotted under the timeline. (metric, label, color)
+    GRAPH_CHANNELS = (("ctpf_buf_used", "buf", (0.9, 0.7, 0.2, 1.)),
+                      ("retry_count", "retries", (0.9, 0.3, 0.3, 1.)),
+                      ("parent_etx", "etx", (0.4, 0.9, 0.4, 1.)))
+
     # seek
     # get_delta_packets(dt)
     # get_current_timestamp
 
-    def __init__(self, nugui, mouse, gltext, conf):
+    def __init__(self, nugui, mouse, gltext, conf, profiler):
         self.conf = conf
+        self.profiler = profiler # frame_profiler.FrameProfiler
         self.mouse = mouse  # TODO: use a special mouse object instead of the editor_main object directly.
         self.gltext = gltext
         self.nugui = nugui
@@ -81,6 +94,12 @@ class NodeEditor:
         self.node_renderer = renderers.NodeRenderer(self.gltext)
         self.link_renderer = renderers.LinkRenderer()
 
+        # nodes placed by hand. the auto layout doesn't move them.
+        self.pinned_node_ids = set()
+        self.layout = None
+        if self.conf.auto_layout:
+            self._toggle_layout()
+
         # saved when closing the windows. loaded at startup.
         self.session_filename = os.path.normpath(os.path.join(self.conf.path_database, "session_conf.txt"))
         self.load_session()
@@ -88,41 +107,162 @@ class NodeEditor:
         self.recording = True
         self.state = self.STATE_PLAYBACK
 
-        self.worldstreamer = world_streamer.WorldStreamer(sync_window_seconds=self.conf.sync_depth_seconds)
+        self.recording_writer = None
+        # history of node attributes. new samples are kept for the recording writer.
+        self.timeseries = timeseries.TimeSeriesStore(self.conf.timeseries_capacity,
+                                                     keep_new=self.conf.save_recording and not self.conf.open_recording)
+        if self.conf.open_recording:
+            # view a recording instead of the network
+            filename = os.path.join(self.conf.py_path, self.conf.open_recording)
+            self.worldstreamer = recording.load_recording(filename, self.conf, self.timeseries)
+        else:
+            self.worldstreamer = world_streamer.WorldStreamer(sync_window_seconds=self.conf.sync_depth_seconds,
+                                                              keyframe_world=world.World("", self.conf),
+                                                              lateness_percentile=self.conf.sync_window_percentile or None,
+                                                              min_window_seconds=self.conf.sync_window_min_seconds,
+                                                              clock_sync_threshold_seconds=self.conf.clock_sync_threshold_seconds or None)
+        # late packets were inserted to the past after the underworld had already handled later packets
+        self._underworld_stale = False
+        # late packets changed the past of the visible world. resynced when their keyframes are regenerated.
+        self._world_attrs_stale = False
+        # speculative.SpeculativeView while showing packets as they arrive. see conf.speculative_live_view
+        self.speculative = None
+        self.dedup = None
+        if self.conf.dedup_window_seconds:
+            self.dedup = dedup.PacketDeduplicator(self.conf.dedup_window_seconds)
+        if self.conf.save_recording and not self.conf.open_recording:
+            self.recording_writer = recording.RecordingWriter(
+                recording.get_recording_filename(os.path.join(self.conf.path_database, "recordings")))
 
         #self.current_playback_time = 0. # timepoint of the simulation that is currently visible on screen. can be dragged around with a slider.
         self.timeslider_end_time = 0.
 
         self.graph_window = graph_window.GraphWindow(self.gltext)
+        self.graph_window.set_rate_pyramid(self.worldstreamer.rate_pyramid)
         self.graph_window_initialized = False
-
-        self.s1 = Socket(SUB)
-        self.s1.connect('tcp://127.0.0.1:55555')
-        self.s1.set_string_option(SUB, SUB_SUBSCRIBE, '')
+        self._graph_node_id = None # node whose history is in the graph window
+
+        # change tracking. see needs_redraw()
+        self._changed = True # the visible world or the gui state was changed
+        self._world_animating = False
+        self._rendered_hud_state = None
+
+        # statistics
+        self.transport_name = "nanomsg"
+        self.num_packets_received = 0
+        self.num_packets_ignored = 0 # not data or event packets
+        self.num_parse_failures = 0
+        self._metrics_prev_sorted = None # (time, num_packets_sorted) for the sorting rate
+
+        self.metrics = metrics.MetricsExporter(
+            os.path.join(self.conf.path_log, self.conf.metrics_filename) if self.conf.metrics_filename else None,
+            self.conf.metrics_period_seconds, self.conf.metrics_http_port)
+        self.metrics.add_source(self._collect_metrics)
+
+        self.s1 = None
+        if not self.conf.open_recording:
+            self.s1 = Socket(SUB)
+            self.s1.connect('tcp://127.0.0.1:55555')
+            self.s1.set_string_option(SUB, SUB_SUBSCRIBE, '')
 
     def tick(self, dt, keys):
-        self.world.tick(dt)
+        """ Advance the simulation by one fixed step of dt seconds. """
+        profiler = self.profiler
+        profiler.start("world_tick")
+        self._world_animating = self.world.tick(dt)
+        if self._world_animating:
+            # remembered until rendered, in case the animation ends during one of the following steps.
+            self._changed = True
         self.underworld.tick(dt)
-        self.net_poll_packets()
+        profiler.stop("world_tick")
+
+        if self.s1:
+            profiler.start("net_poll")
+            self.net_poll_packets()
+            profiler.stop("net_poll")
 
+        profiler.start("streamer_tick")
         fresh_packets = self.worldstreamer.tick()
+        late_packets = self.worldstreamer.get_late_packets()
+        if self.recording_writer:
+            self.recording_writer.write(fresh_packets)
+            self.recording_writer.write_late(late_packets)
+        profiler.stop("streamer_tick")
+
+        profiler.start("handle_packet")
         for p in fresh_packets:
-            self.handle_packet(p[1], self.underworld, barebones=True)
+            packet_handler.handle_packet(p[1], self.underworld, barebones=True)
+            self.timeseries.ingest(p[0], p[1], self.underworld)
+
+        if late_packets:
+            self._underworld_stale = True
+            for p in late_packets:
+                self.timeseries.ingest(p[0], p[1], self.underworld)
+
+        if self.speculative and self.state != self.STATE_PLAYBACK:
+            self._stop_speculating()
+
+        if self.speculative:
+            # everything is already on screen. check that it happened in the right order.
+            agree = self.speculative.confirm(fresh_packets)
+            agree = self.speculative.confirm(late_packets, in_order=False) and agree
+            if not agree:
+                self._rebuild_underworld()
+                self.speculative.rollback(self.underworld)
+                self._changed = True
+            self.worldstreamer.get_delta_packets(dt)
+        else:
+            # the visible world has already played past some of these
+            if late_packets and min(p[0] for p in late_packets) <= self.worldstreamer.current_time:
+                self._world_attrs_stale = True
 
-        if self.state == self.STATE_PLAYBACK:
-            packets = self.worldstreamer.get_delta_packets(dt)
-            for p in packets:
-                self.handle_packet(p[1], self.world)
+            if self.state == self.STATE_PLAYBACK:
+                packets = self.worldstreamer.get_delta_packets(dt)
+                for p in packets:
+                    packet_handler.handle_packet(p[1], self.world, timestamp=p[0])
+                if packets:
+                    self._changed = True
+
+                # caught up with the sorted stream. from now on, show packets as they arrive.
+                ws = self.worldstreamer
+                if self.conf.speculative_live_view and self.s1 and ws.current_time != None and ws.current_time >= ws.end_time:
+                    llog.info("speculative live view on")
+                    self.speculative = speculative.SpeculativeView(self.world)
+        profiler.stop("handle_packet")
+
+        if self.layout:
+            profiler.start("layout")
+            pinned = self.pinned_node_ids
+            if self.selected and self.mouse_dragging:
+                pinned = pinned | set([self.selected.node_id])
+            if self.layout.tick(self.world, dt, pinned):
+                self._changed = True
+            profiler.stop("layout")
+
+        profiler.start("keyframe")
+        self.worldstreamer.regenerate_stale_keyframes(max_slots=1)
+        self._apply_late_packets()
+        profiler.stop("keyframe")
 
         if self.worldstreamer.need_keyframe():
             llog.info("need keyframe!")
+            profiler.start("keyframe")
+            self._rebuild_underworld()
             w = self.underworld.serialize_world()
 
             #import pprint
             #llog.info("\n\n\nSAVING")
             #llog.info(pprint.pformat(w))
 
-            self.worldstreamer.put_keyframe(w)
+            # a stale underworld gives a stale keyframe. it's regenerated later and left out of the recording;
+            # the packets after it are replayed from the previous keyframe when the recording is opened.
+            stale = self._underworld_stale
+            self.worldstreamer.put_keyframe(w, stale=stale)
+            if self.recording_writer:
+                self.recording_writer.write_timeseries(self.worldstreamer.keyframeslots[-1].timestamp, self.timeseries.pop_new())
+                if not stale:
+                    self.recording_writer.write_keyframe(self.worldstreamer.keyframeslots[-1].timestamp, w)
+            profiler.stop("keyframe")
 
         # always set the graph start 10 seconds before the first sample time. user-friendly start condition for the zoom-scroller.
         if self.worldstreamer.start_time != None and not self.graph_window_initialized:
@@ -134,7 +274,9 @@ class NodeEditor:
         if self.graph_window_initialized:
             self.graph_window.set_totalsample_end(self.worldstreamer.end_time)
 
-        self.graph_window.tick()
+        profiler.start("graph_tick")
+        self.graph_window.tick(dt)
+        profiler.stop("graph_tick")
 
         if self.graph_window_initialized:
             # if the graph was moved by keyboard/mouse
@@ -143,9 +285,15 @@ class NodeEditor:
                 newtime = self.graph_window.wanted_visiblesample_x2
 
                 if newtime != self.worldstreamer.current_time:
+                    if self.speculative:
+                        self._stop_speculating(resync=False)
+                    profiler.start("seek")
                     llog.info("seeking from %.2f to %.2f between %.2f %.2f", self.worldstreamer.current_time, newtime, self.worldstreamer.start_time, self.worldstreamer.end_time)
                     keyframe, packets = self.worldstreamer.seek(newtime)
                     self.world.deserialize_world(keyframe)
+                    if self.layout:
+                        self.layout.reset()
+                    self._changed = True
                     llog.info("seeking returned %i packets", len(packets))
                     if packets:
                         # calc the timestamp from where to start using animations. use only 2 seconds worth, because
@@ -157,13 +305,79 @@ class NodeEditor:
                             timestamp, packet = p
                             if timestamp < animations_start:
                                 # won't use animations for these packets
-                                self.handle_packet(packet, self.world, barebones=True)
+                                packet_handler.handle_packet(packet, self.world, barebones=True, timestamp=timestamp)
                             else:
-                                self.handle_packet(packet, self.world)
+                                packet_handler.handle_packet(packet, self.world, timestamp=timestamp)
+                    profiler.stop("seek")
 
             if self.state == self.STATE_PLAYBACK:
                 self.graph_window.move_sample_right_edge(self.worldstreamer.current_time)
 
+        self.metrics.tick()
+
+    def _toggle_layout(self):
+        if self.layout:
+            self.layout = None
+        else:
+            self.layout = layout.ForceLayout(self.conf.auto_layout_spring_length, self.conf.auto_layout_budget_seconds)
+
+    def _rebuild_underworld(self):
+        """ Replay the underworld if late packets were inserted before packets it has already handled. Waits
+        until the last keyframe is regenerated (one stale keyframe per tick), so only the packets after it are
+        replayed. The underworld stays stale until then. """
+        ws = self.worldstreamer
+        if self._underworld_stale and not ws.is_stale(ws.end_time):
+            self._underworld_stale = False
+            keyframe, packets = ws.get_seek_state(ws.end_time)
+            self.underworld.deserialize_world(keyframe)
+            for p in packets:
+                packet_handler.handle_packet(p[1], self.underworld, barebones=True)
+
+    def _apply_late_packets(self):
+        """ Bring the underworld and the visible world up to date with the late packets, as soon as the keyframes
+        they are replayed from have been regenerated. """
+        if self._underworld_stale:
+            self._rebuild_underworld()
+            if not self._underworld_stale and self.speculative:
+                self.speculative.rollback(self.underworld)
+                self._changed = True
+        ws = self.worldstreamer
+        if self._world_attrs_stale and not ws.is_stale(ws.current_time):
+            self._world_attrs_stale = False
+            self._resync_world_attrs()
+
+    def _stop_speculating(self, resync=True):
+        """ resync : bring the visible world back from the future to the worldstreamer current time. """
+        llog.info("speculative live view off. %i packets applied, %i rollbacks", self.speculative.num_applied, self.speculative.num_rollbacks)
+        self.speculative = None
+        if resync:
+            self._world_attrs_stale = True
+
+    def _resync_world_attrs(self):
+        """ Bring node attributes of the visible world up to date with the worldstreamer current time without
+        touching the running animations. Used when late packets changed the past, and when the world was ahead
+        of the current time in the speculative view. """
+        ws = self.worldstreamer
+        keyframe, packets = ws.get_seek_state(ws.current_time)
+        w = ws.keyframe_world
+        w.deserialize_world(keyframe)
+        for p in packets:
+            packet_handler.handle_packet(p[1], w, barebones=True)
+        for node in w.nodes:
+            self.world.get_create_node(node.node_id).attrs = node.attrs
+        self.world.sync_routing_tree()
+        self._changed = True
+
+    def needs_redraw(self):
+        """ Return True if the editor would look different if rendered again. """
+        return self._changed or self._world_animating or self.graph_window.needs_redraw() or \
+               self._rendered_hud_state != self._get_hud_state()
+
+    def _get_hud_state(self):
+        """ Everything shown by render_overlay that is not in the world or in the graph window. """
+        ws = self.worldstreamer
+        return self.state, self.speculative != None, self.layout != None, self.world.routing_tree.get_num_loops(), ws.get_sync_window_seconds(), ws.num_packets_sorted, ws.start_time, ws.end_time, ws.current_time
+
     def net_poll_packets(self):
         try:
             # handle all incoming packets
@@ -176,163 +390,114 @@ class NodeEditor:
 
                 msg = msg.strip()
                 if msg:
+                    self.num_packets_received += 1
                     try:
                         # append the packet to timesyncer
-                        # get the timestamp.
-                        d = msg.split(None, 5)
-                        #d = d[1:] # cut off the seqno
-                        # ['data', 'etx', '0001000000000200', 'node', '0A', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
-                        if d[0] == "data" or d[0] == "event":
-                            # get nodeid from packet
-                            node_id_name = d[4]
-                            nodeid = int(node_id_name.split("_", 1)[0], 16)
-                            self.worldstreamer.put_packet(float(d[2]), msg, nodeid)
+                        sync_info = packet_handler.parse_sync_info(msg)
+                        if sync_info:
+                            timestamp, nodeid = sync_info
+                            if self.dedup and self.dedup.is_duplicate(msg, time.time()):
+                                continue
+                            self.worldstreamer.put_packet(timestamp, msg, nodeid)
+                            if self.speculative:
+                                self.speculative.apply(timestamp, msg, nodeid)
+                                self._changed = True
+                        else:
+                            self.num_packets_ignored += 1
                     except:
+                        self.num_parse_failures += 1
                         llog.exception("")
 
         except NanoMsgAPIError as e:
             if e.errno != errno.EAGAIN:
                 raise
 
-    def handle_packet(self, msg, world, barebones=False):
-        """ barebones : if True, then won't use any animations and non-essential poking of the world.
-        Will result in a fast barebones world that is still usable for generating keyframes. """
-
-        #llog.info("handle: %s", msg)
-        d = msg.split()
-        #d = d[1:] # cut off the seqno
-        if d[0] == "data" or d[0] == "event":
-
-            #timestamp = float(d[2])
-            #timesyncer.append(timestamp, msg)
-
-            # ['data', 'etx', '0001000000000200', 'node', '0A', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
-            # ['data', 'etx', '0001000000000200', 'node', '0A_sniffy', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
-            node_id_name = d[4]
-            node = world.get_create_named_node(node_id_name)
-            src_node = node
-            src_node_id = node.node_id
-
-            if d[0] == "data":
-
-                if d[1] == "etx":
-                    # ['data', 'etx', '0001000000000200', 'node', '0A', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
-
-                    # filter out empty rows
-                    if int(d[8]) != 0xFFFF:
-                        if d[10].startswith("NO_ROUTE"):
-                            d[10] = "NO"
-                            d[12] = "NO"
-
-                        # when receiving entry with index 0, then clear out the whole table.
-                        if int(d[6]) == 0:
-                            node.attrs["etx_table"] = []
-
-                        attrs_etx_table = node.attrs.get("etx_table", [])
-                        attrs_etx_table.append("%04X e%s r%s" % (int(d[8]), d[10], "00" if d[12] == "0" else d[12]))
-                elif d[1] == "ctpf_buf_size":
-                    used = int(d[6])
-                    capacity = int(d[8])
-                    node.attrs["ctpf_buf_used"] = used
-                    node.attrs["ctpf_buf_capacity"] = capacity
-
-            elif d[0] == "event":
-
-                if d[1] == "radiopowerstate":
-                    # ['event', 'radiopowerstate', '0052451410156550', 'node', '04', 'state', '1']
-                    radiopowerstate = int(d[6], 16)
-                    node.attrs["radiopowerstate"] = radiopowerstate
-                    if not barebones:
-                        if radiopowerstate:
-                            node.poke_radio()
-
-                elif d[1] == "beacon":
-                    # ['event', 'beacon', '0052451410156550', 'node', '04', 'options', '0x00', 'parent', '0x0003', 'etx', '30']
-                    options = int(d[6], 16)
-                    parent = int(d[8], 16)
-                    node.attrs["parent"] = parent
-                    if not barebones:
-                        node.append_animation(animations.BeaconAnimation(options))
-
-                elif d[1] == "packet_to_activemessage" and 0:
-                    # ['event', 'packet', '0000372279297175', 'node', '04', 'dest', '0x1234', 'amid', '0x71']
-                    dst_node_id = int(d[6], 16)
-                    amid = int(d[8], 16)
-                    if dst_node_id != 0xFFFF: # filter out broadcasts
-                        dst_node = world.get_create_node(dst_node_id)
-                        if not barebones:
-                            link = world.get_link(src_node, dst_node)
-                            link.poke(src_node)
-
-                elif d[1] == "send_ctp_packet":
-                    # event send_ctp_packet 0:0:38.100017602 node 03 dest 0x0004 origin 0x0009 sequence 21 type 0x71 thl 5
-                    # event send_ctp_packet 0:0:10.574584572 node 04 dest 0x0003 origin 0x0005 sequence 4 amid 0x98 thl 1
-                    dst_node_id = int(d[6], 16)
-                    origin_node_id = int(d[8], 16)
-                    sequence_num = int(d[10])
-                    amid = int(d[12], 16)
-                    thl = int(d[14])
-
-                    dst_node = world.get_create_node(dst_node_id)
-                    if not barebones:
-                        link = world.get_link(src_node, dst_node)
-                        # TODO: refactor node color
-                        link.poke(src_node, packet_color=world.get_node_color(origin_node_id))
-
-                elif d[1] == "packet_to_model_busy":
-                    dst_node_id = int(d[6], 16)
-                    if dst_node_id != 0xFFFF: # filter out broadcasts
-                        src_node = node
-                        dst_node = world.get_create_node(dst_node_id)
-                        if not barebones:
-                            link = self.world.get_link(src_node, dst_node)
-                            link.poke_busy(src_node)
-
-                elif d[1] == "send_done":
-                    # 'event send_done 1425601510.21 node 2C13_8 rm 0x02 dest 0x37B6 amid 0x71 error 0x00 retry_count 9 acked 0x01 congested 0x00 dropped 0x00'
-                    ramplex_id = int(d[6],16)
-                    dst_node_id = int(d[8],16)
-                    amid = int(d[10],16)
-                    error = int(d[12],16)
-                    retry_count = int(d[14],16)
-                    acked = int(d[16],16)
-                    congested = int(d[18],16)
-                    dropped = int(d[20],16)
-
-                    if not barebones and retry_count > 0:
-                        node.append_animation(animations.SendRetryAnimation(max_age=1., start_color=(1.,0.,0.,1.), end_color=(0.,0.,0.,0.2), retry_count=retry_count))
-
-            else:
-                llog.info("unknown msg %s", repr(msg))
-
-    def _render_links_to_parents(self):
-        glLineWidth(1.)
-        glColor4f(0.4, 0.4, 0.4, 1.)
-
-        # 1111_11_1______
-        glLineStipple(2, 1+2+4+8+32+64+256)
-        glEnable(GL_LINE_STIPPLE)
-        glLineWidth(2.)
-        for node in self.world.nodes:
-            parent_id = node.attrs.get("parent")
-            if parent_id and parent_id != 0xFFFF:
-                parent_node = self.world.get_create_node(parent_id)
-
-                glBegin(GL_LINES)
-                glVertex3f(*parent_node.pos)
-                glVertex3f(*node.pos)
-                glEnd()
-
-        glDisable(GL_LINE_STIPPLE)
-
-    def render(self):
-        for link in self.world.links:
-            self.link_renderer.render(link)
-        self._render_links_to_parents()
-        for node in self.world.nodes:
-            self.node_renderer.render(node)
-
-    def render_overlay(self, camera, camera_ocs, projection_mode, w_pixels, h_pixels):
+    def _collect_metrics(self, m):
+        """ Metrics source. m : metrics.MetricsSnapshot """
+        ws = self.worldstreamer
+        sb = ws.syncbuffer
+        t = time.time()
+        tr = {"transport": self.transport_name}
+
+        m.add("packets_received_total", self.num_packets_received, "counter", "packets read from the transport", tr)
+        m.add("packets_ignored_total", self.num_packets_ignored, "counter", "packets that were not data or event packets", tr)
+        m.add("parse_failures_total", self.num_parse_failures, "counter", "packets that could not be parsed", tr)
+        if self.dedup:
+            m.add("packets_duplicate_total", self.dedup.num_duplicates, "counter",
+                  "copies of already received packets, dropped", tr)
+
+        m.add("timestamps_overwritten_total", sb.num_timestamps_overwritten, "counter",
+              "packets older than the previous packet of the same stream. timestamp was replaced")
+        m.add("timestamps_clamped_total", sb.num_timestamps_clamped, "counter",
+              "packets that arrived later than the sync window. timestamp was replaced")
+        m.add("late_packets_total", ws.num_late_packets, "counter",
+              "packets that arrived later than the sync window. inserted at their own time")
+        m.add("keyframes_regenerated_total", ws.num_keyframes_regenerated, "counter",
+              "keyframes regenerated because late packets were inserted before them")
+        m.add("keyframes_stale", ws.get_num_stale_keyframes(), "gauge", "keyframes waiting to be regenerated")
+        if self.speculative:
+            sv = self.speculative
+            m.add("speculative_applied_total", sv.num_applied, "counter", "packets shown before they were sorted")
+            m.add("speculative_pending", len(sv.pending), "gauge", "packets shown but not yet sorted")
+            m.add("speculative_rollbacks_total", sv.num_rollbacks, "counter",
+                  "times the visible world was reset because the sorted order differed from the arrival order")
+        for stream_id, stats in sb.stream_stats.iteritems():
+            labels = {"stream": "%X" % stream_id}
+            m.add("stream_packets_total", stats.num_packets, "counter", "packets received per stream", labels)
+            m.add("stream_depth", sb.get_stream_depth(stream_id), "gauge", "packets waiting in the sync buffer", labels)
+            m.add("stream_lag_seconds", stats.last_lag, "gauge",
+                  "age of the last packet timestamp on arrival. transport delay + uncorrected clock difference", labels)
+            m.add("stream_last_packet_age_seconds", t - stats.last_timestamp, "gauge",
+                  "seconds since the timestamp of the last packet of the stream", labels)
+            if sb.lateness_percentile:
+                m.add("stream_lateness_seconds", stats.lateness.get_percentile(sb.lateness_percentile), "gauge",
+                      "lateness percentile of the stream. the sync window is the largest of these", labels)
+            if stats.clock:
+                m.add("stream_clock_offset_seconds", stats.clock.get_offset(stats.clock.last_timestamp), "gauge",
+                      "estimated local time minus node clock, without transport delay", labels)
+                m.add("stream_clock_drift_ppm", stats.clock.drift * 1e6, "gauge",
+                      "estimated node clock rate error relative to the local clock", labels)
+
+        if ws.get_sync_window_seconds() != None:
+            m.add("sync_window_seconds", ws.get_sync_window_seconds(), "gauge")
+        m.add("packets_sorted_total", ws.num_packets_sorted, "counter", "packets that have left the sync buffer")
+        m.add("routing_loops", self.underworld.routing_tree.get_num_loops(), "gauge",
+              "routing loops at the end of the sorted stream")
+        if self._metrics_prev_sorted and t > self._metrics_prev_sorted[0]:
+            rate = (ws.num_packets_sorted - self._metrics_prev_sorted[1]) / (t - self._metrics_prev_sorted[0])
+            m.add("packets_sorted_per_second", rate, "gauge", "sorting rate since the previous metrics update")
+        self._metrics_prev_sorted = (t, ws.num_packets_sorted)
+        if ws.end_time != None:
+            m.add("sorted_lag_seconds", t - ws.end_time, "gauge", "seconds since the timestamp of the last sorted packet")
+
+        m.add("keyframes", len(ws.keyframeslots), "gauge", "number of keyframes")
+        m.add("keyframe_bytes", ws.keyframe_bytes, "gauge", "estimated memory used by keyframes")
+        m.add("packet_bytes", ws.packet_bytes, "gauge", "estimated memory used by recorded packets")
+        m.add("worldstreamer_memory_bytes", ws.get_memory_estimate(), "gauge", "estimated memory used by the recording")
+
+        m.add("timeseries_samples", self.timeseries.num_samples, "counter", "node attribute history samples stored")
+        m.add("timeseries_memory_bytes", self.timeseries.get_memory_estimate(), "gauge",
+              "memory used by the node attribute history")
+
+        m.add("world_nodes", len(self.underworld.nodes), "gauge", "nodes in the latest world state")
+        m.add("world_links", len(self.underworld.links), "gauge", "links in the latest world state")
+
+    def render(self, alpha=1.):
+        """ alpha : 0..1, how far between the last two simulation steps to interpolate the animations. """
+        self.profiler.start("render_links")
+        self.link_renderer.render_links(self.world.links, alpha, self.world.link_stats)
+        self.link_renderer.render_links_to_parents(self.world)
+        self.profiler.stop("render_links")
+        self.profiler.start("render_nodes")
+        self.node_renderer.render_nodes(self.world.nodes, alpha)
+        self.profiler.stop("render_nodes")
+
+    def render_overlay(self, camera, camera_ocs, projection_mode, w_pixels, h_pixels, alpha=1.):
+        self.profiler.start("render_overlay")
+        self._render_overlay(camera, camera_ocs, projection_mode, w_pixels, h_pixels, alpha)
+        self.profiler.stop("render_overlay")
+
+    def _render_overlay(self, camera, camera_ocs, projection_mode, w_pixels, h_pixels, alpha):
         # calculate node screen positions
         for node in self.world.nodes:
             # 1. proj obj to camera_ocs
@@ -358,8 +523,9 @@ class NodeEditor:
                     glDisable(GL_TEXTURE_2D)
 
         # draw the nodes themselves
-        for node in self.world.nodes:
-            self.node_renderer.render_overlay(node)
+        self.node_renderer.render_overlays(self.world.nodes)
+        # node labels go under the hud and the graph window
+        self.gltext.flush()
 
         t = self.gltext
 
@@ -367,11 +533,29 @@ class NodeEditor:
 
         glEnable(GL_TEXTURE_2D)
         y = 5.
-        t.drawtl(" sync depth  : %.1f s " % (self.worldstreamer.sync_window_seconds), 5, y, bgcolor=(0.8,0.8,0.8,.9), fgcolor=(0.,0.,0.,1.), z=100.); y += t.height
+        sb = self.worldstreamer.syncbuffer
+        if sb.sync_window_seconds == None:
+            txt = "-"
+        elif sb.lateness_percentile:
+            txt = "%.2f s (p%g)" % (sb.sync_window_seconds, sb.lateness_percentile)
+        else:
+            txt = "%.1f s" % sb.sync_window_seconds
+        t.drawtl(" sync depth  : %s " % txt, 5, y, bgcolor=(0.8,0.8,0.8,.9), fgcolor=(0.,0.,0.,1.), z=100.); y += t.height
         t.drawtl(" recording   : yes ", 5, y); y += t.height
+        if self.conf.speculative_live_view:
+            t.drawtl(" live view   : %s " % ("speculative" if self.speculative else "sorted"), 5, y); y += t.height
         txt = "-" if self.worldstreamer.start_time == None else round(self.worldstreamer.end_time - self.worldstreamer.start_time)
         t.drawtl(" duration    : %s s " % (txt), 5, y); y += t.height
         t.drawtl(" num packets : %i " % self.worldstreamer.num_packets_sorted, 5, y); y += t.height
+        t.drawtl(" loops       : %i " % self.world.routing_tree.get_num_loops(), 5, y); y += t.height
+        if self.selected:
+            s = self.world.link_stats.get_node(self.selected.node_id)
+            if s:
+                t.drawtl(" %04X sends  : %.2f/s, %s retries/send, %s acked " % (self.selected.node_id, s["sends_per_second"],
+                         "-" if s["retry_rate"] == None else "%.2f" % s["retry_rate"],
+                         "-" if s["ack_ratio"] == None else "%i%%" % (s["ack_ratio"] * 100.)), 5, y); y += t.height
+                t.drawtl(" %04X ctp    : %.2f/s, %i originated, %i congested, %i dropped " % (self.selected.node_id,
+                         s["packets_per_second"], s["originated"], s["congested"], s["dropped"]), 5, y); y += t.height
 
         # render and handle rewind-slider
 
@@ -403,13 +587,20 @@ class NodeEditor:
                     self.world.deserialize_world(keyframe)
                     llog.info("seeking returned %i packets", len(packets))
                     for p in packets:
-                        self.handle_packet(p[1], self.world)
+                        packet_handler.handle_packet(p[1], self.world)
 
 
+        self._update_graph_channels()
         self.graph_window.place_on_screen(0, h_pixels-51, w_pixels, 50)
-        self.graph_window.render()
+        self.profiler.start("render_graph")
+        self.graph_window.render(alpha)
+        self.profiler.stop("render_graph")
 
 
+        # remember what was rendered before the button possibly changes the state
+        self._changed = False
+        self._rendered_hud_state = self._get_hud_state()
+
         txt = "playing" if self.state == self.STATE_PLAYBACK else "paused"
         if self.nugui.button(1002, 5, h_pixels-90, txt, w=64):
             if self.state == self.STATE_PLAYBACK:
@@ -417,6 +608,10 @@ class NodeEditor:
             else:
                 self.state = self.STATE_PLAYBACK
 
+        txt = "layout on" if self.layout else "layout off"
+        if self.nugui.button(1003, 74, h_pixels-90, txt, w=80):
+            self._toggle_layout()
+
     def intersects_node(self, sx, sy):
         for node in self.world.nodes:
             if node.intersects(float(sx), float(sy)):
@@ -449,19 +644,10 @@ class NodeEditor:
         return dist
 
     def load_session(self):
-        """ load node positions. write to self.session_node_positions """
-        try:
-            with open(self.session_filename, "rb") as f:
-                session_conf = json.load(f)
-        except IOError:
-            #log.warning("'%s' file not found" % path)
-            session_conf = None
-
-        # extract node positions from the conf dict
-        if session_conf and "node_positions" in session_conf:
-            c = session_conf.get("node_positions")
-            # convert entries {"0x51AB": (1,2,3), ..} to format {20907, (1,2,3)}
-            self.world.session_node_positions = {int(k, 16): v for k, v in c.items()}
+        """ load node positions. write to self.world.session_node_positions """
+        session_conf = self.world.load_session_node_positions(self.session_filename)
+        if session_conf:
+            self.pinned_node_ids = set(int(k, 16) for k in session_conf.get("pinned_nodes", []))
 
     def save_session(self):
         """ save node positions. mix together prev session positions and new positions. """
@@ -470,7 +656,8 @@ class NodeEditor:
         node_positions_used = {"0x%04X" % n.node_id: (n.pos[0], n.pos[1], n.pos[2]) for n in self.world.nodes}
         node_positions_session.update(node_positions_used)
 
-        session_conf = {"node_positions": node_positions_session}
+        session_conf = {"node_positions": node_positions_session,
+                        "pinned_nodes": ["0x%04X" % k for k in sorted(self.pinned_node_ids)]}
         txt = json.dumps(session_conf, indent=4, sort_keys=True)
 
         with open(self.session_filename, "wb") as f:
@@ -478,13 +665,31 @@ class NodeEditor:
 
     def close(self):
         self.save_session()
+        self.metrics.close()
+        if self.recording_writer:
+            if self.worldstreamer.end_time != None:
+                self.recording_writer.write_timeseries(self.worldstreamer.end_time, self.timeseries.pop_new())
+            self.recording_writer.close()
 
     def is_world_move_allowed(self):
         if self.graph_window.is_coordinate_inside_window(self.mouse_x, self.mouse_y):
             return False
         return True
 
+    def _update_graph_channels(self):
+        """ Show the history of the selected node in the graph window. """
+        node_id = self.selected.node_id if self.selected else None
+        if node_id == self._graph_node_id:
+            return
+        self._graph_node_id = node_id
+        channels = []
+        if node_id != None:
+            for metric, label, color in self.GRAPH_CHANNELS:
+                channels.append(graph_window.GraphChannel(self.timeseries, node_id, metric, color, label))
+        self.graph_window.set_channels(channels)
+
     def event(self, event):
+        self._changed = True
 
         if self.graph_window.event(event):
             return True
@@ -504,6 +709,11 @@ class NodeEditor:
 
             if self.selected and self.mouse_dragging and self.mouse.mouse_lbdown_floor_coord:
                 self.selected.pos.set(self.mouse.mouse_floor_coord + self.selected_pos_ofs)
+                # also survives seeking
+                self.world.session_node_positions[self.selected.node_id] = tuple(self.selected.pos)
+                self.pinned_node_ids.add(self.selected.node_id)
+                if self.layout:
+                    self.layout.heat()
                 return True
 
         elif event.type == SDL_MOUSEBUTTONDOWN:
@@ -520,6 +730,13 @@ class NodeEditor:
                 else:
                     self.mouse_dragging = False
 
+            elif event.button.button == SDL_BUTTON_RIGHT:
+                node = self.intersects_node(event.button.x, event.button.y)
+                if node and node.node_id in self.pinned_node_ids:
+                    self.pinned_node_ids.discard(node.node_id)
+                    if self.layout:
+                        self.layout.heat()
+
         elif event.type == SDL_MOUSEBUTTONUP:
             if event.button.button == SDL_BUTTON_LEFT:
                 #if self.mouse_dragging:
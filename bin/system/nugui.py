@@ -61,10 +61,18 @@ class NuGui:
         # the active element consumes keypresses from this queue.
         self.keyqueue = [] # [(character, scancode), ..]
 
+        # True if the gui would look different if rendered again. set by input and by tick().
+        self._changed = True
+
     def active(self):
         """return True if there's a work-in-progress mouse drag of some ui element."""
         return bool(self.id_active)
 
+    def needs_redraw(self):
+        """return True if the gui would look different in the next frame."""
+        # a focused textentry has a blinking cursor
+        return self._changed or self.id_focused in self.states
+
     def finish_frame(self):
         # clear focus if there was a mouseclick outside of every gui element
         if self.hit_clock < self.current_clock and self.mousedown:
@@ -366,6 +374,7 @@ class NuGui:
     def event(self, event):
         # http://wiki.libsdl.org/SDL_Scancode
         if event.type == SDL_KEYDOWN:
+            self._changed = True
             if self.id_focused:
                 #llog.info("keysym %s scancode %s", event.key.keysym.sym, event.key.keysym.scancode)
                 sym = event.key.keysym.sym
@@ -383,6 +392,7 @@ class NuGui:
 
     def set_mouse_pos(self, x, y):
         self.mouse_x, self.mouse_y = x, y
+        self._changed = True
 
     def set_mouse_button(self, leftmousebutton):
         """ boolean """
@@ -395,16 +405,20 @@ class NuGui:
             self.mouseleftclicked = True
 
         self.mousedown = leftmousebutton
+        self._changed = True
 
     def tick(self):
         """
         call this AFTER done using nugui for the frame.
         """
+        id_active = self.id_active
         self.id_hot = 0
         if not self.mousedown: self.id_active = 0
         #else:              self.id_active = 0 # -1
         self.mouseleftclick = False
         self.mouseleftclicked = False
+        # id_hot is recalculated from the mouse position while rendering, but a released widget changes its color.
+        self._changed = id_active != self.id_active
 
     def _draw_filled_rect(self, x, y, w, h):
         z = self.z
@@ -0,0 +1,135 @@
+"""
+Headless opengl. No window, no sdl, no display server needed.
+
+    # PYOPENGL_PLATFORM has to be set before anything imports OpenGL. see export.py
+    context = offscreen_gl.create_context()
+    fb = offscreen_gl.Framebuffer(1280, 720)
+    fb.bind()
+    ..render..
+    pixels = fb.read_pixels() # str of bottom-up RGB rows
+
+platforms:
+    egl    : mesa EGL without a display (EGL_PLATFORM=surfaceless). llvmpipe software renderer if there's no gpu.
+             set LIBGL_ALWAYS_SOFTWARE=1 to force software rendering.
+    osmesa : mesa off-screen software renderer. needs libOSMesa.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import os
+import ctypes
+
+from OpenGL.GL import *
+from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
+
+
+PLATFORMS = ("egl", "osmesa")
+
+
+class _EGLContext:
+    def __init__(self):
+        from OpenGL import EGL
+        self.EGL = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("eglInitialize failed")
+        attrs = (EGL.EGLint * 11)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                  EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8, EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        num_configs = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, attrs, ctypes.pointer(config), 1, ctypes.pointer(num_configs)) or not num_configs.value:
+            raise RuntimeError("no suitable egl config")
+        # rendering goes to a framebuffer object. the surface is just something to make the context current with.
+        pbuffer_attrs = (EGL.EGLint * 5)(EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(self.display, config, pbuffer_attrs)
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context):
+            raise RuntimeError("eglMakeCurrent failed")
+
+    def close(self):
+        EGL = self.EGL
+        EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self.display, self.context)
+        EGL.eglDestroySurface(self.display, self.surface)
+        EGL.eglTerminate(self.display)
+
+
+class _OSMesaContext:
+    def __init__(self):
+        from OpenGL import osmesa
+        from OpenGL import arrays
+        self.osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("OSMesaCreateContextExt failed")
+        # rendering goes to a framebuffer object. this buffer is just something to make the context current with.
+        self._buf = arrays.GLubyteArray.zeros((1, 1, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self._buf, GL_UNSIGNED_BYTE, 1, 1):
+            raise RuntimeError("OSMesaMakeCurrent failed")
+
+    def close(self):
+        self.osmesa.OSMesaDestroyContext(self.context)
+
+
+def create_context():
+    """ Create a context for the PYOPENGL_PLATFORM platform and make it current. """
+    if os.environ.get("PYOPENGL_PLATFORM") == "osmesa":
+        context = _OSMesaContext()
+    else:
+        context = _EGLContext()
+    llog.info("offscreen opengl %s, %s", glGetString(GL_VERSION), glGetString(GL_RENDERER))
+    return context
+
+
+class Framebuffer:
+    """ Multisampled render target. Resolved to a normal framebuffer for reading the pixels. """
+    def __init__(self, w, h, samples=4):
+        self.w, self.h = w, h
+        self.samples = samples
+
+        def create(samples, with_depth):
+            fbo = glGenFramebuffers(1)
+            glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+            rbs = [glGenRenderbuffers(1)]
+            glBindRenderbuffer(GL_RENDERBUFFER, rbs[0])
+            glRenderbufferStorageMultisample(GL_RENDERBUFFER, samples, GL_RGBA8, w, h)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, rbs[0])
+            if with_depth:
+                rbs.append(glGenRenderbuffers(1))
+                glBindRenderbuffer(GL_RENDERBUFFER, rbs[1])
+                glRenderbufferStorageMultisample(GL_RENDERBUFFER, samples, GL_DEPTH_COMPONENT24, w, h)
+                glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, rbs[1])
+            status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+            if status != GL_FRAMEBUFFER_COMPLETE:
+                raise RuntimeError("framebuffer incomplete: 0x%X" % status)
+            return fbo, rbs
+
+        self.fbo, self._rbs = create(samples, True)
+        self.resolve_fbo, self._resolve_rbs = create(0, False)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def bind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.w, self.h)
+
+    def read_pixels(self):
+        """ Return str of RGB pixels, bottom row first. """
+        w, h = self.w, self.h
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.resolve_fbo)
+        glBlitFramebuffer(0, 0, w, h, 0, 0, w, h, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.resolve_fbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = (ctypes.c_ubyte * (3 * w * h))()
+        glReadPixels(0, 0, w, h, GL_RGB, GL_UNSIGNED_BYTE, pixels)
+        self.bind()
+        return ctypes.string_at(pixels, 3 * w * h)
+
+    def close(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glDeleteFramebuffers(2, [self.fbo, self.resolve_fbo])
+        rbs = self._rbs + self._resolve_rbs
+        glDeleteRenderbuffers(len(rbs), rbs)
@@ -0,0 +1,175 @@
+"""
+Applies text packets from the sensor network to a World. No rendering; usable without a gui.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import array
+
+import animations
+import logging_setup
+
+# a misconfigured node can send thousands of these per second
+llog_limited = logging_setup.RateLimitedLogger(llog)
+
+
+# node.attrs["etx_table"] is array("i") of (neighbor, etx, retx) triples. numeric, so keyframes copy it in one go and
+# numpy.frombuffer(table, numpy.int32).reshape(-1, 3) gives a view for vectorized neighbor queries.
+# etx and retx of a neighbor without a route are ETX_NO_ROUTE.
+ETX_NO_ROUTE = -1
+
+
+def format_etx_table(table):
+    """ Return the rows of an etx table as text. ["0008 e10 r74", "0009 eNO rNO", ..] """
+    rows = []
+    for i in xrange(0, len(table), 3):
+        neighbor, etx, retx = table[i:i+3]
+        rows.append("%04X e%s r%s" % (neighbor, "NO" if etx == ETX_NO_ROUTE else etx,
+                                      "NO" if retx == ETX_NO_ROUTE else "00" if retx == 0 else retx))
+    return rows
+
+
+def etx_table_from_json(rows):
+    """ Return an etx table from its serialized form - a flat list of numbers. Also reads the text rows of
+    recordings made before the tables were numeric. """
+    if not rows or not isinstance(rows[0], basestring):
+        return array.array("i", rows)
+    table = array.array("i")
+    for row in rows:
+        # "0008 e10 r74"
+        neighbor, etx, retx = row.split()
+        table.extend((int(neighbor, 16),
+                      ETX_NO_ROUTE if etx == "eNO" else int(etx[1:]),
+                      ETX_NO_ROUTE if retx == "rNO" else int(retx[1:])))
+    return table
+
+
+def parse_sync_info(msg):
+    """ Return (timestamp, stream_id) of a data or event packet, None if msg is some other packet.
+    stream_id is the node id. Raises on malformed packets. """
+    d = msg.split(None, 5)
+    # ['data', 'etx', '0001000000000200', 'node', '0A', 'index 0 neighbor 8 etx 10 retx 74']
+    if d[0] == "data" or d[0] == "event":
+        return float(d[2]), int(d[4].split("_", 1)[0], 16)
+    return None
+
+
+def handle_packet(msg, world, barebones=False, timestamp=None):
+    """ barebones : if True, then won't use any animations and non-essential poking of the world.
+    Will result in a fast barebones world that is still usable for generating keyframes.
+    timestamp : sorted timestamp of the packet. world.link_stats are updated only if given. """
+
+    #llog.info("handle: %s", msg)
+    d = msg.split()
+    #d = d[1:] # cut off the seqno
+    if d[0] == "data" or d[0] == "event":
+
+        #timestamp = float(d[2])
+        #timesyncer.append(timestamp, msg)
+
+        # ['data', 'etx', '0001000000000200', 'node', '0A', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
+        # ['data', 'etx', '0001000000000200', 'node', '0A_sniffy', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
+        node_id_name = d[4]
+        node = world.get_create_named_node(node_id_name)
+        src_node = node
+        src_node_id = node.node_id
+
+        if d[0] == "data":
+
+            if d[1] == "etx":
+                # ['data', 'etx', '0001000000000200', 'node', '0A', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
+
+                # filter out empty rows
+                if int(d[8]) != 0xFFFF:
+                    if d[10].startswith("NO_ROUTE"):
+                        etx = retx = ETX_NO_ROUTE
+                    else:
+                        etx = int(d[10])
+                        retx = int(d[12])
+
+                    # when receiving entry with index 0, then clear out the whole table.
+                    if int(d[6]) == 0:
+                        node.attrs["etx_table"] = array.array("i")
+
+                    attrs_etx_table = node.attrs.get("etx_table")
+                    if attrs_etx_table != None:
+                        attrs_etx_table.extend((int(d[8]), etx, retx))
+            elif d[1] == "ctpf_buf_size":
+                used = int(d[6])
+                capacity = int(d[8])
+                node.attrs["ctpf_buf_used"] = used
+                node.attrs["ctpf_buf_capacity"] = capacity
+
+        elif d[0] == "event":
+
+            if d[1] == "radiopowerstate":
+                # ['event', 'radiopowerstate', '0052451410156550', 'node', '04', 'state', '1']
+                radiopowerstate = int(d[6], 16)
+                node.attrs["radiopowerstate"] = radiopowerstate
+                if not barebones:
+                    if radiopowerstate:
+                        node.poke_radio()
+
+            elif d[1] == "beacon":
+                # ['event', 'beacon', '0052451410156550', 'node', '04', 'options', '0x00', 'parent', '0x0003', 'etx', '30']
+                options = int(d[6], 16)
+                parent = int(d[8], 16)
+                world.set_node_parent(node, parent)
+                if not barebones:
+                    node.append_animation(animations.BeaconAnimation(options))
+
+            elif d[1] == "packet_to_activemessage" and 0:
+                # ['event', 'packet', '0000372279297175', 'node', '04', 'dest', '0x1234', 'amid', '0x71']
+                dst_node_id = int(d[6], 16)
+                amid = int(d[8], 16)
+                if dst_node_id != 0xFFFF: # filter out broadcasts
+                    dst_node = world.get_create_node(dst_node_id)
+                    if not barebones:
+                        link = world.get_link(src_node, dst_node)
+                        link.poke(src_node)
+
+            elif d[1] == "send_ctp_packet":
+                # event send_ctp_packet 0:0:38.100017602 node 03 dest 0x0004 origin 0x0009 sequence 21 type 0x71 thl 5
+                # event send_ctp_packet 0:0:10.574584572 node 04 dest 0x0003 origin 0x0005 sequence 4 amid 0x98 thl 1
+                dst_node_id = int(d[6], 16)
+                origin_node_id = int(d[8], 16)
+                sequence_num = int(d[10])
+                amid = int(d[12], 16)
+                thl = int(d[14])
+
+                dst_node = world.get_create_node(dst_node_id)
+                if timestamp != None:
+                    world.link_stats.add_ctp_packet(timestamp, src_node_id, dst_node_id, origin_node_id)
+                if not barebones:
+                    link = world.get_link(src_node, dst_node)
+                    # TODO: refactor node color
+                    link.poke(src_node, packet_color=world.get_node_color(origin_node_id))
+
+            elif d[1] == "packet_to_model_busy":
+                dst_node_id = int(d[6], 16)
+                if dst_node_id != 0xFFFF: # filter out broadcasts
+                    src_node = node
+                    dst_node = world.get_create_node(dst_node_id)
+                    if not barebones:
+                        link = world.get_link(src_node, dst_node)
+                        link.poke_busy(src_node)
+
+            elif d[1] == "send_done":
+                # 'event send_done 1425601510.21 node 2C13_8 rm 0x02 dest 0x37B6 amid 0x71 error 0x00 retry_count 9 acked 0x01 congested 0x00 dropped 0x00'
+                ramplex_id = int(d[6],16)
+                dst_node_id = int(d[8],16)
+                amid = int(d[10],16)
+                error = int(d[12],16)
+                retry_count = int(d[14],16)
+                acked = int(d[16],16)
+                congested = int(d[18],16)
+                dropped = int(d[20],16)
+
+                if timestamp != None:
+                    world.link_stats.add_send_done(timestamp, src_node_id, dst_node_id, retry_count, acked, congested, dropped)
+                if not barebones and retry_count > 0:
+                    node.append_animation(animations.SendRetryAnimation(max_age=1., start_color=(1.,0.,0.,1.), end_color=(0.,0.,0.,0.2), retry_count=retry_count))
+
+    else:
+        llog_limited.info("unknown msg %s", repr(msg))
@@ -0,0 +1,201 @@
+"""
+Offline import of raw packet dumps to a recording. Driven by bin/import_dump.py.
+
+Dump files are text, one packet per line, the same lines the gateways publish to the network:
+
+    data etx 1425601510.25 node 0A index 0 neighbor 8 etx 10 retx 74
+    event beacon 1425601510.31 node 04 options 0x00 parent 0x0003 etx 30
+
+Files are cut to chunks at line boundaries and parsed in a pool of worker processes. Every worker sorts its chunk
+by timestamp and writes it to a temporary file. The sorted chunks are then merged, and the merged stream is run
+through a barebones world in this process to generate keyframes the same way the live program does. Memory use
+doesn't depend on the size of the input.
+
+Unlike the live sync buffer, nothing is ever late here - packets are sorted by their own timestamps, not by arrival.
+Dumps of gateways with overlapping coverage contain the same packets; the copies are dropped while merging (see
+dedup.py), with the packet timestamps as the time base.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import os
+import time
+import heapq
+import shutil
+import tempfile
+import multiprocessing
+
+import world
+import world_streamer
+import packet_handler
+import recording
+import dedup
+import timeseries
+
+
+class ImportStats:
+    def __init__(self):
+        self.num_lines = 0
+        self.num_packets = 0
+        self.num_ignored = 0 # not data or event packets
+        self.num_parse_failures = 0
+        self.num_duplicates = 0 # included in num_packets, but not written
+        self.num_keyframes = 0
+        self.start_time = None
+        self.end_time = None
+
+    def add(self, chunk_result):
+        tmp_filename, num_lines, num_packets, num_ignored, num_parse_failures = chunk_result
+        self.num_lines += num_lines
+        self.num_packets += num_packets
+        self.num_ignored += num_ignored
+        self.num_parse_failures += num_parse_failures
+
+
+def get_chunks(filenames, chunk_size):
+    """ Return [(filename, start, end), ..] byte ranges of about chunk_size bytes. A chunk owns the lines that
+    start inside it. """
+    chunks = []
+    for filename in filenames:
+        size = os.path.getsize(filename)
+        for start in xrange(0, max(size, 1), chunk_size):
+            chunks.append((filename, start, min(start + chunk_size, size)))
+    return chunks
+
+
+def _parse_chunk(args):
+    """ Runs in a worker process. Parse the lines of a chunk, write them sorted by timestamp to tmp_filename.
+    Return (tmp_filename, num_lines, num_packets, num_ignored, num_parse_failures) """
+    filename, start, end, tmp_filename = args
+    packets = []
+    num_lines = num_ignored = num_parse_failures = 0
+
+    with open(filename, "rb") as f:
+        if start:
+            # skip the line that started in the previous chunk. if the previous chunk ended exactly on a line
+            # boundary, this reads just the newline.
+            f.seek(start - 1)
+            pos = start - 1 + len(f.readline())
+        else:
+            pos = 0
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            msg = line.strip()
+            if not msg:
+                continue
+            num_lines += 1
+            try:
+                sync_info = packet_handler.parse_sync_info(msg)
+            except Exception:
+                num_parse_failures += 1
+                if num_parse_failures <= 10:
+                    llog.warning("%s: can't parse '%s'", filename, msg)
+                continue
+            if sync_info:
+                packets.append((sync_info[0], msg))
+            else:
+                num_ignored += 1
+
+    # stable. packets with equal timestamps stay in file order.
+    packets.sort(key=lambda p: p[0])
+    with open(tmp_filename, "wb") as f:
+        f.writelines(["%.6f %s\n" % p for p in packets])
+    return tmp_filename, num_lines, len(packets), num_ignored, num_parse_failures
+
+
+def _read_chunk(tmp_filename, chunk_index):
+    """ Generator of (timestamp, chunk_index, line_index, packet). The indices keep the merge stable. """
+    with open(tmp_filename, "rb") as f:
+        for i, line in enumerate(f):
+            timestamp, packet = line.rstrip("\n").split(" ", 1)
+            yield float(timestamp), chunk_index, i, packet
+
+
+def import_files(filenames, out_filename, conf, num_workers=None, chunk_size=32*1024*1024, progress=None):
+    """ Import packet dump files to a new recording file with keyframes.
+    num_workers : parser processes. default is the number of cpu cores.
+    progress : function(stage, done, total) called now and then. stage is "parse" or "merge".
+    Return ImportStats. """
+    stats = ImportStats()
+    tmp_path = tempfile.mkdtemp(prefix="sensed_import_")
+    pool = None
+    try:
+        chunks = get_chunks(filenames, chunk_size)
+        jobs = [(filename, start, end, os.path.join(tmp_path, "chunk_%06i.txt" % i))
+                for i, (filename, start, end) in enumerate(chunks)]
+
+        t = time.time()
+        pool = multiprocessing.Pool(num_workers or multiprocessing.cpu_count())
+        tmp_filenames = []
+        for i, result in enumerate(pool.imap(_parse_chunk, jobs)):
+            stats.add(result)
+            tmp_filenames.append(result[0])
+            if progress:
+                progress("parse", i + 1, len(jobs))
+        pool.close()
+        pool.join()
+        pool = None
+        llog.info("parsed %i lines in %i chunks in %.1f s", stats.num_lines, len(jobs), time.time() - t)
+
+        t = time.time()
+        _merge(tmp_filenames, out_filename, conf, stats, progress)
+        llog.info("merged %i packets, %i keyframes in %.1f s. dropped %i duplicates", stats.num_packets - stats.num_duplicates,
+                  stats.num_keyframes, time.time() - t, stats.num_duplicates)
+    finally:
+        if pool:
+            pool.terminate()
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return stats
+
+
+def _merge(tmp_filenames, out_filename, conf, stats, progress=None):
+    """ Merge the sorted chunks to the recording. Keyframes are generated with the same rules as
+    WorldStreamer.need_keyframe() uses. """
+    underworld = world.World("", conf)
+    writer = recording.RecordingWriter(out_filename)
+    max_packets = world_streamer.WorldStreamer.MAX_PACKETS_PER_KEYFRAME_HINT
+    slot_packets = []
+    slot_start_time = None
+    num_done = 0
+    deduplicator = dedup.PacketDeduplicator(conf.dedup_window_seconds) if conf.dedup_window_seconds else None
+    store = timeseries.TimeSeriesStore(conf.timeseries_capacity, keep_new=True)
+
+    streams = [_read_chunk(f, i) for i, f in enumerate(tmp_filenames)]
+    try:
+        for timestamp, chunk_index, line_index, packet in heapq.merge(*streams):
+            if stats.start_time == None:
+                stats.start_time = timestamp
+            stats.end_time = timestamp
+
+            if deduplicator and deduplicator.is_duplicate(packet, timestamp):
+                stats.num_duplicates += 1
+                num_done += 1
+                continue
+            packet_handler.handle_packet(packet, underworld, barebones=True)
+            store.ingest(timestamp, packet, underworld)
+            if slot_start_time == None:
+                slot_start_time = timestamp
+            slot_packets.append((timestamp, packet))
+
+            if len(slot_packets) >= max_packets and timestamp > slot_start_time:
+                writer.write(slot_packets)
+                writer.write_timeseries(timestamp, store.pop_new())
+                writer.write_keyframe(timestamp, underworld.serialize_world())
+                stats.num_keyframes += 1
+                num_done += len(slot_packets)
+                slot_packets = []
+                slot_start_time = None
+                if progress:
+                    progress("merge", num_done, stats.num_packets)
+
+        if slot_packets:
+            writer.write(slot_packets)
+            writer.write_timeseries(stats.end_time, store.pop_new())
+            if progress:
+                progress("merge", stats.num_packets, stats.num_packets)
+    finally:
+        writer.close()
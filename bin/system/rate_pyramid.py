@@ -0,0 +1,147 @@
+"""
+Packet counts per time bucket at power-of-two resolutions, for drawing the packet rate of any part of a recording
+without touching the packets.
+
+Level 0 counts packets per bucket_seconds, level k per bucket_seconds * 2**k; a level k bucket is the sum of two
+level k-1 buckets. Column 0 is the total, the other columns are packet types ("etx", "beacon", ..). Drawing
+picks the level whose buckets are about one pixel wide, so the cost depends on the number of pixels, not on the
+length of the recording.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import math
+import numpy
+
+
+class RatePyramid:
+    INITIAL_SIZE = 1024
+
+    def __init__(self, bucket_seconds=1.):
+        self.bucket_seconds = bucket_seconds
+        self.origin = None # bucket_seconds periods since the epoch at the start of levels[0][0]
+        self.columns = {None: 0} # packet type: column. None is the total
+        self.levels = [] # [numpy uint32 array (buckets, columns), ..]. level k has buckets of bucket_seconds * 2**k
+        self.num_buckets = 0 # buckets in use on level 0
+        self._dirty = None # (lo, hi) level 0 buckets changed since the upper levels were updated
+        self._pending = {} # (bucket, column): count not yet in the arrays
+
+    def _alloc(self, size, num_columns):
+        """ Return empty levels with size buckets on level 0. size is a power of two. """
+        levels = []
+        while 1:
+            levels.append(numpy.zeros((size, num_columns), numpy.uint32))
+            if size == 1:
+                return levels
+            size //= 2
+
+    def _resize(self, size, num_columns):
+        levels = self._alloc(size, num_columns)
+        for new, old in zip(levels, self.levels):
+            new[:len(old), :old.shape[1]] = old
+        self.levels = levels
+
+    def _get_column(self, packet):
+        # 'data etx 1425601510.25 node 0A ..'
+        d = packet.split(None, 2)
+        ptype = d[1] if len(d) > 1 else ""
+        col = self.columns.get(ptype)
+        if col == None:
+            col = self.columns[ptype] = len(self.columns)
+        return col
+
+    def add_packets(self, packets):
+        """ packets : [(timestamp, packet), ..]. Timestamps before the first added packet count as the first. """
+        if not packets:
+            return
+        if self.origin == None:
+            self.origin = math.floor(min(p[0] for p in packets) / self.bucket_seconds)
+            self.levels = self._alloc(self.INITIAL_SIZE, 8)
+        if len(packets) < 16:
+            # numpy setup costs more than it saves for the few packets of a sync buffer tick. collected to a dict
+            # and added to the arrays on the next query.
+            pending = self._pending
+            for timestamp, packet in packets:
+                key = (max(int(math.floor(timestamp / self.bucket_seconds) - self.origin), 0), self._get_column(packet))
+                pending[key] = pending.get(key, 0) + 1
+            if len(pending) > 1000:
+                self._add_pending()
+            return
+
+        timestamps = numpy.fromiter((p[0] for p in packets), numpy.float64, len(packets))
+        cols = numpy.fromiter((self._get_column(p[1]) for p in packets), numpy.intp, len(packets))
+        buckets = numpy.maximum(numpy.floor(timestamps / self.bucket_seconds) - self.origin, 0).astype(numpy.intp)
+        self._add(buckets, cols, 1, int(buckets.min()), int(buckets.max()))
+
+    def _add_pending(self):
+        if self._pending:
+            keys = numpy.array(self._pending.keys(), numpy.intp)
+            counts = numpy.fromiter(self._pending.itervalues(), numpy.uint32, len(self._pending))
+            self._pending = {}
+            self._add(keys[:, 0], keys[:, 1], counts, int(keys[:, 0].min()), int(keys[:, 0].max()))
+
+    def _add(self, buckets, cols, counts, lo, hi):
+        """ Add counts to level 0 buckets. lo, hi : the smallest and the largest bucket. """
+        size = len(self.levels[0])
+        if hi >= size or len(self.columns) > self.levels[0].shape[1]:
+            while size <= hi:
+                size *= 2
+            self._resize(size, max(len(self.columns) + 4, self.levels[0].shape[1]))
+        self.num_buckets = max(self.num_buckets, hi + 1)
+
+        level = self.levels[0]
+        numpy.add.at(level, (buckets, 0), counts)
+        numpy.add.at(level, (buckets, cols), counts)
+        if self._dirty:
+            lo, hi = min(lo, self._dirty[0]), max(hi, self._dirty[1])
+        self._dirty = (lo, hi)
+
+    def _update_levels(self):
+        """ Sum the changed level 0 buckets to the upper levels. Done on the first query after adding packets
+        instead of for every batch; batches from the sync buffer are small. """
+        self._add_pending()
+        if not self._dirty:
+            return
+        lo, hi = self._dirty
+        self._dirty = None
+        level = self.levels[0]
+        for k in xrange(1, len(self.levels)):
+            child = level
+            level = self.levels[k]
+            lo //= 2
+            hi //= 2
+            level[lo:hi+1] = child[2*lo:2*hi+2:2] + child[2*lo+1:2*hi+2:2]
+
+    def get_types(self):
+        return sorted(t for t in self.columns if t != None)
+
+    def get_rates(self, t1, t2, num_pixels, ptype=None):
+        """ Return packets per second in num_pixels equal parts of the time range t1..t2 as a numpy array.
+        ptype : packet type, or None for all packets. """
+        rates = numpy.zeros(num_pixels)
+        col = self.columns.get(ptype)
+        if self.origin == None or col == None or t2 <= t1 or num_pixels < 1:
+            return rates
+        self._update_levels()
+        pixel_seconds = float(t2 - t1) / num_pixels
+        # the coarsest level with buckets not wider than a pixel
+        k = int(math.floor(math.log(max(pixel_seconds / self.bucket_seconds, 1.), 2)))
+        k = min(k, len(self.levels) - 1)
+        scale = 2 ** k
+        counts = self.levels[k][:(self.num_buckets + scale - 1) // scale, col]
+
+        # pixel edges in buckets of the level
+        edges = (numpy.linspace(t1, t2, num_pixels + 1) / self.bucket_seconds - self.origin) / scale
+        j1 = max(int(math.floor(edges[0])), 0)
+        j2 = min(int(math.ceil(edges[-1])), len(counts))
+        if j2 <= j1:
+            return rates
+        # packets before every bucket edge, interpolated inside the buckets
+        cumulative = numpy.zeros(j2 - j1 + 1)
+        numpy.cumsum(counts[j1:j2], out=cumulative[1:])
+        c = numpy.interp(edges, numpy.arange(j1, j2 + 1), cumulative)
+        return numpy.diff(c) / pixel_seconds
+
+    def get_memory_estimate(self):
+        return sum(level.nbytes for level in self.levels)
@@ -0,0 +1,226 @@
+"""
+Recording files. Time-sorted packets, as they left the sync buffer. Text, one packet per line:
+
+    {"format": "sensed recording", "format_version": "2026-10-19", "keyframes": true}
+    1425601510.210000 event send_done 1425601510.21 node 2C13_8 rm 0x02 dest 0x37B6 ..
+    1425601510.250000 data etx 1425601510.25 node 0A index 0 neighbor 8 etx 10 retx 74
+    ..
+    S 1425601512.100000 {"ctpf_buf_used": [4, 1425601510.5, 3.0, ..], ..}
+    K 1425601512.100000 {"nodes": [..]}
+    ..
+    L 1425601509.900000 event beacon 1425601509.9 node 04 options 0x00 parent 0x0003 etx 30
+    ..
+
+The first column is the sorted timestamp. It can differ from the timestamp inside the packet if the sync buffer
+had to overwrite it.
+
+"K" lines are keyframes: the serialized world after every packet above the line. With these, a recording opens
+without replaying the packets. The keyframes stay as json text until a seek needs them. Recordings without the
+"keyframes" header field get their keyframes generated on load.
+
+"L" lines are late packets, written when they arrived. They belong before the packets above them; keyframes
+above them don't contain them. See "late packets" in world_streamer.py.
+
+"S" lines are node attribute history (see timeseries.py) stored since the previous "S" line, as
+{metric: [node_id, timestamp, value, ..]}. Written before keyframes. Recordings without them get the history
+generated on load.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import os
+import time
+import json
+
+import world
+import world_streamer
+import packet_handler
+import timeseries
+
+
+FORMAT = "sensed recording"
+FORMAT_VERSION = "2026-10-19"
+
+
+def get_recording_filename(path):
+    """ Return path/recording_20090404_120211_utc.txt """
+    return os.path.join(path, time.strftime("recording_%Y%m%d_%H%M%S_utc.txt", time.gmtime()))
+
+
+class RecordingWriter:
+    """ Appends sorted packets to a recording file. The file is created on the first write. """
+    def __init__(self, filename, flush_period=5.):
+        self.filename = filename
+        self.flush_period = flush_period
+        self.num_packets = 0
+        self.num_keyframes = 0
+        self._f = None
+        self._last_flush_time = 0.
+
+    def _open(self):
+        llog.info("recording to '%s'", self.filename)
+        d = os.path.dirname(self.filename)
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+        self._f = open(self.filename, "wb")
+        self._f.write(json.dumps({"format": FORMAT, "format_version": FORMAT_VERSION, "keyframes": True}) + "\n")
+
+    def write(self, sorted_packets):
+        """ sorted_packets : [(timestamp, packet), ..] """
+        if not sorted_packets:
+            return
+        if not self._f:
+            self._open()
+
+        self._f.writelines(["%.6f %s\n" % p for p in sorted_packets])
+        self.num_packets += len(sorted_packets)
+        self._flush_maybe()
+
+    def write_late(self, late_packets):
+        """ late_packets : [(timestamp, packet), ..] older than some packets already written. """
+        if not late_packets:
+            return
+        if not self._f:
+            self._open()
+        self._f.writelines(["L %.6f %s\n" % p for p in late_packets])
+        self.num_packets += len(late_packets)
+        self._flush_maybe()
+
+    def write_timeseries(self, timestamp, samples):
+        """ samples : see TimeSeriesStore.pop_new() """
+        if not samples:
+            return
+        if not self._f:
+            self._open()
+        self._f.write("S %.6f %s\n" % (timestamp, json.dumps(samples, separators=(",", ":"))))
+        self._flush_maybe()
+
+    def write_keyframe(self, timestamp, keyframe=None, keyframe_json=None):
+        """ keyframe : serialized world after every packet written so far. see WorldStreamer.put_keyframe() """
+        if not self._f:
+            self._open()
+        if keyframe_json == None:
+            keyframe_json = json.dumps(keyframe, separators=(",", ":"))
+        self._f.write("K %.6f %s\n" % (timestamp, keyframe_json))
+        self.num_keyframes += 1
+        self._flush_maybe()
+
+    def _flush_maybe(self):
+        # don't lose much if the program crashes
+        t = time.time()
+        if t - self._last_flush_time > self.flush_period:
+            self._last_flush_time = t
+            self._f.flush()
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+            llog.info("recorded %i packets, %i keyframes to '%s'", self.num_packets, self.num_keyframes, self.filename)
+
+
+def save_recording(worldstreamer, filename, timeseries=None):
+    """ Write every packet and keyframe of the worldstreamer to a new recording file.
+    timeseries : TimeSeriesStore of the node attribute history, or None """
+    worldstreamer.regenerate_stale_keyframes()
+    w = RecordingWriter(filename)
+    for i, kfs in enumerate(worldstreamer.keyframeslots):
+        # the first keyframe is the empty world before the first packet. it's implicit.
+        if i:
+            w.write_keyframe(kfs.timestamp, kfs.keyframe, kfs.keyframe_json)
+        w.write(kfs.packets)
+    if timeseries and worldstreamer.end_time != None:
+        w.write_timeseries(worldstreamer.end_time, timeseries.to_json())
+    w.close()
+
+
+def read_recording(filename):
+    """ Return (header, items). items is a generator of (kind, timestamp, data). kind is "P" for packets, "L" for late
+    packets, "K" for keyframes and "S" for node attribute history; data is the packet or the json. """
+    f = open(filename, "rb")
+    header = json.loads(f.readline())
+    if header.get("format") != FORMAT:
+        f.close()
+        raise ValueError("'%s' is not a recording file" % filename)
+
+    def items():
+        with f:
+            for line in f:
+                line = line.rstrip("\r\n")
+                if line[1:2] == " " and line[0] in "KLS":
+                    kind, timestamp, data = line.split(" ", 2)
+                else:
+                    kind = "P"
+                    timestamp, data = line.split(" ", 1)
+                yield kind, float(timestamp), data
+
+    return header, items()
+
+
+def load_recording(filename, conf, timeseries=None):
+    """ Read the whole recording to ram. Return a WorldStreamer. Nothing is waiting in the sync buffer.
+    Keyframes are taken from the file if it has them, otherwise generated like the live program generates them.
+    timeseries : TimeSeriesStore to fill with the node attribute history, or None """
+    header, items = read_recording(filename)
+    ws = world_streamer.WorldStreamer(sync_window_seconds=None, keyframe_world=world.World("", conf))
+    batch = []
+
+    if header.get("keyframes"):
+        for kind, timestamp, data in items:
+            if kind == "P":
+                batch.append((timestamp, data))
+                continue
+            if kind == "S":
+                if timeseries:
+                    timeseries.add_json(json.loads(data))
+                continue
+            ws.append_sorted_packets(batch)
+            batch = []
+            if kind == "K":
+                ws.put_keyframe(None, timestamp, data)
+            else:
+                ws.insert_late_packet(timestamp, data)
+        ws.append_sorted_packets(batch)
+        llog.info("loaded %i packets, %i keyframes from '%s'", ws.num_packets_sorted, len(ws.keyframeslots), filename)
+        return ws
+
+    underworld = world.World("", conf)
+
+    def append(batch):
+        ws.append_sorted_packets(batch)
+        for timestamp, packet in batch:
+            packet_handler.handle_packet(packet, underworld, barebones=True)
+            if timeseries:
+                timeseries.ingest(timestamp, packet, underworld)
+        if ws.need_keyframe():
+            ws.put_keyframe(underworld.serialize_world())
+
+    # only packets. late packets are written only with keyframes.
+    for kind, timestamp, packet in items:
+        batch.append((timestamp, packet))
+        if len(batch) == 100:
+            append(batch)
+            batch = []
+    append(batch)
+
+    llog.info("loaded %i packets, %i keyframes from '%s'", ws.num_packets_sorted, len(ws.keyframeslots), filename)
+    return ws
+
+
+def load_timeseries(filename, conf):
+    """ Return a TimeSeriesStore with the node attribute history of a recording. Reads only the "S" lines;
+    recordings without keyframes are replayed. """
+    header, items = read_recording(filename)
+    store = timeseries.TimeSeriesStore(conf.timeseries_capacity)
+    if header.get("keyframes"):
+        for kind, timestamp, data in items:
+            if kind == "S":
+                store.add_json(json.loads(data))
+        return store
+
+    underworld = world.World("", conf)
+    for kind, timestamp, packet in items:
+        packet_handler.handle_packet(packet, underworld, barebones=True)
+        store.ingest(timestamp, packet, underworld)
+    return store
@@ -1,5 +1,8 @@
 """
 world_objects renderers
+
+Links, packets, beacons and node icons of a whole frame are collected to gfx batches and drawn with a few calls
+(see gfx.py), instead of a few gl calls for every link and node.
 """
 
 import logging
@@ -11,42 +14,78 @@ import random
 from OpenGL.GL import *
 from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
 
+import numpy
+
 import vbo
+import gfx
 import vector
 import animations
-import draw
+import packet_handler
+import label_cache
 
 
 class LinkRenderer:
-    def __init__(self):
-        pass
-
-    def render(self, link):
-        if link._usage:
-            glLineWidth(link._usage)
-            r, g, b = 0.4, 0.4, 0.4
-            if link._link_busy:
-                r += r * (link._busy_age / link._busy_max_age)
-                g += g * (link._busy_age / link._busy_max_age)
-            if link._just_poked:
-                r, g, b = 0., 0., 0.
-            glColor4f(r, g, b, 1.)
-
-            glBegin(GL_LINES)
-            glVertex3f(*link.node1.pos)
-            glVertex3f(*link.node2.pos)
-            glEnd()
+    # links with this many retries per send are drawn red
+    RED_RETRY_RATE = 3.
 
-        for anim in link._animations:
-            anim.render()
-
-    def render_overlay(self, node):
-        pass
+    def __init__(self):
+        self._lines = gfx.WideLineBatch()
+        self._packets = gfx.TriangleBatch()
+        self._parent_lines = vbo.DynamicVBO()
+
+    def render_links(self, links, alpha=1., link_stats=None):
+        """ Draw the links and the packets on them.
+        alpha : 0..1, interpolation factor between the last two simulation steps.
+        link_stats : world.link_stats. colors the links by their retry rate. """
+        for link in links:
+            if link._usage:
+                r, g, b = 0.4, 0.4, 0.4
+                retry_rate = link_stats and link_stats.get_retry_rate(link.node1.node_id, link.node2.node_id)
+                if retry_rate:
+                    k = min(1., retry_rate / self.RED_RETRY_RATE)
+                    r, g, b = r + (0.9 - r) * k, g * (1. - k), b * (1. - k)
+                if link._link_busy:
+                    r += r * (link._busy_age / link._busy_max_age)
+                    g += g * (link._busy_age / link._busy_max_age)
+                if link._just_poked:
+                    r, g, b = 0., 0., 0.
+                self._lines.add(link.node1.pos, link.node2.pos, link._usage, (r, g, b, 1.))
+
+            for anim in link._animations:
+                anim.render(self._packets, None, alpha)
+
+        self._lines.flush()
+        self._packets.flush()
+
+    def render_links_to_parents(self, world):
+        """ Dashed lines from every node to its routing parent. world.routing_tree has to be up to date. """
+        v = []
+        nodes_dict = world.nodes_dict
+        for node_id, parent_id in world.routing_tree.parents.iteritems():
+            node = nodes_dict.get(node_id)
+            parent_node = nodes_dict.get(parent_id)
+            if node and parent_node:
+                v.extend((parent_node.pos[0], parent_node.pos[1], parent_node.pos[2], node.pos[0], node.pos[1], node.pos[2]))
+        if not v:
+            return
+        self._parent_lines.update(numpy.array(v, numpy.float32).reshape(-1, 3))
+
+        # stipple is left to the fixed-function pipeline. one draw call all the same.
+        glColor4f(0.4, 0.4, 0.4, 1.)
+        # 1111_11_1______
+        glLineStipple(2, 1+2+4+8+32+64+256)
+        glEnable(GL_LINE_STIPPLE)
+        glLineWidth(2.)
+        self._parent_lines.draw(GL_LINES)
+        glLineWidth(1.)
+        glDisable(GL_LINE_STIPPLE)
 
 
 class NodeRenderer:
     def __init__(self, gltext):
         self.gltext = gltext
+        # node id and name labels
+        self.labels = label_cache.LabelCache(gltext)
 
         # remember to change this also in node object
         self.radius_pixels = 17.
@@ -54,22 +93,28 @@ class NodeRenderer:
         #self._signal_strength_circles_vbo = self._build_signal_strength_circles_vbo()
         #self._signal_strength_filled_circles_xz_vbo = self._build_filled_circle_xz_vbo(4., (0.5, 0.5, 0.9, 0.8), (0.5, 0.5, 0.9, 0.))
 
-        self._icon_circle_outer_xy_vbo = self._build_filled_circle_xy_vbo(self.radius_pixels)
-        self._icon_circle_inner_xy_vbo = self._build_filled_circle_xy_vbo(self.radius_pixels - 2.)
-        self._icon_circle_node_colortag_xy_vbo = self._build_filled_half_circle_xy_vbo(self.radius_pixels - 2., -40., 40., 20)
+        self._icon_circle_outer_xy = gfx.circle_xy(self.radius_pixels)
+        self._icon_circle_inner_xy = gfx.circle_xy(self.radius_pixels - 2.)
+        self._icon_circle_node_colortag_xy = gfx.circle_xy(self.radius_pixels - 2., -40., 40., 20)
 
-    def render(self, node):
-        glLineWidth(1.)
-        glPushMatrix()
-        glTranslatef(*node.pos)
-        for anim in node._animations:
-            anim.render()
-        #self._signal_strength_filled_circles_xz_vbo.draw(GL_TRIANGLE_FAN)
-        #self._signal_strength_circles_vbo.draw(GL_LINES)
-        glPopMatrix()
+        self._world_batch = gfx.TriangleBatch()
+        self._overlay_batch = gfx.TriangleBatch()
 
-    def render_overlay(self, node):
-        """Render the iconified representation at self.screen_pos screen-coordinates."""
+    def render_nodes(self, nodes, alpha=1.):
+        """ alpha : 0..1, interpolation factor between the last two simulation steps. """
+        for node in nodes:
+            for anim in node._animations:
+                anim.render(self._world_batch, node.pos, alpha)
+        self._world_batch.flush()
+
+    def render_overlays(self, nodes):
+        """ Render the iconified representations at node.screen_pos screen-coordinates. The labels are left to
+        the font; they are drawn on gltext.flush(). """
+        for node in nodes:
+            self._render_overlay(node)
+        self._overlay_batch.flush()
+
+    def _render_overlay(self, node):
         s = node.screen_pos
 
         # postprocess some animations
@@ -83,10 +128,7 @@ class NodeRenderer:
             if isinstance(anim, animations.SendRetryAnimation):
                 anim.set_pos(s[0]-node.radius_pixels-3., s[1]+node.radius_pixels-3., s[2])
 
-        glDisable(GL_TEXTURE_2D)
-
-        glPushMatrix()
-        glTranslatef(*s)
+        batch = self._overlay_batch
 
         lighter = (0.1, 0.1, 0.1, 1.0)
         inner_color = (0.8, 0.8, 0.8, 1.0)
@@ -105,35 +147,26 @@ class NodeRenderer:
         else:
             outer_color = (1., 1., 1., 1.)
 
-        glColor4f(*outer_color)
-        self._icon_circle_outer_xy_vbo.draw(GL_TRIANGLE_FAN)
-        glColor4f(*inner_color)
-        self._icon_circle_inner_xy_vbo.draw(GL_TRIANGLE_FAN)
+        batch.add(self._icon_circle_outer_xy, s, outer_color)
+        batch.add(self._icon_circle_inner_xy, s, inner_color)
 
         if node.radio_active_anim and not node.radio_active_anim.dead:
-            glColor4f(*node.radio_active_anim.cur_color)
-            self._icon_circle_inner_xy_vbo.draw(GL_TRIANGLE_FAN)
+            batch.add(self._icon_circle_inner_xy, s, node.radio_active_anim.cur_color)
 
-        glColor4f(*node.node_color)
-        self._icon_circle_node_colortag_xy_vbo.draw(GL_TRIANGLE_FAN)
+        batch.add(self._icon_circle_node_colortag_xy, s, node.node_color)
 
-        glPopMatrix()
-
-        glEnable(GL_TEXTURE_2D)
-        self.gltext.drawmm(node.node_idstr, s[0], s[1], bgcolor=(1.0,1.0,1.0,0.), fgcolor=(0.,0.,0.,1.), z=s[2])
-        self.gltext.drawmm(node.node_name, s[0], s[1] + self.gltext.height, bgcolor=(1.0,1.0,1.0,0.), fgcolor=(0.,0.,0.,1.), z=s[2])
+        self.labels.draw("mm", node.node_idstr, s[0], s[1], bgcolor=(1.0,1.0,1.0,0.), fgcolor=(0.,0.,0.,1.), z=s[2])
+        self.labels.draw("mm", node.node_name, s[0], s[1] + self.gltext.height, bgcolor=(1.0,1.0,1.0,0.), fgcolor=(0.,0.,0.,1.), z=s[2])
 
         h = self.gltext.height * 2 + 2
 
-        glDisable(GL_TEXTURE_2D)
-
         for anim in node._animations:
-            anim.render_ortho()
+            anim.render_ortho(batch)
 
         #for key, val in node.attrs.items():
             #if key.startswith("etx_data"):
         if "etx_table" in node.attrs:
-            for etx in node.attrs["etx_table"]:
+            for etx in packet_handler.format_etx_table(node.attrs["etx_table"]):
                 self.gltext.drawmm(etx, s[0], s[1] + h, bgcolor=(0,0,0,.3), fgcolor=(1.3,1.3,1.3,1.), z=s[2])
                 h += self.gltext.height
 
@@ -148,32 +181,20 @@ class NodeRenderer:
 
     def _render_progress_bar_mm(self, x, y, z, w, name, capacity, used):
         """ w - width of the progress bar without the frame """
-        glDisable(GL_TEXTURE_2D)
-        # background
-
         xx = round(x - w/2. - 1.)
         yy = round(y - 1.)
         w2 = float(w) * used / capacity if capacity else 0
 
-        glColor4f(0.4, 0.4, 0.4, 1.0)
-        glBegin(GL_TRIANGLE_FAN)
-        glVertex3f(xx, yy, z)
-        glVertex3f(xx + w + 2., yy, z)
-        glVertex3f(xx + w + 2., yy + 3., z)
-        glVertex3f(xx, yy + 3., z)
-        glEnd()
+        # background
+        self._overlay_batch.add_rect(xx, yy, w + 2., 3., z, (0.4, 0.4, 0.4, 1.0))
 
         # the thin progress line
         if used == capacity:
-            glColor4f(1., 0.3, 0.3, 1.0)
+            color = (1., 0.3, 0.3, 1.0)
         else:
-            glColor4f(1., 1., 1., 1.0)
-        glBegin(GL_TRIANGLE_FAN)
-        glVertex3f(xx + 1., yy + 1., z)
-        glVertex3f(xx + 1. + w2, yy + 1., z)
-        glVertex3f(xx + 1. + w2, yy + 2., z)
-        glVertex3f(xx + 1., yy + 2., z)
-        glEnd()
+            color = (1., 1., 1., 1.0)
+        if w2:
+            self._overlay_batch.add_rect(xx + 1., yy + 1., w2, 1., z, color)
 
     # def _build_signal_strength_circles_vbo(self):
     #     """Build a vbo of some concnentric circles. meant to be rendered with GL_LINES."""
@@ -196,21 +217,3 @@ class NodeRenderer:
     #     for angle in range(0, 361, 5):
     #         v.extend([radius * sin(radians(angle)), 0., radius * cos(radians(angle)), r, g, b, a])
     #     return vbo.VBOColor(v)
-
-    def _build_filled_circle_xy_vbo(self, radius):
-        """Build a vbo for the text background. Used with pixel projection. Meant to be rendered with GL_TRIANGLE_FAN."""
-        v = [0., 0., 0.]
-        for angle in range(0, 361, 5):
-            v.extend([radius * sin(radians(angle)), radius * cos(radians(angle)), 0.])
-        return vbo.VBO(v)
-
-    def _build_filled_half_circle_xy_vbo(self, radius, start_angle, end_angle, num_steps):
-        """Build a vbo for the text background. Used with pixel projection. Meant to be rendered with GL_TRIANGLE_FAN."""
-        v = [0., 0., 0.]
-        angle = start_angle
-        start_angle = radians(start_angle)
-        end_angle = radians(end_angle)
-        for i in range(num_steps):
-            angle = start_angle + float(end_angle - start_angle) / (num_steps - 1) * i
-            v.extend([radius * sin(angle), -radius * cos(angle), 0.])
-        return vbo.VBO(v)
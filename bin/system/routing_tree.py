@@ -0,0 +1,150 @@
+"""
+The CTP routing tree of a World, kept up to date one parent change at a time.
+
+Every node has at most one parent, so the parent pointers form trees, except that a component can contain one loop.
+The loop is kept out of the tree: of the parent edges of a loop, the one that closed it is stored separately as a
+"closing edge", and the rest is a normal tree whose root is the node that owns the closing edge. So the tree part is
+always loop-free and every node has a root, a depth and a subtree size.
+
+A parent change detaches the node's subtree and attaches it somewhere else. That costs the depth of the old and the
+new parent plus the size of the moved subtree. Queries cost the size of their answer.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+
+NO_PARENT = 0xFFFF
+
+
+class RoutingTree:
+    def __init__(self):
+        self.parents = {} # node_id: parent_id. every known parent, including the closing edges of loops
+        self.children = {} # node_id: set of child node_ids, tree edges only
+        self.closing = {} # node_id: parent_id. parent edges that closed a loop. the node is the root of its tree
+        self.roots = {} # node_id: root node_id
+        self.depths = {} # node_id: hops to the root
+        self.sizes = {} # node_id: nodes in the subtree, the node included
+        self.num_changes = 0
+
+    def clear(self):
+        self.__init__()
+
+    def _add_node(self, node_id):
+        if node_id not in self.roots:
+            self.roots[node_id] = node_id
+            self.depths[node_id] = 0
+            self.sizes[node_id] = 1
+            self.children[node_id] = set()
+
+    def set_parent(self, node_id, parent_id):
+        """ parent_id : None, 0 or NO_PARENT if the node has no parent. """
+        if not parent_id or parent_id == NO_PARENT:
+            parent_id = None
+        if self.parents.get(node_id) == parent_id and node_id in self.roots:
+            return
+        self._add_node(node_id)
+        self.num_changes += 1
+        self._detach(node_id)
+        if parent_id == None:
+            return
+        self._add_node(parent_id)
+        self.parents[node_id] = parent_id
+        if self.roots[parent_id] == node_id:
+            # the new parent routes through this node
+            self.closing[node_id] = parent_id
+        else:
+            self._attach(node_id, parent_id)
+
+    def _detach(self, node_id):
+        """ Make node_id a root. Breaks the loop it was part of. """
+        parent_id = self.parents.pop(node_id, None)
+        if parent_id == None:
+            return
+        if self.closing.pop(node_id, None) != None:
+            # was the root already
+            return
+
+        self.children[parent_id].discard(node_id)
+        size = self.sizes[node_id]
+        p = parent_id
+        while 1:
+            self.sizes[p] -= size
+            if self.roots[p] == p:
+                break
+            p = self.parents[p]
+        old_root = p
+        self._set_root(node_id, node_id, 0)
+
+        # if the removed edge was part of a loop, the loop is gone and its closing edge becomes a tree edge
+        closing_parent = self.closing.get(old_root)
+        if closing_parent != None and self.roots[closing_parent] == node_id:
+            del self.closing[old_root]
+            self._attach(old_root, closing_parent)
+
+    def _attach(self, node_id, parent_id):
+        """ Put the tree of root node_id under parent_id. Must not create a loop. """
+        self.children[parent_id].add(node_id)
+        size = self.sizes[node_id]
+        p = parent_id
+        while 1:
+            self.sizes[p] += size
+            if self.roots[p] == p:
+                break
+            p = self.parents[p]
+        self._set_root(node_id, self.roots[parent_id], self.depths[parent_id] + 1)
+
+    def _set_root(self, node_id, root_id, depth):
+        stack = [(node_id, depth)]
+        while stack:
+            n, d = stack.pop()
+            self.roots[n] = root_id
+            self.depths[n] = d
+            stack.extend((c, d + 1) for c in self.children[n])
+
+    def get_parent(self, node_id):
+        return self.parents.get(node_id)
+
+    def get_children(self, node_id):
+        """ Return ids of the nodes whose parent is node_id. """
+        children = list(self.children.get(node_id, ()))
+        # the node that closed a loop is not a tree child of its parent
+        children.extend(n for n, p in self.closing.iteritems() if p == node_id)
+        return children
+
+    def get_depth(self, node_id):
+        """ Return hops from node_id to the node without a parent. None if the node is in or behind a loop. """
+        root_id = self.roots.get(node_id)
+        if root_id == None or root_id in self.closing:
+            return None
+        return self.depths[node_id]
+
+    def get_subtree_size(self, node_id):
+        """ Return the number of nodes routed through node_id, node_id included. """
+        return self.sizes.get(node_id, 0)
+
+    def get_routed_through(self, node_id):
+        """ Return ids of every node whose packets go through node_id, not including node_id. Of a loop, only the
+        nodes between node_id and the node that closed the loop are included. """
+        result = []
+        stack = list(self.children.get(node_id, ()))
+        while stack:
+            n = stack.pop()
+            result.append(n)
+            stack.extend(self.children[n])
+        return result
+
+    def get_loops(self):
+        """ Return [[node_id, ..], ..] of the current routing loops, each in routing order. """
+        loops = []
+        for root_id, parent_id in self.closing.iteritems():
+            loop = [root_id]
+            n = parent_id
+            while n != root_id:
+                loop.append(n)
+                n = self.parents[n]
+            loops.append(loop)
+        return loops
+
+    def get_num_loops(self):
+        return len(self.closing)
@@ -0,0 +1,151 @@
+"""
+Screenshots without stalling the render thread.
+
+    screenshotter = Screenshotter("../screenshots")
+    while 1:
+        screenshotter.tick() # maps the previous frame readback and hands it to the worker thread
+        render()
+        if wanted:
+            screenshotter.capture(w, h, "autoscreenshot_") # before swap
+        swap()
+
+capture() starts an asynchronous glReadPixels into a pixel buffer object. The gpu copies the pixels while the
+program continues. The buffer is mapped on the next tick(), when the copy has finished. Png encoding and writing
+happens on a worker thread with a bounded queue - if the worker can't keep up, new screenshots are dropped.
+A screenshot identical to the previous one is not encoded again.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import os
+import time
+import ctypes
+import hashlib
+import threading
+import Queue
+
+from OpenGL.GL import *
+from copenglconstants import * # import to silence opengl enum errors for pycharm. pycharm can't see pyopengl enums.
+
+from PIL import Image
+
+
+def get_screenshot_filename(filename_prefix):
+    """ Return filename_prefix20090404_120211_utc.png """
+    utc = time.gmtime(time.time())
+    return filename_prefix + "%04i%02i%02i_%02i%02i%02i_utc.png" % \
+           (utc.tm_year, utc.tm_mon, utc.tm_mday,                  \
+            utc.tm_hour, utc.tm_min, utc.tm_sec)
+
+
+class ScreenshotWriter:
+    """ Encodes and writes screenshots on a worker thread. """
+    def __init__(self, max_queue=2):
+        self._queue = Queue.Queue(max_queue)
+        self._last_hash = None # touched only by the worker thread
+        self._thread = threading.Thread(target=self._run, name="screenshot writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, filename, w, h, pixels):
+        """ pixels : str of bottom-up RGBA rows. Return False if the queue is full and the screenshot was dropped. """
+        try:
+            self._queue.put_nowait((filename, w, h, pixels))
+            return True
+        except Queue.Full:
+            llog.warning("screenshot writer is busy. dropping screenshot '%s'", filename)
+            return False
+
+    def _run(self):
+        while 1:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception:
+                llog.exception("saving screenshot '%s' failed", item[0])
+
+    def _write(self, filename, w, h, pixels):
+        h_ = hashlib.md5(pixels)
+        h_.update("%ix%i" % (w, h))
+        digest = h_.digest()
+        if digest == self._last_hash:
+            llog.info("screen unchanged since the previous screenshot. not saving '%s'", filename)
+            return
+        self._last_hash = digest
+
+        llog.info("saving screenshot '%s'", filename)
+        i = Image.frombuffer("RGBA", (w, h), pixels, "raw", "RGBA", 0, -1).convert("RGB")
+        i.save(filename)
+
+    def close(self, timeout=5.):
+        """ Write the queued screenshots and stop the thread. """
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            llog.warning("screenshot writer didn't finish in %.1f s", timeout)
+
+
+class Screenshotter:
+    def __init__(self, path, max_queue=2):
+        """ path : screenshots are saved to this folder.
+        max_queue : number of screenshots waiting to be encoded before new ones are dropped. """
+        self.path = path
+        self.writer = ScreenshotWriter(max_queue)
+        # (pbo, w, h, filename) of the readback started in capture(). mapped in tick().
+        self._pending = None
+        self._pbo = None
+
+        try:
+            self._pbo = glGenBuffers(1)
+        except Exception:
+            llog.exception("pixel buffer objects not available. screenshots will stall the render thread")
+
+    def capture(self, w, h, filename_prefix="screenshot_"):
+        """ Start reading the current back buffer. Call after rendering, before swapping buffers. """
+        if self._pending:
+            # capture twice in the same frame? finish the first one synchronously.
+            self.tick()
+
+        filename = os.path.join(self.path, get_screenshot_filename(filename_prefix))
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+
+        if self._pbo:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, self._pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, 4 * w * h, None, GL_STREAM_READ)
+            # with a pack buffer bound, the last argument is an offset into the buffer and the call returns immediately
+            glReadPixels(0, 0, w, h, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self._pending = (w, h, filename)
+        else:
+            pixels = (ctypes.c_ubyte * (4 * w * h))()
+            glReadPixels(0, 0, w, h, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+            self.writer.put(filename, w, h, ctypes.string_at(pixels, 4 * w * h))
+
+    def tick(self):
+        """ Call once per main loop iteration. Collects the pixels of the readback started in the previous frame. """
+        if not self._pending:
+            return
+        w, h, filename = self._pending
+        self._pending = None
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, self._pbo)
+        ptr = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
+        if ptr:
+            # copy out of the mapped memory. the buffer is reused by the next capture.
+            pixels = ctypes.string_at(ptr, 4 * w * h)
+            glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.writer.put(filename, w, h, pixels)
+        else:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            llog.error("glMapBuffer failed. screenshot '%s' lost", filename)
+
+    def close(self):
+        self.tick()
+        self.writer.close()
+        if self._pbo:
+            glDeleteBuffers(1, [self._pbo])
+            self._pbo = None
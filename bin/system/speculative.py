@@ -0,0 +1,79 @@
+"""
+Speculative live view. Packets are applied to the visible world the moment they arrive, before the sync buffer
+has sorted them. The sorted packets confirm them later. If the sorted stream disagrees with what was applied -
+packets came out in a different order than they arrived, or some were never applied - the node attributes of the
+visible world are rolled back to the confirmed state and the packets still waiting for confirmation are applied
+again on top. Running animations are kept.
+
+handle_packet() changes only the node that sent the packet, so only the order of packets of the same node matters.
+Packets of different nodes that were sorted to a different order than they arrived in don't cause a rollback.
+
+The confirmed state is a world that handles the sorted packets anyway (NodeEditor.underworld), so the checkpoint
+costs nothing to keep.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import copy
+import collections
+
+import packet_handler
+
+
+class SpeculativeView:
+    def __init__(self, world):
+        """ world : the visible world. Has to be in the confirmed state at first. """
+        self.world = world
+        # [(timestamp, packet, stream_id), ..] applied to the world, but not yet seen in the sorted stream.
+        # in arrival order.
+        self.pending = collections.deque()
+
+        # statistics
+        self.num_applied = 0
+        self.num_confirmed = 0
+        self.num_rollbacks = 0
+
+    def apply(self, timestamp, packet, stream_id):
+        """ Show a packet that just arrived. stream_id : the node id. """
+        packet_handler.handle_packet(packet, self.world, timestamp=timestamp)
+        self.pending.append( (timestamp, packet, stream_id) )
+        self.num_applied += 1
+
+    def confirm(self, sorted_packets, in_order=True):
+        """ sorted_packets : [(timestamp, packet), ..] that left the sync buffer. The packet strings have to be the
+        same objects that were given to apply().
+        in_order : False for late packets. they belong before packets that were already sorted.
+        Return False if the visible world disagrees with the sorted stream and needs rollback(). """
+        pending = self.pending
+        agree = in_order or not sorted_packets
+        for timestamp, packet in sorted_packets:
+            if pending and pending[0][1] is packet:
+                pending.popleft()
+                self.num_confirmed += 1
+                continue
+
+            for i, p in enumerate(pending):
+                if p[1] is packet:
+                    # applied after a packet that was sorted later. matters only if it was the same node.
+                    stream_id = p[2]
+                    for j in xrange(i):
+                        if pending[j][2] == stream_id:
+                            agree = False
+                            break
+                    del pending[i]
+                    self.num_confirmed += 1
+                    break
+            else:
+                # never applied. arrived before the speculative view started.
+                agree = False
+        return agree
+
+    def rollback(self, confirmed_world):
+        """ Reset node attributes to confirmed_world and apply the pending packets again. """
+        for node in confirmed_world.nodes:
+            self.world.get_create_node(node.node_id).attrs = copy.deepcopy(node.attrs)
+        self.world.sync_routing_tree()
+        for timestamp, packet, stream_id in self.pending:
+            packet_handler.handle_packet(packet, self.world, barebones=True)
+        self.num_rollbacks += 1
@@ -0,0 +1,228 @@
+"""
+History of node attributes that the world only keeps the latest value of - buffer usage, radio power state, etx to
+the parent - and of the retry count of every sent packet. One ring buffer per node and metric, filled as packets are
+ingested, so a window of history is a binary search and a copy instead of a seek and a replay.
+
+A sample is stored only when the value changes; a value holds until the next sample. A series keeps at most
+capacity samples and forgets the oldest first. Buffers start small and grow up to the capacity, so quiet nodes cost
+little.
+
+Recordings carry the samples in "S" lines (see recording.py), so opening a recording doesn't replay anything to get
+the history either.
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+import numpy
+
+import packet_handler
+
+
+METRICS = ("ctpf_buf_used", "ctpf_buf_capacity", "radiopowerstate", "parent_etx", "retry_count")
+
+
+class RingSeries:
+    INITIAL_SIZE = 16
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        size = min(capacity, self.INITIAL_SIZE)
+        self.times = numpy.empty(size, numpy.float64)
+        self.values = numpy.empty(size, numpy.float32)
+        self.start = 0 # index of the oldest sample
+        self.count = 0
+        self.version = 0 # changes with every stored sample. for caches of the samples
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, v):
+        """ Return True if the sample was stored - it changed the value, or came out of order. """
+        n = len(self.times)
+        if self.count:
+            last = (self.start + self.count - 1) % n
+            if t < self.times[last]:
+                return self._insert(t, v)
+            if self.values[last] == v:
+                return False
+        if self.count == n:
+            if n < self.capacity:
+                self._grow()
+                n = len(self.times)
+            else:
+                # full. overwrite the oldest.
+                self.start = (self.start + 1) % n
+                self.count -= 1
+        i = (self.start + self.count) % n
+        self.times[i] = t
+        self.values[i] = v
+        self.count += 1
+        self.version += 1
+        return True
+
+    def _linearize(self):
+        """ Move the samples to the start of the buffers, oldest first. """
+        if self.start:
+            self.times[:] = numpy.roll(self.times, -self.start)
+            self.values[:] = numpy.roll(self.values, -self.start)
+            self.start = 0
+
+    def _grow(self):
+        self._linearize()
+        size = min(self.capacity, len(self.times) * 2)
+        self.times = numpy.resize(self.times, size)
+        self.values = numpy.resize(self.values, size)
+
+    def _insert(self, t, v):
+        """ Insert a sample older than the newest one. Costs the samples after it; late packets land near the end. """
+        self._linearize()
+        if self.count == len(self.times) and self.count < self.capacity:
+            self._grow()
+        times, values, count = self.times, self.values, self.count
+        i = numpy.searchsorted(times[:count], t, "right")
+        if count < len(times):
+            times[i+1:count+1] = times[i:count]
+            values[i+1:count+1] = values[i:count]
+            self.count += 1
+        elif i == 0:
+            # full, and older than everything kept
+            return False
+        else:
+            # full. the oldest goes.
+            i -= 1
+            times[:i] = times[1:i+1]
+            values[:i] = values[1:i+1]
+        times[i] = t
+        values[i] = v
+        self.version += 1
+        return True
+
+    def _search(self, t, side):
+        """ Return the position of t among the samples, oldest is 0. side as in numpy.searchsorted. """
+        n = len(self.times)
+        end = self.start + self.count
+        if end <= n:
+            return numpy.searchsorted(self.times[self.start:end], t, side)
+        a = self.times[self.start:]
+        b = self.times[:end - n]
+        if t < b[0] or (side == "left" and t == b[0]):
+            return numpy.searchsorted(a, t, side)
+        return len(a) + numpy.searchsorted(b, t, side)
+
+    def _get(self, i1, i2):
+        """ Return copies of (times, values) of samples i1..i2, oldest is 0. """
+        n = len(self.times)
+        j1 = self.start + i1
+        j2 = self.start + i2
+        if j2 <= n or j1 >= n:
+            s = slice(j1 % n, (j2 - 1) % n + 1) if i2 > i1 else slice(0, 0)
+            return self.times[s].copy(), self.values[s].copy()
+        return numpy.concatenate((self.times[j1:], self.times[:j2 - n])), \
+               numpy.concatenate((self.values[j1:], self.values[:j2 - n]))
+
+    def get_window(self, t1, t2):
+        """ Return (times, values) of the samples between t1 and t2, and the one before t1 that holds at t1. """
+        if not self.count:
+            return self._get(0, 0)
+        i1 = max(self._search(t1, "right") - 1, 0)
+        i2 = self._search(t2, "right")
+        return self._get(i1, i2)
+
+    def get_all(self):
+        return self._get(0, self.count)
+
+    def get_memory_estimate(self):
+        return self.times.nbytes + self.values.nbytes
+
+
+class TimeSeriesStore:
+    def __init__(self, capacity=1024, keep_new=False):
+        """ capacity : samples kept per node and metric.
+        keep_new : collect the stored samples for pop_new(). for writing recordings. """
+        self.capacity = capacity
+        self.series = {} # (node_id, metric): RingSeries
+        self.new_samples = [] if keep_new else None # [(metric, node_id, t, v), ..]
+        self.num_samples = 0
+
+    def record(self, node_id, metric, t, v):
+        s = self.series.get((node_id, metric))
+        if s == None:
+            s = self.series[(node_id, metric)] = RingSeries(self.capacity)
+        if s.append(t, v):
+            self.num_samples += 1
+            if self.new_samples != None:
+                self.new_samples.append((metric, node_id, t, v))
+
+    def ingest(self, timestamp, msg, world):
+        """ Record the metrics in a packet. Values come from the packet itself, so late packets can be ingested
+        before the world has handled them. The world is only needed for the parent and the etx table. """
+        d = msg.split()
+        if len(d) < 5 or (d[0] != "data" and d[0] != "event"):
+            return
+        kind = d[1]
+        if kind == "ctpf_buf_size":
+            node_id = world.get_create_named_node(d[4]).node_id
+            self.record(node_id, "ctpf_buf_used", timestamp, int(d[6]))
+            self.record(node_id, "ctpf_buf_capacity", timestamp, int(d[8]))
+        elif kind == "radiopowerstate":
+            node_id = world.get_create_named_node(d[4]).node_id
+            self.record(node_id, "radiopowerstate", timestamp, int(d[6], 16))
+        elif kind == "etx":
+            # ['data', 'etx', '0001000000000200', 'node', '0A', 'index', '0', 'neighbor', '8', 'etx', '10', 'retx', '74']
+            node = world.get_create_named_node(d[4])
+            if int(d[8]) == world.routing_tree.get_parent(node.node_id):
+                etx = packet_handler.ETX_NO_ROUTE if d[10].startswith("NO_ROUTE") else int(d[10])
+                self.record(node.node_id, "parent_etx", timestamp, etx)
+        elif kind == "send_done":
+            # ['event', 'send_done', '1425601510.21', 'node', '2C13_8', 'rm', '0x02', 'dest', '0x37B6', 'amid', '0x71',
+            #  'error', '0x00', 'retry_count', '9', ..]
+            node_id = world.get_create_named_node(d[4]).node_id
+            self.record(node_id, "retry_count", timestamp, int(d[14], 16))
+        elif kind == "beacon":
+            # ['event', 'beacon', '0052451410156550', 'node', '04', 'options', '0x00', 'parent', '0x0003', 'etx', '30']
+            node = world.get_create_named_node(d[4])
+            parent = int(d[8], 16)
+            table = node.attrs.get("etx_table")
+            if table:
+                for i in xrange(0, len(table), 3):
+                    if table[i] == parent:
+                        self.record(node.node_id, "parent_etx", timestamp, table[i+1])
+                        break
+
+    def get_window(self, node_id, metric, t1, t2):
+        """ Return (times, values) numpy arrays. The first sample can be before t1 - the value at t1. """
+        s = self.series.get((node_id, metric))
+        if s == None:
+            return numpy.empty(0, numpy.float64), numpy.empty(0, numpy.float32)
+        return s.get_window(t1, t2)
+
+    def get_node_ids(self, metric):
+        return sorted(node_id for node_id, m in self.series if m == metric)
+
+    def pop_new(self):
+        """ Return the samples stored since the last call, {metric: [node_id, t, v, node_id, t, v, ..], ..} """
+        result = {}
+        for metric, node_id, t, v in self.new_samples:
+            result.setdefault(metric, []).extend((node_id, t, v))
+        self.new_samples = []
+        return result
+
+    def to_json(self):
+        """ Return every sample in the format of pop_new(). """
+        result = {}
+        for (node_id, metric), s in sorted(self.series.iteritems()):
+            times, values = s.get_all()
+            rows = result.setdefault(metric, [])
+            for t, v in zip(times.tolist(), values.tolist()):
+                rows.extend((node_id, t, v))
+        return result
+
+    def add_json(self, samples):
+        """ samples : output of pop_new() or to_json() """
+        for metric, rows in samples.iteritems():
+            for i in xrange(0, len(rows), 3):
+                self.record(rows[i], metric, rows[i+1], rows[i+2])
+
+    def get_memory_estimate(self):
+        return sum(s.get_memory_estimate() for s in self.series.itervalues())
@@ -0,0 +1,50 @@
+"""
+Fixed-timestep scheduler. Decouples the simulation (world animations, packet playback, graph window
+movement) from the render rate, so a slow frame doesn't stretch or slow down the simulation.
+
+    timestep = FixedTimestep(1. / 60)
+    while 1:
+        for i in range(timestep.advance(frame_dt)):
+            world.tick(timestep.step_seconds)
+        render(timestep.alpha)
+"""
+
+import logging
+llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
+
+
+class FixedTimestep:
+    def __init__(self, step_seconds=1./60, max_steps_per_frame=30, max_backlog_seconds=2.):
+        """ max_steps_per_frame : catch up in batches of at most this many steps per rendered frame.
+        the rest is left for the following frames.
+        max_backlog_seconds : if the simulation itself can't keep up, drop simulation time above this backlog
+        instead of trying to catch up forever. """
+        self.step_seconds = step_seconds
+        self.max_steps_per_frame = max_steps_per_frame
+        self.max_backlog_seconds = max_backlog_seconds
+
+        # how far the rendered frame is between the previous and the last simulation step. 0..1.
+        # use for interpolating the rendered state.
+        self.alpha = 1.
+
+        self.dropped_seconds = 0. # statistics
+        self._accumulator = 0.
+
+    def advance(self, dt):
+        """ Add dt seconds of real time. Return the number of simulation steps to run for this frame. """
+        self._accumulator += dt
+
+        if self._accumulator > self.max_backlog_seconds:
+            dropped = self._accumulator - self.max_backlog_seconds
+            self.dropped_seconds += dropped
+            self._accumulator = self.max_backlog_seconds
+            llog.warning("simulation can't keep up. dropped %.3f s of simulation time", dropped)
+
+        num_steps = min(int(self._accumulator / self.step_seconds), self.max_steps_per_frame)
+        self._accumulator -= num_steps * self.step_seconds
+        self.alpha = min(1., self._accumulator / self.step_seconds)
+        return num_steps
+
+    def get_backlog(self):
+        """ Return seconds of simulation time that is waiting to be stepped through. """
+        return self._accumulator
@@ -90,6 +90,43 @@ class VBOColor:
         # glBindBuffer(GL_ARRAY_BUFFER, 0)
 
 
+class DynamicVBO:
+    """
+    a vertex buffer that is rewritten often. vertices is a float32 numpy array of (x, y) or (x, y, z) rows.
+        vbo = DynamicVBO()
+        vbo.update(numpy.array([[0.,0.], [1.,0.]], dtype=numpy.float32))
+        vbo.draw(GL_LINES)
+    """
+    def __init__(self):
+        self.vbo = None
+        self.num_vertices = 0
+        self.num_components = 2
+
+    def update(self, vertices):
+        if self.vbo == None:
+            self.vbo = glGenBuffers(1)
+        self.num_vertices = len(vertices)
+        self.num_components = vertices.shape[1] if self.num_vertices else 2
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices if self.num_vertices else None, GL_STREAM_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, elemtype):
+        if not self.num_vertices:
+            return
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(self.num_components, GL_FLOAT, 0, None)
+        glDrawArrays(elemtype, 0, self.num_vertices)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def close(self):
+        if self.vbo != None:
+            glDeleteBuffers(1, [self.vbo])
+            self.vbo = None
+
+
 # class VBOIndexed:
 #     def __init__(self, indices, vertices_with_normals):
 #         """ vertices_with_normals : interlaced """
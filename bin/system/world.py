@@ -7,9 +7,13 @@ llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
 
 import math
 import copy
+import json
 
 import vector
 import world_objects
+import routing_tree
+import link_stats
+import packet_handler
 
 
 class World:
@@ -23,15 +27,30 @@ class World:
         # saved when closing the windows. loaded at startup.
         self.session_node_positions = {} # {"0x31FE": (x,y), ..}
 
+        # node "parent" attrs as a tree. change parents with set_node_parent() to keep it up to date.
+        self.routing_tree = routing_tree.RoutingTree()
+        # traffic and retries of the last conf.link_stats_window_seconds. not in keyframes; filled by handle_packet()
+        # calls that give the packet timestamp.
+        self.link_stats = link_stats.LinkStats(conf.link_stats_window_seconds)
+
 #        self.deserialize_world(serialized_world_jsn)
 
     def serialize_node(self, node):
+        attrs = node.attrs
+        etx_table = attrs.get("etx_table")
+        if etx_table != None:
+            attrs = dict(attrs)
+            del attrs["etx_table"]
+        attrs = copy.deepcopy(attrs)
+        if etx_table != None:
+            # a flat list of numbers is ready for json as it is
+            attrs["etx_table"] = etx_table.tolist()
         return {
             "node_id": node.node_id,
             "node_idstr": node.node_idstr,
             "name": node.node_name,
             "color": node.node_color,
-            "attrs": copy.deepcopy(node.attrs),
+            "attrs": attrs,
         }
 
     # def serialize_link(self, link):
@@ -70,7 +89,15 @@ class World:
         node = world_objects.Node( vector.Vector(pos), dct["node_id"], dct["color"] )
         node.node_idstr = dct["node_idstr"]
         node.node_name = dct["name"]
-        node.attrs = copy.deepcopy(dct["attrs"])
+        attrs = dct["attrs"]
+        etx_table = attrs.get("etx_table")
+        if etx_table != None:
+            # deepcopy is slow for a long list of numbers. copied separately.
+            attrs = dict(attrs)
+            del attrs["etx_table"]
+        node.attrs = copy.deepcopy(attrs)
+        if etx_table != None:
+            node.attrs["etx_table"] = packet_handler.etx_table_from_json(etx_table)
         return node
 
     def deserialize_world(self, dct):
@@ -88,6 +115,24 @@ class World:
                 node = self.deserialize_node(node_dict)
                 self.nodes.append(node)
                 self.nodes_dict[node.node_id] = node
+        self.routing_tree.clear()
+        self.sync_routing_tree()
+        self.link_stats.clear()
+
+    def set_node_parent(self, node, parent_id):
+        """ Set the "parent" attr of a node. Creates the parent node if it doesn't exist. """
+        node.attrs["parent"] = parent_id
+        if parent_id and parent_id != routing_tree.NO_PARENT:
+            self.get_create_node(parent_id)
+        self.routing_tree.set_parent(node.node_id, parent_id)
+
+    def sync_routing_tree(self):
+        """ Update the routing tree after node attrs were replaced directly. """
+        for node in list(self.nodes):
+            parent_id = node.attrs.get("parent")
+            if parent_id and parent_id != routing_tree.NO_PARENT:
+                self.get_create_node(parent_id)
+            self.routing_tree.set_parent(node.node_id, parent_id)
 
     def get_link(self, src_node, dst_node):
         """ create a new link object if not found from self.links.
@@ -155,6 +200,23 @@ class World:
 
         return node
 
+    def load_session_node_positions(self, filename):
+        """ load node positions saved by the node editor. write to self.session_node_positions
+        return the whole session dict, or None if there's no session file. """
+        try:
+            with open(filename, "rb") as f:
+                session_conf = json.load(f)
+        except IOError:
+            #log.warning("'%s' file not found" % path)
+            session_conf = None
+
+        # extract node positions from the conf dict
+        if session_conf and "node_positions" in session_conf:
+            c = session_conf.get("node_positions")
+            # convert entries {"0x51AB": (1,2,3), ..} to format {20907, (1,2,3)}
+            self.session_node_positions = {int(k, 16): v for k, v in c.items()}
+        return session_conf
+
     def get_node_session_pos(self, node_id):
         if node_id not in self.session_node_positions:
             h = 0.
@@ -166,10 +228,15 @@ class World:
             return self.session_node_positions[node_id]
 
     def tick(self, dt):
+        """ return True if any link or node is still animating. """
+        animating = False
         for link in self.links:
-            link.tick(dt)
+            if link.tick(dt):
+                animating = True
         for node in self.nodes:
-            node.tick(dt)
+            if node.tick(dt):
+                animating = True
+        return animating
 
     # def save_graph_file(self, filename="sensormap.txt"):
     #     d = {"format": "sensed node graph", "format_version": "2013-12-19", "nodes": [], "edges": []}
@@ -45,6 +45,9 @@ class Link:
         self._busy_age = 0.
 
     def tick(self, dt):
+        """ return True if the link looks different after this tick. """
+        # the state before the tick also counts. the frame where an animation disappears has to be drawn too.
+        changed = self._just_poked or self._usage > 0. or self._link_busy or bool(self._animations)
         self._usage -= 5. * dt
         self._usage = max(0., self._usage)
         if self._link_busy:
@@ -56,6 +59,7 @@ class Link:
         for anim in self._animations:
             anim.tick(dt)
         self._animations = [anim for anim in self._animations if not anim.dead]
+        return changed
 
 
 class Node:
@@ -95,9 +99,12 @@ class Node:
         self._animations.append(anim_obj)
 
     def tick(self, dt):
+        """ return True if the node was animating. the frame where the last animation disappears has to be drawn too. """
+        changed = bool(self._animations)
         for anim in self._animations:
             anim.tick(dt)
         self._animations = [anim for anim in self._animations if not anim.dead]
+        return changed
 
     def intersects(self, sx, sy):
         p = self.screen_pos
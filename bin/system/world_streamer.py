@@ -1,6 +1,6 @@
 """
 
-TODO: save/load the stream?
+save/load the stream: see recording.py
 TODO: make keyframe timestamps non-inclusive
 
 
@@ -20,37 +20,165 @@ generation. The other world instance is never visible and can skip generating an
 
 
 # NB! this system DROPS packets that arrive later than the sync_window_seconds.
-NB! this system OVERWRITES packet timestamps for packets that arrive later than the sync_window_seconds.
+NB! without a keyframe_world, this system OVERWRITES packet timestamps for packets that arrive later than the
+sync_window_seconds.
+
+late packets:
+
+    with a keyframe_world, a packet that arrives later than the sync window is inserted at its own time to the
+    keyframeslot it belongs to. keyframes after that slot don't contain the packet and are marked stale. stale
+    keyframes are regenerated lazily by regenerate_stale_keyframes(), or immediately if seek needs one.
+    keyframeslots from first_stale_slot to the end are stale. a keyframe serialized from a world that hasn't caught
+    up with the late packets yet is put as stale too, so nothing has to be regenerated to make the next keyframe.
 
 """
 
 import logging
 llog = logging.getLogger(__name__) # the name 'log' is taken in sdl2
 
+import sys
 import time
+import json
+import math
+
+import packet_handler
+import clock_sync
+import rate_pyramid
+import logging_setup
+
+llog_limited = logging_setup.RateLimitedLogger(llog)
+
+
+def estimate_size(obj):
+    """ Return approximate memory usage of obj in bytes. Follows dicts, lists and tuples; shared objects are counted
+    every time they're referenced. """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.iteritems():
+            size += estimate_size(k) + estimate_size(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            size += estimate_size(v)
+    return size
+
+
+class LatenessHistogram:
+    """ Decaying histogram of packet lateness in seconds. Log-scale buckets from 1 ms to 1000 s, 20 per decade. """
+    MIN_SECONDS = 0.001
+    BUCKETS_PER_DECADE = 20
+    NUM_BUCKETS = 6 * BUCKETS_PER_DECADE + 2 # first is up to MIN_SECONDS, last is everything above 1000 s
+
+    def __init__(self):
+        self.counts = [0.] * self.NUM_BUCKETS
+        self.total = 0.
+
+    def add(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            i = 0
+        else:
+            i = min(int(math.log10(seconds / self.MIN_SECONDS) * self.BUCKETS_PER_DECADE) + 1, self.NUM_BUCKETS - 1)
+        self.counts[i] += 1.
+        self.total += 1.
+
+    def decay(self, factor):
+        """ Multiply the weight of every sample so far by factor. """
+        self.counts = [c * factor for c in self.counts]
+        self.total *= factor
+
+    def get_percentile(self, percentile):
+        """ Return lateness in seconds. The upper edge of the bucket that contains the percentile, so never less
+        than the real value. 0 if empty. """
+        limit = self.total * percentile / 100.
+        acc = 0.
+        bucket = None
+        for i, c in enumerate(self.counts):
+            if c:
+                bucket = i
+                acc += c
+                if acc >= limit:
+                    break
+        if bucket == None:
+            return 0.
+        return self.MIN_SECONDS * 10. ** (float(bucket) / self.BUCKETS_PER_DECADE)
+
+
+class StreamStats:
+    """ statistics of one SyncBuffer input stream """
+    def __init__(self):
+        self.num_packets = 0
+        self.last_timestamp = None
+        self.last_arrival_time = None
+        # how old the timestamp of the last packet was when it arrived. transport delay + clock difference.
+        # after clock correction, if the stream has a clock estimator.
+        self.last_lag = 0.
+        self.lateness = LatenessHistogram()
+        self.clock = None # clock_sync.ClockEstimator
 
 
 class KeyframeSlot:
-    def __init__(self, timestamp, keyframe, packets=None):
+    def __init__(self, timestamp, keyframe, packets=None, keyframe_json=None):
         self.timestamp = timestamp
+        # None if the keyframe is kept only as keyframe_json. recordings are loaded so and the json is decoded on seek.
         self.keyframe = keyframe
+        self.keyframe_json = keyframe_json
+        self.keyframe_bytes = 0 # estimated memory used by the keyframe
         # [(timestamp, packet), ..]
         self.packets = [] if packets == None else packets
 
+    def get_keyframe(self):
+        if self.keyframe == None:
+            return json.loads(self.keyframe_json)
+        return self.keyframe
+
 
 class SyncBuffer:
     """ timesynchronize objects from in-order streams. add timestamp/stream_id/object triples, get timesorted objects back. """
-    def __init__(self, sync_window_seconds=5.):
+
+    # adaptive window. see __init__
+    UPDATE_PERIOD_SECONDS = 1.
+    LATENESS_HALFLIFE_SECONDS = 300. # old lateness samples lose weight. a big lag raises the window at once.
+    STREAM_TIMEOUT_SECONDS = 60. # silent streams don't hold back the others
+    # until a stream has this many packets, its lateness is unknown and it doesn't affect the window. the max window
+    # is used until at least one active stream is measured. counted without decay; the decayed histogram total of a
+    # stream sending less than once in about 9 s never reaches this.
+    MIN_STREAM_SAMPLES = 50
+
+    def __init__(self, sync_window_seconds=5., keep_late_packets=False, lateness_percentile=None, min_window_seconds=0.,
+                 clock_sync_threshold_seconds=None):
         """ sync_window_seconds - will only return entries that are older than this.
-        if None, then return entries as soon as they arrive; no sorting. """
+        if None, then return entries as soon as they arrive; no sorting.
+        keep_late_packets - if True, then packets older than the last sorted packet keep their timestamps and are
+        returned by get_late_packets(). otherwise their timestamps are clamped to the last sorted packet.
+        lateness_percentile - if given, the window adapts: it's the largest lateness percentile (99.9 for example) of
+        the active streams, between min_window_seconds and sync_window_seconds. starts at sync_window_seconds.
+        clock_sync_threshold_seconds - if given, then the clock offset and drift of every stream is estimated and
+        timestamps are corrected before sorting. see clock_sync.py """
         self.sync_window_seconds = sync_window_seconds
+        self.max_window_seconds = sync_window_seconds
+        self.min_window_seconds = min_window_seconds
+        self.lateness_percentile = lateness_percentile if sync_window_seconds != None else None
+        self.keep_late_packets = keep_late_packets
+        self.clock_sync_threshold_seconds = clock_sync_threshold_seconds
+        self._window_update_time = 0.
         self.streams = {} # stream_id: packets_list
         self.sorted_packets = [] # [(timestamp, packet), ..]
+        self.late_packets = [] # [(timestamp, packet), ..]
         self.last_sorted_time = None
 
+        # statistics
+        self.stream_stats = {} # stream_id: StreamStats
+        self.num_timestamps_overwritten = 0 # packet was older than the previous packet of the same stream
+        self.num_timestamps_clamped = 0 # packet arrived later than sync_window_seconds; older than the last sorted packet
+
     def tick(self):
         """ Run the sorting algorithm on the received packets given to put_packet() """
         # get all older than sync_window_seconds packets and append them in order to the last keyframeslot packets-list.
+        if self.lateness_percentile:
+            t = time.time()
+            if t - self._window_update_time >= self.UPDATE_PERIOD_SECONDS:
+                self._update_window(t, t - self._window_update_time)
+                self._window_update_time = t
+
         if self.streams:
             t = time.time()
             streams = self.streams.values()
@@ -72,12 +200,38 @@ class SyncBuffer:
                 else:
                     break
 
+    def _update_window(self, t, dt):
+        window = self.min_window_seconds
+        num_measured = num_cold = 0
+        for stats in self.stream_stats.itervalues():
+            if t - stats.last_arrival_time > self.STREAM_TIMEOUT_SECONDS:
+                continue
+            if stats.num_packets < self.MIN_STREAM_SAMPLES:
+                num_cold += 1
+                continue
+            num_measured += 1
+            window = max(window, stats.lateness.get_percentile(self.lateness_percentile))
+        if num_cold and not num_measured:
+            window = self.max_window_seconds
+        self.sync_window_seconds = min(window, self.max_window_seconds)
+
+        decay = 0.5 ** (min(dt, self.LATENESS_HALFLIFE_SECONDS) / self.LATENESS_HALFLIFE_SECONDS)
+        for stats in self.stream_stats.itervalues():
+            stats.lateness.decay(decay)
+
     def get_sorted_packets(self):
         """ Return [(timestamp, packet), ..], clear local buf. """
         l = self.sorted_packets
         self.sorted_packets = []
         return l
 
+    def get_late_packets(self):
+        """ Return [(timestamp, packet), ..] of packets older than the last sorted packet, clear local buf.
+        Always empty if keep_late_packets is False. """
+        l = self.late_packets
+        self.late_packets = []
+        return l
+
     def put_packet(self, timestamp, packet, stream_id):
         """ Add a packet. Will decide if the packet is too old and disdcard it, or how to order it if not.
         This is not a general solution to the syncing problem - assumes that packets with the same stream_id are ordered. """
@@ -85,10 +239,25 @@ class SyncBuffer:
         if not stream:
             stream = self.streams[stream_id] = []
 
+        stats = self.stream_stats.get(stream_id)
+        if not stats:
+            stats = self.stream_stats[stream_id] = StreamStats()
+            if self.clock_sync_threshold_seconds != None:
+                stats.clock = clock_sync.ClockEstimator(self.clock_sync_threshold_seconds)
+        stats.num_packets += 1
+        stats.last_arrival_time = time.time()
+        if stats.clock:
+            stats.clock.add(timestamp, stats.last_arrival_time)
+            timestamp = stats.clock.correct(timestamp)
+        stats.last_timestamp = timestamp
+        stats.last_lag = stats.last_arrival_time - timestamp
+        stats.lateness.add(stats.last_lag)
+
         if stream:
             if stream[-1][0] > timestamp:
-                llog.warning("overwriting timestamp (%.2f s) for packet: %s", stream[-1][0] - timestamp, packet)
+                llog_limited.warning("overwriting timestamp (%.2f s) for packet: %s", stream[-1][0] - timestamp, packet)
                 timestamp = stream[-1][0]
+                self.num_timestamps_overwritten += 1
 
             #assert stream[-1][0] <= timestamp, "\nnew packet %s: %s\nold packet %s: %s\n" % (timestamp, packet, stream[-1][0], stream[-1][1])
 
@@ -98,25 +267,49 @@ class SyncBuffer:
         # and also assures that output of this SyncBuffer is always time-ordered.
         # the other possibility would be to just drop the packet. don't know which is better.
         if self.last_sorted_time != None and timestamp < self.last_sorted_time:
+            if self.keep_late_packets:
+                self.late_packets.append( (timestamp, packet) )
+                return
             timestamp = self.last_sorted_time
+            self.num_timestamps_clamped += 1
 
         stream.append( (timestamp, packet) )
 
+    def get_stream_depth(self, stream_id):
+        """ Return number of packets of the stream waiting to be sorted. """
+        return len(self.streams.get(stream_id, ()))
+
 
 class WorldStreamer:
 
     MAX_PACKETS_PER_KEYFRAME_HINT = 500
 
-    def __init__(self, sync_window_seconds=5.):
+    def __init__(self, sync_window_seconds=5., keyframe_world=None, lateness_percentile=None, min_window_seconds=0.,
+                 clock_sync_threshold_seconds=None):
         """ sync_window_seconds - will only return entries that are older than this.
-        if None, then return entries as soon as they arrive; no sorting. """
-        self.sync_window_seconds = sync_window_seconds
+        if None, then return entries as soon as they arrive; no sorting.
+        keyframe_world - a World used for regenerating stale keyframes. if given, late packets are inserted at their
+        own time. see "late packets" at the top of this file.
+        lateness_percentile, min_window_seconds - adaptive sync window. see SyncBuffer.
+        clock_sync_threshold_seconds - clock correction. see SyncBuffer. """
+        self.keyframe_world = keyframe_world
         self.keyframeslots = [] # KeyframeSlot objects
         self.streams = {} # stream_id: packets_list
-
-        self.num_packets_sorted = 0 # statistics
-
-        self.syncbuffer = SyncBuffer(sync_window_seconds)
+        self.first_stale_slot = None # index to keyframeslots, or None if no keyframe is stale
+        self.late_packets = [] # inserted since the last get_late_packets()
+        # packet counts per time bucket. for drawing the packet rate of the whole recording
+        self.rate_pyramid = rate_pyramid.RatePyramid()
+
+        # statistics
+        self.num_late_packets = 0
+        self.num_keyframes_regenerated = 0
+        self.num_packets_sorted = 0
+        self.packet_bytes = 0 # estimated memory used by the sorted packets
+        self.keyframe_bytes = 0 # estimated memory used by the keyframes
+
+        self.syncbuffer = SyncBuffer(sync_window_seconds, keep_late_packets=keyframe_world != None,
+                                     lateness_percentile=lateness_percentile, min_window_seconds=min_window_seconds,
+                                     clock_sync_threshold_seconds=clock_sync_threshold_seconds)
 
         # timepoints of sorted data. timestamps are read from the packets.
         self.start_time = None
@@ -128,19 +321,105 @@ class WorldStreamer:
         """ Also returns a list of fresly sorted packets to be used on world creation """
         self.syncbuffer.tick()
         sorted_packets = self.syncbuffer.get_sorted_packets()
+        self.append_sorted_packets(sorted_packets)
+        for timestamp, packet in self.syncbuffer.get_late_packets():
+            self.insert_late_packet(timestamp, packet)
+        return sorted_packets
+
+    def get_late_packets(self):
+        """ Return [(timestamp, packet), ..] inserted by insert_late_packet() since the previous call. """
+        l = self.late_packets
+        self.late_packets = []
+        return l
 
+    def append_sorted_packets(self, sorted_packets):
+        """ Append packets [(timestamp, packet), ..] to the recording, bypassing the sync buffer. Packets have to be
+        time-sorted and not older than the last appended packet. Used by tick() and when loading recordings. """
         if sorted_packets:
             if not self.keyframeslots:
                 self.put_keyframe({}, sorted_packets[0][0])
 
             self.end_time = sorted_packets[-1][0]
             self.num_packets_sorted += len(sorted_packets)
+            # tuple + float + str object overhead is about 150 bytes on 64-bit python 2.7
+            self.packet_bytes += sum(len(p[1]) for p in sorted_packets) + 150 * len(sorted_packets)
 
             #for packet in sorted_packets:
             #    self.keyframeslots[-1].packets.append( packet )
             self.keyframeslots[-1].packets.extend( sorted_packets )
+            self.rate_pyramid.add_packets(sorted_packets)
 
-        return sorted_packets
+    def insert_late_packet(self, timestamp, packet):
+        """ Insert a packet older than the last sorted packet at its own time. Keyframes after it become stale. """
+        if self.start_time == None:
+            self.append_sorted_packets([(timestamp, packet)])
+            return
+        # the first keyframe is the empty world before everything
+        timestamp = max(timestamp, self.start_time)
+        keyframeslot, i = self._get_prev_keyframeslot(timestamp)
+
+        # after the packets with the same timestamp
+        packets = keyframeslot.packets
+        lo, hi = 0, len(packets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamp < packets[mid][0]:
+                hi = mid
+            else:
+                lo = mid + 1
+        packets.insert(lo, (timestamp, packet))
+        self.rate_pyramid.add_packets([(timestamp, packet)])
+
+        self.end_time = max(self.end_time, timestamp)
+        self.num_packets_sorted += 1
+        self.packet_bytes += len(packet) + 150
+        self.num_late_packets += 1
+        self.late_packets.append( (timestamp, packet) )
+
+        if i + 1 < len(self.keyframeslots) and (self.first_stale_slot == None or i + 1 < self.first_stale_slot):
+            self.first_stale_slot = i + 1
+
+    def regenerate_stale_keyframes(self, max_slots=None):
+        """ Regenerate up to max_slots stale keyframes, oldest first. None regenerates all. Return number of
+        keyframes regenerated. """
+        n = 0
+        while self.first_stale_slot != None and (max_slots == None or n < max_slots):
+            i = self.first_stale_slot
+            prev = self.keyframeslots[i - 1]
+            w = self.keyframe_world
+            w.deserialize_world(prev.get_keyframe())
+            for timestamp, packet in prev.packets:
+                packet_handler.handle_packet(packet, w, barebones=True)
+
+            kfs = self.keyframeslots[i]
+            kfs.keyframe = w.serialize_world()
+            kfs.keyframe_json = None
+            self.keyframe_bytes -= kfs.keyframe_bytes
+            kfs.keyframe_bytes = estimate_size(kfs.keyframe)
+            self.keyframe_bytes += kfs.keyframe_bytes
+
+            self.first_stale_slot = i + 1 if i + 1 < len(self.keyframeslots) else None
+            self.num_keyframes_regenerated += 1
+            n += 1
+        return n
+
+    def is_stale(self, timestamp):
+        """ Return True if get_seek_state(timestamp) would have to regenerate keyframes first. """
+        if self.first_stale_slot == None:
+            return False
+        keyframeslot, i = self._get_prev_keyframeslot(timestamp)
+        return i != None and i >= self.first_stale_slot
+
+    def get_num_stale_keyframes(self):
+        if self.first_stale_slot == None:
+            return 0
+        return len(self.keyframeslots) - self.first_stale_slot
+
+    def _get_keyframe(self, i):
+        """ Return keyframe of self.keyframeslots[i]. Regenerates it first if stale. """
+        if self.first_stale_slot != None and i >= self.first_stale_slot:
+            self.regenerate_stale_keyframes(i - self.first_stale_slot + 1)
+        return self.keyframeslots[i].get_keyframe()
 
     def need_keyframe(self):
         """ Add a new keyframe if this returns True. """
@@ -150,9 +429,11 @@ class WorldStreamer:
                 return True
         return False
 
-    def put_keyframe(self, keyframe, timestamp=None):
-        """ Sets the packet stream starting point and maybe also starts the recording process. Call periodically. """
-        assert keyframe != None
+    def put_keyframe(self, keyframe, timestamp=None, keyframe_json=None, stale=False):
+        """ Sets the packet stream starting point and maybe also starts the recording process. Call periodically.
+        keyframe_json : give this instead of keyframe to keep the keyframe serialized until it's needed.
+        stale : the keyframe misses some late packets. it's regenerated like the keyframes after a late packet. """
+        assert keyframe != None or keyframe_json != None
         if self.start_time == None:
             assert timestamp != None
             self.start_time = timestamp
@@ -168,7 +449,23 @@ class WorldStreamer:
 
         if self.keyframeslots: # ensure timestamp is newer than previous
             assert self.keyframeslots[-1].timestamp < timestamp
-        self.keyframeslots.append( KeyframeSlot(timestamp, keyframe) )
+        kfs = KeyframeSlot(timestamp, keyframe, keyframe_json=keyframe_json)
+        if keyframe == None:
+            kfs.keyframe_bytes = sys.getsizeof(keyframe_json)
+        else:
+            kfs.keyframe_bytes = estimate_size(keyframe)
+        self.keyframeslots.append(kfs)
+        self.keyframe_bytes += kfs.keyframe_bytes
+        if stale and self.first_stale_slot == None:
+            self.first_stale_slot = len(self.keyframeslots) - 1
+
+    def get_sync_window_seconds(self):
+        """ Current sync window. Changes if the window is adaptive. None if packets are not sorted. """
+        return self.syncbuffer.sync_window_seconds
+
+    def get_memory_estimate(self):
+        """ Return approximate bytes used by all recorded keyframes and packets. """
+        return self.packet_bytes + self.keyframe_bytes + self.rate_pyramid.get_memory_estimate()
 
     def put_packet(self, timestamp, packet, stream_id):
         self.syncbuffer.put_packet(timestamp, packet, stream_id)
@@ -204,7 +501,7 @@ class WorldStreamer:
 
     def get_current_time(self):
         """ Everything prior to this is set in stone in this SyncBuf. Changes only with self.seek and
-        self.get_delta_packets and is always at least self.sync_window_seconds in the past.
+        self.get_delta_packets and is always at least self.get_sync_window_seconds() in the past.
         Returns None if no keyframe received yet with put_keyframe().
         Use this, or self.wanted_time as the current simulation time. self.wanted_time is smooth, but
         new packets can appear before it, and never before self.current_time. """
@@ -219,7 +516,7 @@ class WorldStreamer:
         return (None, None) if timestamp is earlier than the first keyframe. """
         kfs, i = self._get_prev_keyframeslot(timestamp)
         if kfs:
-            return kfs.timestamp, kfs.keyframe
+            return kfs.timestamp, self._get_keyframe(i)
         else:
             return None, None
 
@@ -284,8 +581,4 @@ class WorldStreamer:
         if keyframeslot == None:
             return None, None
         else:
-            return keyframeslot.keyframe, [p for p in keyframeslot.packets if p[0] <= timestamp]
-
-    def load_file(self, filename):
-        """ load the whole file to ram """
-        pass
+            return self._get_keyframe(i), [p for p in keyframeslot.packets if p[0] <= timestamp]